@@ -14,6 +14,7 @@ import gi
 gi.require_version("Gst", "1.0")
 gi.require_version("Gtk", "3.0")
 gi.require_version("GstAudio", "1.0")
+gi.require_version("GstController", "1.0")
 gi.require_version("GstPbutils", "1.0")
 gi.require_version("TotemPlParser", "1.0")
 gi.require_version("Handy", "1")
@@ -22,14 +23,12 @@ Gst.init(None)
 GstPbutils.pb_utils_init()
 
 from threading import current_thread
-from pickle import dump
 from signal import signal, SIGINT, SIGTERM
 
 from lollypop.utils import init_proxy_from_gnome
 from lollypop.application_actions import ApplicationActions
 from lollypop.application_cmdline import ApplicationCmdline
 from lollypop.utils_file import install_youtube_dl
-from lollypop.define import LOLLYPOP_DATA_PATH, StorageType
 from lollypop.database import Database
 from lollypop.player import Player
 from lollypop.inhibitor import Inhibitor
@@ -41,15 +40,23 @@ from lollypop.ws_director import DirectorWebService
 from lollypop.sqlcursor import SqlCursor
 from lollypop.settings import Settings
 from lollypop.database_cache import CacheDatabase
+from lollypop.database_http_cache import HttpCacheDatabase
+from lollypop.database_scrobbles import ScrobblesDatabase
 from lollypop.database_albums import AlbumsDatabase
 from lollypop.database_artists import ArtistsDatabase
 from lollypop.database_genres import GenresDatabase
+from lollypop.database_listens import ListensDatabase
 from lollypop.database_tracks import TracksDatabase
 from lollypop.notification import NotificationManager
 from lollypop.playlists import Playlists
 from lollypop.helper_task import TaskHelper
+from lollypop.define import TaskPriority
 from lollypop.helper_art import ArtHelper
+from lollypop.helper_youtube_dl import YouTubeDlHelper
 from lollypop.collection_scanner import CollectionScanner
+from lollypop.collection_snapshot import CollectionSnapshot
+from lollypop.collection_replaygain import CollectionReplayGain
+from lollypop.collection_bpm import CollectionBpm
 
 
 class Application(Gtk.Application, ApplicationActions, ApplicationCmdline):
@@ -143,21 +150,32 @@ class Application(Gtk.Application, ApplicationActions, ApplicationCmdline):
                 screen, cssProvider, Gtk.STYLE_PROVIDER_PRIORITY_USER + 1)
         self.db = Database()
         self.cache = CacheDatabase()
+        self.http_cache = HttpCacheDatabase()
+        self.scrobbles = ScrobblesDatabase()
         self.playlists = Playlists()
         self.albums = AlbumsDatabase(self.db)
         self.artists = ArtistsDatabase(self.db)
         self.genres = GenresDatabase(self.db)
         self.tracks = TracksDatabase(self.db)
+        self.listens = ListensDatabase(self.db)
         self.player = Player()
         self.inhibitor = Inhibitor()
         self.scanner = CollectionScanner()
+        self.snapshot = CollectionSnapshot()
         self.notify = NotificationManager()
         self.task_helper = TaskHelper()
+        self.task_helper.run(self.snapshot.load,
+                             priority=TaskPriority.BACKGROUND)
+        self.replaygain = CollectionReplayGain()
+        self.replaygain.start()
+        self.bpm = CollectionBpm()
+        self.bpm.start()
         self.art_helper = ArtHelper()
         self.art = Artwork()
         self.art.update_art_size()
         self.album_art = AlbumArtwork()
         self.artist_art = ArtistArtwork()
+        self.youtube_dl = YouTubeDlHelper()
         self.ws_director = DirectorWebService()
         self.ws_director.start()
         if not self.settings.get_value("disable-mpris"):
@@ -180,7 +198,7 @@ class Application(Gtk.Application, ApplicationActions, ApplicationCmdline):
         if monitor.get_network_available() and\
                 not monitor.get_network_metered() and\
                 self.settings.get_value("recent-youtube-dl"):
-            self.task_helper.run(install_youtube_dl)
+            self.task_helper.run_thread(install_youtube_dl)
 
     def do_startup(self):
         """
@@ -316,29 +334,13 @@ class Application(Gtk.Application, ApplicationActions, ApplicationCmdline):
             Save player state
         """
         if self.settings.get_value("save-state"):
-            if self.player.current_track.id is None or\
-                    self.player.current_track.storage_type &\
-                    StorageType.EPHEMERAL:
-                track_id = None
-            else:
-                track_id = self.player.current_track.id
-                # Save albums context
-                try:
-                    with open(LOLLYPOP_DATA_PATH + "/Albums.bin", "wb") as f:
-                        dump(self.player.albums, f)
-                except Exception as e:
-                    Logger.error("Application::__save_state(): %s" % e)
-            dump(track_id, open(LOLLYPOP_DATA_PATH + "/track_id.bin", "wb"))
-            dump([self.player.is_playing, self.player.is_party],
-                 open(LOLLYPOP_DATA_PATH + "/player.bin", "wb"))
-            dump(self.player.queue,
-                 open(LOLLYPOP_DATA_PATH + "/queue.bin", "wb"))
-            if self.player.current_track.id is not None:
-                position = self.player.position
-            else:
-                position = 0
-            dump(position, open(LOLLYPOP_DATA_PATH + "/position.bin", "wb"))
+            self.player.save_state()
         self.player.stop_all()
+        self.replaygain.stop()
+        self.bpm.stop()
+        self.youtube_dl.stop()
+        self.listens.flush()
+        self.task_helper.dump_http_cache()
 
     def __vacuum(self):
         """
@@ -355,8 +357,10 @@ class Application(Gtk.Application, ApplicationActions, ApplicationCmdline):
             self.albums.clean(False)
             self.artists.clean(False)
             self.genres.clean(False)
+            self.listens.clean(False)
             SqlCursor.remove(self.db)
             self.cache.clean(True)
+            self.http_cache.clean()
 
             with SqlCursor(self.db) as sql:
                 sql.isolation_level = None
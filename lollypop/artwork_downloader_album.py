@@ -68,7 +68,7 @@ class AlbumArtworkDownloader(ArtworkDownloader):
             return
         self.__queue.append(album_id)
         if not self.__downloading:
-            App().task_helper.run(self.__download_queue)
+            App().task_helper.run_thread(self.__download_queue)
 
     def search(self, artist, album, cancellable):
         """
@@ -67,7 +67,7 @@ class ArtistArtworkDownloader(ArtworkDownloader):
             return
         self.__queue.append(artist)
         if not self.__downloading:
-            App().task_helper.run(self.__download_queue)
+            App().task_helper.run_thread(self.__download_queue)
 
     def search(self, artist, cancellable):
         """
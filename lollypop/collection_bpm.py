@@ -0,0 +1,349 @@
+# Copyright (c) 2014-2021 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from gi.repository import GObject, GLib, Gst
+
+import os
+from array import array
+from threading import get_native_id
+from multiprocessing import cpu_count
+
+from lollypop.define import App, TaskPriority, AnalysisFlags
+from lollypop.logger import Logger
+from lollypop.utils import emit_signal
+
+
+class CollectionBpm(GObject.GObject):
+    """
+        Detect bpm for local tracks without bpm tag
+        A bounded number of bpmdetect pipelines run in parallel with their
+        streaming threads at idle priority. Results are written by batch,
+        tracks without bpm in DB are analyzed again on next start, tracks
+        failing analysis are marked in DB. Analysis is paused while
+        collection is scanned
+    """
+    __gsignals__ = {
+        "progress-changed": (GObject.SignalFlags.RUN_FIRST, None, (float,)),
+    }
+
+    __PIPELINE = "uridecodebin name=decoder ! audioconvert ! audioresample !\
+                  bpmdetect ! fakesink sync=false"
+    # Results are written to DB by batch
+    BATCH_SIZE = 50
+
+    def __init__(self):
+        """
+            Init analyzer
+        """
+        GObject.GObject.__init__(self)
+        self.__max_jobs = max(1, min(4, cpu_count() // 2))
+        self.__track_ids = array("l")
+        # Tracks failing analysis, marked in DB with next results
+        self.__failed = set()
+        self.__failures = []
+        self.__scan_timeout_id = None
+        # Running pipelines: {pipeline: [track id, bpm]}
+        self.__jobs = {}
+        self.__results = []
+        self.__paused = False
+        self.__done = 0
+        self.__total = 0
+        # bpmdetect comes from gst-plugins-bad, checked on first start
+        self.__available = None
+        App().scanner.connect("scan-started", self.__on_scan_started)
+        App().scanner.connect("scan-finished", self.__on_scan_finished)
+        App().settings.connect("changed::bpm-analysis",
+                               self.__on_settings_changed)
+
+    def start(self):
+        """
+            Analyze tracks without bpm
+        """
+        if not App().settings.get_value("bpm-analysis"):
+            return
+        if self.__available is None:
+            self.__available = Gst.ElementFactory.find(
+                "bpmdetect") is not None
+            if not self.__available:
+                Logger.warning("CollectionBpm: bpmdetect not available, "
+                               "bpm analysis disabled")
+        if not self.__available:
+            return
+        App().task_helper.run(App().tracks.get_ids_without_bpm,
+                              callback=(self.__on_track_ids,),
+                              priority=TaskPriority.BACKGROUND)
+
+    def pause(self):
+        """
+            Pause analysis
+        """
+        self.__paused = True
+        for pipeline in self.__jobs.keys():
+            pipeline.set_state(Gst.State.PAUSED)
+        self.__save_results()
+
+    def resume(self):
+        """
+            Resume analysis
+        """
+        self.__paused = False
+        for pipeline in self.__jobs.keys():
+            pipeline.set_state(Gst.State.PLAYING)
+        self.__run_jobs()
+
+    def stop(self):
+        """
+            Stop analysis and save pending results
+        """
+        for pipeline in list(self.__jobs.keys()):
+            self.__remove_job(pipeline)
+        self.__track_ids = array("l")
+        self.__done = 0
+        self.__total = 0
+        # Called on quit, do not delay results to another thread
+        try:
+            if self.__results:
+                App().tracks.set_bpms(self.__results)
+                self.__results = []
+            if self.__failures:
+                App().tracks.set_analysis_failed(self.__failures,
+                                                 AnalysisFlags.BPM)
+                self.__failures = []
+        except Exception as e:
+            Logger.error("CollectionBpm::stop(): %s", e)
+
+    @property
+    def paused(self):
+        """
+            True if analysis is paused
+            @return bool
+        """
+        return self.__paused
+
+    @property
+    def progress(self):
+        """
+            Get analysis progress
+            @return float
+        """
+        if self.__total == 0:
+            return 1.0
+        return self.__done / self.__total
+
+#######################
+# PRIVATE             #
+#######################
+    def __run_jobs(self):
+        """
+            Start pipelines until max jobs reached
+        """
+        while not self.__paused and self.__track_ids and\
+                len(self.__jobs) < self.__max_jobs:
+            track_id = self.__track_ids.pop()
+            self.__add_job(track_id, App().tracks.get_uri(track_id))
+        if not self.__jobs:
+            self.__save_results()
+
+    def __add_job(self, track_id, uri):
+        """
+            Analyze track in a new pipeline
+            @param track_id as int
+            @param uri as str
+        """
+        try:
+            pipeline = Gst.parse_launch(self.__PIPELINE)
+            pipeline.get_by_name("decoder").set_property("uri", uri)
+            bus = pipeline.get_bus()
+            bus.add_signal_watch()
+            bus.enable_sync_message_emission()
+            bus.connect("sync-message::stream-status",
+                        self.__on_bus_stream_status)
+            bus.connect("message::tag", self.__on_bus_tag, pipeline)
+            bus.connect("message::eos", self.__on_bus_eos, pipeline)
+            bus.connect("message::error", self.__on_bus_error, pipeline)
+            self.__jobs[pipeline] = [track_id, None]
+            pipeline.set_state(Gst.State.PLAYING)
+        except Exception as e:
+            Logger.error("CollectionBpm::__add_job(): %s", e)
+            self.__add_failure(track_id)
+            self.__update_progress()
+
+    def __remove_job(self, pipeline):
+        """
+            Stop pipeline and forget job
+            @param pipeline as Gst.Pipeline
+        """
+        pipeline.set_state(Gst.State.NULL)
+        bus = pipeline.get_bus()
+        bus.disable_sync_message_emission()
+        bus.remove_signal_watch()
+        del self.__jobs[pipeline]
+
+    def __save_results(self):
+        """
+            Write pending results to DB
+        """
+        if self.__results:
+            App().task_helper.run(App().tracks.set_bpms, self.__results,
+                                  priority=TaskPriority.BACKGROUND)
+            self.__results = []
+        if self.__failures:
+            App().task_helper.run(App().tracks.set_analysis_failed,
+                                  self.__failures, AnalysisFlags.BPM,
+                                  priority=TaskPriority.BACKGROUND)
+            self.__failures = []
+
+    def __add_failure(self, track_id):
+        """
+            Do not analyze track again
+            @param track_id as int
+        """
+        self.__failed.add(track_id)
+        self.__failures.append(track_id)
+
+    def __update_progress(self):
+        """
+            Count a track as done and notify progress
+        """
+        self.__done += 1
+        emit_signal(self, "progress-changed", self.progress)
+        if self.__done == self.__total:
+            Logger.info("Bpm analysis finished")
+
+    def __on_track_ids(self, track_ids):
+        """
+            Queue tracks for analysis
+            @param track_ids as [int]
+        """
+        running = [job[0] for job in self.__jobs.values()]
+        queued = set(self.__track_ids)
+        track_ids = [track_id for track_id in track_ids
+                     if track_id not in self.__failed and
+                     track_id not in queued and
+                     track_id not in running]
+        if not track_ids:
+            return
+        if not self.__jobs and not self.__track_ids:
+            self.__done = 0
+            self.__total = 0
+        # Tracks are popped from the end, keep DB order
+        track_ids.reverse()
+        self.__track_ids = array("l", track_ids) + self.__track_ids
+        self.__total += len(track_ids)
+        Logger.info("Bpm analysis: %s tracks", len(track_ids))
+        self.__run_jobs()
+
+    def __on_bus_stream_status(self, bus, message):
+        """
+            Run streaming threads at idle priority
+            Called from streaming thread
+            @param bus as Gst.Bus
+            @param message as Gst.Message
+        """
+        try:
+            (status_type, owner) = message.parse_stream_status()
+            if status_type == Gst.StreamStatusType.ENTER:
+                os.setpriority(os.PRIO_PROCESS, get_native_id(), 19)
+        except Exception as e:
+            Logger.warning("CollectionBpm::__on_bus_stream_status(): %s", e)
+
+    def __on_bus_tag(self, bus, message, pipeline):
+        """
+            Keep last detected bpm
+            @param bus as Gst.Bus
+            @param message as Gst.Message
+            @param pipeline as Gst.Pipeline
+        """
+        job = self.__jobs.get(pipeline, None)
+        if job is None:
+            return
+        (exists, bpm) = message.parse_tag().get_double(
+            Gst.TAG_BEATS_PER_MINUTE)
+        if exists and bpm > 0:
+            job[1] = bpm
+
+    def __on_bus_eos(self, bus, message, pipeline):
+        """
+            Save bpm and run next jobs
+            @param bus as Gst.Bus
+            @param message as Gst.Message
+            @param pipeline as Gst.Pipeline
+        """
+        job = self.__jobs.get(pipeline, None)
+        if job is None:
+            return
+        (track_id, bpm) = job
+        self.__remove_job(pipeline)
+        if bpm is None:
+            self.__add_failure(track_id)
+        else:
+            self.__results.append((round(bpm, 1), track_id))
+            if len(self.__results) >= self.BATCH_SIZE:
+                self.__save_results()
+        self.__update_progress()
+        self.__run_jobs()
+
+    def __on_bus_error(self, bus, message, pipeline):
+        """
+            Skip track on error
+            @param bus as Gst.Bus
+            @param message as Gst.Message
+            @param pipeline as Gst.Pipeline
+        """
+        job = self.__jobs.get(pipeline, None)
+        if job is None:
+            return
+        Logger.warning("CollectionBpm::__on_bus_error(): %s",
+                       message.parse_error()[0].message)
+        self.__add_failure(job[0])
+        self.__remove_job(pipeline)
+        self.__update_progress()
+        self.__run_jobs()
+
+    def __on_scan_started(self, scanner):
+        """
+            Pause analysis until scan is finished
+            @param scanner as CollectionScanner
+        """
+        if self.__scan_timeout_id is None:
+            self.pause()
+            self.__scan_timeout_id = GLib.timeout_add_seconds(
+                1, self.__on_scan_timeout)
+
+    def __on_scan_timeout(self):
+        """
+            Resume analysis if scan is finished
+        """
+        if App().scanner.is_locked():
+            return True
+        self.__scan_timeout_id = None
+        self.resume()
+        return False
+
+    def __on_scan_finished(self, scanner, modifications):
+        """
+            Analyze new tracks
+            @param scanner as CollectionScanner
+            @param modifications as bool
+        """
+        self.start()
+
+    def __on_settings_changed(self, settings, value):
+        """
+            Start or stop analysis
+            @param settings as Gio.Settings
+            @param value as GLib.Variant
+        """
+        if App().settings.get_value("bpm-analysis"):
+            self.start()
+        else:
+            self.stop()
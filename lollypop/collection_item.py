@@ -14,7 +14,20 @@
 class CollectionItem:
     """
         A collection item with an track id and associated album/genres/artists
+        Slotted as scanner creates one item per scanned file
     """
+    __slots__ = ("track_id", "album_id", "new_album", "genres", "genre_ids",
+                 "new_genre_ids", "artist_ids", "new_artist_ids",
+                 "album_artist_ids", "new_album_artist_ids", "album_name",
+                 "track_name", "album_artists", "artists", "aa_sortnames",
+                 "a_sortnames", "year", "timestamp", "original_year",
+                 "original_timestamp", "mb_album_artist_id", "mb_album_id",
+                 "mb_artist_id", "mb_track_id", "lp_album_id", "lp_track_id",
+                 "uri", "album_loved", "album_pop", "album_rate",
+                 "album_synced", "album_mtime", "duration", "tracknumber",
+                 "discnumber", "discname", "track_mtime", "track_pop",
+                 "track_rate", "track_loved", "track_ltime", "bpm",
+                 "compilation", "storage_type")
 
     def __init__(self, track_id=None, album_id=None, new_album=False,
                  genres=None, genre_ids=[], new_genre_ids=[], artist_ids=[],
@@ -25,7 +38,7 @@ class CollectionItem:
                  original_year=None, original_timestamp=None,
                  mb_album_artist_id="",
                  mb_album_id=None, mb_artist_id="", mb_track_id=None,
-                 lp_album_id=None, uri="", album_loved=False,
+                 lp_album_id=None, lp_track_id=None, uri="", album_loved=False,
                  album_pop=0, album_rate=0, album_synced=0,
                  album_mtime=0, duration=0, tracknumber=0,
                  discnumber=1, discname="", track_mtime=0, track_pop=0,
@@ -59,6 +72,7 @@ class CollectionItem:
             @param mb_artist_id as str
             @param mb_track_id as str
             @param lp_album_id as str
+            @param lp_track_id as str
             @param uri as str
             @param album_loved as bool
             @param album_pop as int
@@ -103,6 +117,7 @@ class CollectionItem:
         self.mb_artist_id = mb_artist_id
         self.mb_track_id = mb_track_id
         self.lp_album_id = lp_album_id
+        self.lp_track_id = lp_track_id
         self.uri = uri
         self.album_loved = album_loved
         self.album_pop = album_pop
@@ -0,0 +1,385 @@
+# Copyright (c) 2014-2021 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from gi.repository import GObject, GLib, Gst
+
+import os
+from threading import get_native_id
+from multiprocessing import cpu_count
+
+from lollypop.define import App, ReplayGain, TaskPriority, AnalysisFlags
+from lollypop.logger import Logger
+from lollypop.utils import emit_signal
+
+
+class CollectionReplayGain(GObject.GObject):
+    """
+        Compute ReplayGain for local tracks not analyzed yet
+        Each album is analyzed in its own rganalysis pipeline so album gain
+        is available: rganalysis state is locked while decoder changes
+        track so its album accumulator is kept. A bounded number of
+        pipelines run in parallel with their streaming threads at idle
+        priority
+        Tracks with ReplayGain tags are not decoded twice, tags are stored
+        Tracks failing analysis are marked in DB, analysis is paused while
+        collection is scanned
+    """
+    __gsignals__ = {
+        "progress-changed": (GObject.SignalFlags.RUN_FIRST, None, (float,)),
+    }
+
+    __PIPELINE = "uridecodebin name=decoder ! audioconvert ! audioresample !\
+                  rganalysis name=analysis forced=false !\
+                  fakesink sync=false"
+
+    def __init__(self):
+        """
+            Init analyzer
+        """
+        GObject.GObject.__init__(self)
+        self.__max_jobs = max(1, min(4, cpu_count() // 2))
+        self.__album_ids = []
+        # Albums failing analysis, failing tracks are marked in DB
+        self.__failed = set()
+        self.__scan_timeout_id = None
+        # Running pipelines: {pipeline: job as dict}
+        self.__jobs = {}
+        self.__paused = False
+        self.__done = 0
+        self.__total = 0
+        App().scanner.connect("scan-started", self.__on_scan_started)
+        App().scanner.connect("scan-finished", self.__on_scan_finished)
+        App().settings.connect("changed::replay-gain-analysis",
+                               self.__on_settings_changed)
+        App().settings.connect("changed::replay-gain",
+                               self.__on_settings_changed)
+
+    def start(self):
+        """
+            Analyze albums not analyzed yet
+        """
+        if not self.enabled:
+            return
+        App().task_helper.run(App().tracks.get_album_ids_without_replay_gain,
+                              callback=(self.__on_album_ids,),
+                              priority=TaskPriority.BACKGROUND)
+
+    def pause(self):
+        """
+            Pause analysis
+        """
+        self.__paused = True
+        for pipeline in self.__jobs.keys():
+            pipeline.set_state(Gst.State.PAUSED)
+
+    def resume(self):
+        """
+            Resume analysis
+        """
+        self.__paused = False
+        for pipeline in self.__jobs.keys():
+            pipeline.set_state(Gst.State.PLAYING)
+        self.__run_jobs()
+
+    def stop(self):
+        """
+            Stop analysis, albums not finished are analyzed on next start
+        """
+        for pipeline in list(self.__jobs.keys()):
+            self.__remove_job(pipeline)
+        self.__album_ids = []
+        self.__done = 0
+        self.__total = 0
+
+    @property
+    def enabled(self):
+        """
+            True if analysis is enabled
+            @return bool
+        """
+        return App().settings.get_value("replay-gain-analysis") and\
+            App().settings.get_enum("replay-gain") != ReplayGain.NONE
+
+    @property
+    def paused(self):
+        """
+            True if analysis is paused
+            @return bool
+        """
+        return self.__paused
+
+    @property
+    def progress(self):
+        """
+            Get analysis progress
+            @return float
+        """
+        if self.__total == 0:
+            return 1.0
+        return self.__done / self.__total
+
+#######################
+# PRIVATE             #
+#######################
+    def __run_jobs(self):
+        """
+            Start pipelines until max jobs reached
+        """
+        while not self.__paused and self.__album_ids and\
+                len(self.__jobs) < self.__max_jobs:
+            album_id = self.__album_ids.pop(0)
+            tracks = App().tracks.get_replay_gain_uris(album_id)
+            if tracks:
+                self.__add_job(album_id, tracks)
+            else:
+                self.__update_progress()
+
+    def __add_job(self, album_id, tracks):
+        """
+            Analyze album tracks in a new pipeline
+            @param album_id as int
+            @param tracks as [(int, str)]
+        """
+        try:
+            pipeline = Gst.parse_launch(self.__PIPELINE)
+            pipeline.get_by_name("analysis").set_property("num-tracks",
+                                                          len(tracks))
+            job = {"album_id": album_id,
+                   "tracks": tracks,
+                   "index": 0,
+                   "gains": {},
+                   "album_gain": (None, None)}
+            bus = pipeline.get_bus()
+            bus.add_signal_watch()
+            bus.enable_sync_message_emission()
+            bus.connect("sync-message::stream-status",
+                        self.__on_bus_stream_status)
+            bus.connect("message::tag", self.__on_bus_tag, pipeline)
+            bus.connect("message::eos", self.__on_bus_eos, pipeline)
+            bus.connect("message::error", self.__on_bus_error, pipeline)
+            self.__jobs[pipeline] = job
+            self.__play_track(pipeline, job)
+        except Exception as e:
+            Logger.error("CollectionReplayGain::__add_job(): %s", e)
+            self.__add_failure(album_id,
+                               [track_id for (track_id, uri) in tracks])
+            self.__update_progress()
+
+    def __remove_job(self, pipeline):
+        """
+            Stop pipeline and forget job
+            @param pipeline as Gst.Pipeline
+        """
+        pipeline.get_by_name("analysis").set_locked_state(False)
+        pipeline.set_state(Gst.State.NULL)
+        bus = pipeline.get_bus()
+        bus.disable_sync_message_emission()
+        bus.remove_signal_watch()
+        del self.__jobs[pipeline]
+
+    def __play_track(self, pipeline, job):
+        """
+            Play current job track in pipeline
+            @param pipeline as Gst.Pipeline
+            @param job as dict
+        """
+        (track_id, uri) = job["tracks"][job["index"]]
+        # Going to READY resets rganalysis, keep it in PLAYING
+        # New stream from decoder clears EOS received for previous track
+        if job["index"] > 0:
+            pipeline.get_by_name("analysis").set_locked_state(True)
+        pipeline.set_state(Gst.State.READY)
+        pipeline.get_by_name("decoder").set_property("uri", uri)
+        if self.__paused:
+            pipeline.set_state(Gst.State.PAUSED)
+        else:
+            pipeline.set_state(Gst.State.PLAYING)
+
+    def __finish_job(self, pipeline, job):
+        """
+            Save job results and run next jobs
+            @param pipeline as Gst.Pipeline
+            @param job as dict
+        """
+        self.__remove_job(pipeline)
+        (album_gain, album_peak) = job["album_gain"]
+        values = []
+        failures = []
+        for (track_id, uri) in job["tracks"]:
+            (track_gain, track_peak) = job["gains"].get(track_id,
+                                                        (None, None))
+            if track_gain is None:
+                failures.append(track_id)
+                continue
+            values.append((track_gain, track_peak,
+                           album_gain, album_peak, track_id))
+        if failures:
+            self.__add_failure(job["album_id"], failures)
+        if values:
+            App().task_helper.run(App().tracks.set_replay_gains, values,
+                                  priority=TaskPriority.BACKGROUND)
+        self.__update_progress()
+        self.__run_jobs()
+
+    def __add_failure(self, album_id, track_ids):
+        """
+            Do not analyze album again in this session and tracks again
+            until modified
+            @param album_id as int
+            @param track_ids as [int]
+        """
+        self.__failed.add(album_id)
+        App().task_helper.run(App().tracks.set_analysis_failed, track_ids,
+                              AnalysisFlags.REPLAY_GAIN,
+                              priority=TaskPriority.BACKGROUND)
+
+    def __update_progress(self):
+        """
+            Count an album as done and notify progress
+        """
+        self.__done += 1
+        emit_signal(self, "progress-changed", self.progress)
+        if self.__done == self.__total:
+            Logger.info("ReplayGain analysis finished")
+
+    def __on_album_ids(self, album_ids):
+        """
+            Queue albums for analysis
+            @param album_ids as [int]
+        """
+        running = [job["album_id"] for job in self.__jobs.values()]
+        queued = set(self.__album_ids)
+        album_ids = [album_id for album_id in album_ids
+                     if album_id not in self.__failed and
+                     album_id not in queued and
+                     album_id not in running]
+        if not album_ids:
+            return
+        if not self.__jobs and not self.__album_ids:
+            self.__done = 0
+            self.__total = 0
+        self.__album_ids += album_ids
+        self.__total += len(album_ids)
+        Logger.info("ReplayGain analysis: %s albums", len(album_ids))
+        self.__run_jobs()
+
+    def __on_bus_stream_status(self, bus, message):
+        """
+            Run streaming threads at idle priority
+            Called from streaming thread
+            @param bus as Gst.Bus
+            @param message as Gst.Message
+        """
+        try:
+            (status_type, owner) = message.parse_stream_status()
+            if status_type == Gst.StreamStatusType.ENTER:
+                os.setpriority(os.PRIO_PROCESS, get_native_id(), 19)
+        except Exception as e:
+            Logger.warning("CollectionReplayGain::"
+                           "__on_bus_stream_status(): %s", e)
+
+    def __on_bus_tag(self, bus, message, pipeline):
+        """
+            Store ReplayGain tags for current track
+            @param bus as Gst.Bus
+            @param message as Gst.Message
+            @param pipeline as Gst.Pipeline
+        """
+        job = self.__jobs.get(pipeline, None)
+        if job is None:
+            return
+        tags = message.parse_tag()
+        (track_id, uri) = job["tracks"][job["index"]]
+        (exists, track_gain) = tags.get_double(Gst.TAG_TRACK_GAIN)
+        if exists:
+            (exists, track_peak) = tags.get_double(Gst.TAG_TRACK_PEAK)
+            job["gains"][track_id] = (track_gain,
+                                      track_peak if exists else None)
+        (exists, album_gain) = tags.get_double(Gst.TAG_ALBUM_GAIN)
+        if exists:
+            (exists, album_peak) = tags.get_double(Gst.TAG_ALBUM_PEAK)
+            job["album_gain"] = (album_gain,
+                                 album_peak if exists else None)
+
+    def __on_bus_eos(self, bus, message, pipeline):
+        """
+            Analyze next track or finish job
+            @param bus as Gst.Bus
+            @param message as Gst.Message
+            @param pipeline as Gst.Pipeline
+        """
+        job = self.__jobs.get(pipeline, None)
+        if job is None:
+            return
+        job["index"] += 1
+        if job["index"] < len(job["tracks"]):
+            self.__play_track(pipeline, job)
+        else:
+            self.__finish_job(pipeline, job)
+
+    def __on_bus_error(self, bus, message, pipeline):
+        """
+            Skip album on error
+            @param bus as Gst.Bus
+            @param message as Gst.Message
+            @param pipeline as Gst.Pipeline
+        """
+        job = self.__jobs.get(pipeline, None)
+        if job is None:
+            return
+        Logger.warning("CollectionReplayGain::__on_bus_error(): %s, %s",
+                       job["tracks"][job["index"]][1],
+                       message.parse_error()[0].message)
+        self.__add_failure(job["album_id"],
+                           [job["tracks"][job["index"]][0]])
+        self.__remove_job(pipeline)
+        self.__update_progress()
+        self.__run_jobs()
+
+    def __on_scan_started(self, scanner):
+        """
+            Pause analysis until scan is finished
+            @param scanner as CollectionScanner
+        """
+        if self.__scan_timeout_id is None:
+            self.pause()
+            self.__scan_timeout_id = GLib.timeout_add_seconds(
+                1, self.__on_scan_timeout)
+
+    def __on_scan_timeout(self):
+        """
+            Resume analysis if scan is finished
+        """
+        if App().scanner.is_locked():
+            return True
+        self.__scan_timeout_id = None
+        self.resume()
+        return False
+
+    def __on_scan_finished(self, scanner, modifications):
+        """
+            Analyze new tracks
+            @param scanner as CollectionScanner
+            @param modifications as bool
+        """
+        self.start()
+
+    def __on_settings_changed(self, settings, value):
+        """
+            Start or stop analysis
+            @param settings as Gio.Settings
+            @param value as GLib.Variant
+        """
+        if self.enabled:
+            self.start()
+        else:
+            self.stop()
@@ -55,6 +55,7 @@ class CollectionScanner(GObject.GObject, TagReader):
         Scan user music collection
     """
     __gsignals__ = {
+        "scan-started": (GObject.SignalFlags.RUN_FIRST, None, ()),
         "scan-finished": (GObject.SignalFlags.RUN_FIRST, None, (bool,)),
         "updated": (GObject.SignalFlags.RUN_FIRST, None,
                     (GObject.TYPE_PYOBJECT, int))
@@ -66,8 +67,12 @@ class CollectionScanner(GObject.GObject, TagReader):
         """
         GObject.GObject.__init__(self)
         self.__thread = None
+        # Tags waiting for DB write
         self.__tags = {}
-        self.__items = []
+        # Only track ids are kept once tracks are in DB
+        self.__track_ids = []
+        # Removed tracks, smart playlists are updated once for all
+        self.__deleted_track_ids = []
         self.__notified_ids = []
         self.__pending_new_artist_ids = []
         self.__history = History()
@@ -110,8 +115,10 @@ class CollectionScanner(GObject.GObject, TagReader):
                 App().window.container.progress.add(self)
                 App().window.container.progress.set_fraction(0, self)
             Logger.info("Scan started")
+            emit_signal(self, "scan-started")
             # Launch scan in a separate thread
-            self.__thread = App().task_helper.run(self.__scan, scan_type, uris)
+            self.__thread = App().task_helper.run_thread(self.__scan,
+                                                         scan_type, uris)
 
     def save_album(self, item):
         """
@@ -287,6 +294,7 @@ class CollectionScanner(GObject.GObject, TagReader):
                                    album_loved, album_pop, album_rate,
                                    album_synced)
             App().tracks.remove(track_id)
+            self.__deleted_track_ids.append(track_id)
             genre_ids = App().tracks.get_genre_ids(track_id)
             App().albums.clean()
             App().genres.clean()
@@ -340,7 +348,7 @@ class CollectionScanner(GObject.GObject, TagReader):
         notification.show()
         App().window.container.add_overlay(notification)
         notification.set_reveal_child(True)
-        App().task_helper.run(self.__reset_database)
+        App().task_helper.run_thread(self.__reset_database)
 
     @property
     def inotify(self):
@@ -380,10 +388,20 @@ class CollectionScanner(GObject.GObject, TagReader):
         App().cache.clear_table("duration")
         SqlCursor.commit(App().db)
         SqlCursor.remove(App().db)
+        self.__deleted_track_ids = []
+        App().playlists.update_smart()
+        self.__trim_history()
         SqlCursor.commit(self.__history)
         SqlCursor.remove(self.__history)
         GLib.idle_add(update_ui)
 
+    def __trim_history(self):
+        """
+            Keep history under configured size
+        """
+        size = App().settings.get_value("history-size").get_int32()
+        self.__history.trim(size)
+
     def __update_progress(self, current, total, allowed_diff):
         """
             Update progress bar status
@@ -398,12 +416,12 @@ class CollectionScanner(GObject.GObject, TagReader):
             GLib.idle_add(App().window.container.progress.set_fraction,
                           new_fraction, self)
 
-    def __finish(self, items):
+    def __finish(self, track_ids):
         """
             Notify from main thread when scan finished
-            @param items as [CollectionItem]
+            @param track_ids as [int]
         """
-        track_ids = [item.track_id for item in items]
+        App().playlists.update_smart(track_ids)
         self.__thread = None
         Logger.info("Scan finished")
         App().lookup_action("update_db").set_enabled(True)
@@ -500,7 +518,7 @@ class CollectionScanner(GObject.GObject, TagReader):
             @thread safe
         """
         try:
-            self.__items = []
+            self.__track_ids = []
             App().art.clean_rounded()
             (files, dirs, streams) = self.__get_objects_for_uris(
                 scan_type, uris)
@@ -530,39 +548,46 @@ class CollectionScanner(GObject.GObject, TagReader):
             self.__pending_new_artist_ids = []
             threads = []
             for files in split_files:
-                thread = App().task_helper.run(self.__scan_files,
-                                               files, db_mtimes,
-                                               scan_type)
+                thread = App().task_helper.run_thread(self.__scan_files,
+                                                      files, db_mtimes,
+                                                      scan_type)
                 threads.append(thread)
-            while threads:
-                sleep(0.1)
-                thread = threads[0]
-                if not thread.is_alive():
-                    threads.remove(thread)
 
             SqlCursor.add(App().db)
             if scan_type == ScanType.EXTERNAL:
                 storage_type = StorageType.EXTERNAL
             else:
                 storage_type = StorageType.COLLECTION
-            self.__items += self.__save_in_db(storage_type)
+            # Save tracks while scanning so tags do not pile up in memory
+            while threads:
+                sleep(0.1)
+                thread = threads[0]
+                if not thread.is_alive():
+                    threads.remove(thread)
+                self.__track_ids += self.__save_in_db(storage_type)
+                # Release DB lock for scanning threads
+                SqlCursor.commit(App().db)
             # Add streams to DB, only happening on command line/m3u files
-            self.__items += self.__save_streams_in_db(streams, storage_type)
+            self.__track_ids += self.__save_streams_in_db(streams,
+                                                          storage_type)
 
             self.__remove_old_tracks(db_uris, scan_type)
+            self.__trim_history()
 
             if scan_type == ScanType.EXTERNAL:
                 albums = tracks_to_albums(
-                    [Track(item.track_id) for item in self.__items])
+                    [Track(track_id) for track_id in self.__track_ids])
                 App().player.play_albums(albums)
             else:
                 self.__add_monitor(dirs)
-                GLib.idle_add(self.__finish, self.__items)
+                GLib.idle_add(self.__finish, self.__track_ids)
             self.__tags = {}
-            self.__items = []
+            self.__track_ids = []
             self.__pending_new_artist_ids = []
         except Exception as e:
             Logger.warning("CollectionScanner::__scan(): %s", e)
+        App().playlists.update_smart(self.__deleted_track_ids)
+        self.__deleted_track_ids = []
         SqlCursor.remove(App().db)
 
     def __scan_to_handle(self, uri):
@@ -603,6 +628,11 @@ class CollectionScanner(GObject.GObject, TagReader):
         """
         discoverer = Discoverer()
         try:
+            # Get history for new files in one pass
+            names = [Gio.File.new_for_uri(uri).get_basename()
+                     for (mtime, uri) in files
+                     if mtime > db_mtimes.get(uri, 0)]
+            history = self.__history.get_many(names)
             # Scan new files
             for (mtime, uri) in files:
                 # Handle a stop request
@@ -618,7 +648,8 @@ class CollectionScanner(GObject.GObject, TagReader):
                         if db_mtimes:
                             mtime = int(time())
                         self.__tags[uri] = self.__get_tags(discoverer,
-                                                           uri, mtime)
+                                                           uri, mtime,
+                                                           history)
                         self.__progress_count += 1
                         self.__update_progress(self.__progress_count,
                                                self.__progress_total,
@@ -627,8 +658,7 @@ class CollectionScanner(GObject.GObject, TagReader):
                         # We want to play files, so put them in items
                         if scan_type == ScanType.EXTERNAL:
                             track_id = App().tracks.get_id_by_uri(uri)
-                            item = CollectionItem(track_id=track_id)
-                            self.__items.append(item)
+                            self.__track_ids.append(track_id)
                         self.__progress_count += 2
                         self.__update_progress(self.__progress_count,
                                                self.__progress_total,
@@ -640,11 +670,11 @@ class CollectionScanner(GObject.GObject, TagReader):
 
     def __save_in_db(self, storage_type):
         """
-            Save current tags into DB
+            Save current tags into DB and drop them
             @param storage_type as StorageType
-            @return [CollectionItem]
+            @return [int]
         """
-        items = []
+        track_ids = []
         for uri in list(self.__tags.keys()):
             # Handle a stop request
             if self.__thread is None:
@@ -652,7 +682,7 @@ class CollectionScanner(GObject.GObject, TagReader):
             Logger.debug("Adding file: %s" % uri)
             tags = self.__tags[uri]
             item = self.__add2db(uri, *tags, storage_type)
-            items.append(item)
+            track_ids.append(item.track_id)
             self.__progress_count += 1
             self.__update_progress(self.__progress_count,
                                    self.__progress_total,
@@ -664,16 +694,16 @@ class CollectionScanner(GObject.GObject, TagReader):
         # Handle a stop request
         if self.__thread is None:
             raise Exception("cancelled")
-        return items
+        return track_ids
 
     def __save_streams_in_db(self, streams, storage_type):
         """
             Save http stream to DB
             @param streams as [str]
             @param storage_type as StorageType
-            @return [CollectionItem]
+            @return [int]
         """
-        items = []
+        track_ids = []
         for uri in streams:
             parsed = urlparse(uri)
             item = self.__add2db(uri, parsed.path, parsed.netloc,
@@ -681,9 +711,9 @@ class CollectionScanner(GObject.GObject, TagReader):
                                  parsed.netloc, "", False, 0, False, 0, 0, 0,
                                  None, 0, "", "", "", "", 1, 0, 0, 0, 0, 0,
                                  False, 0, False, storage_type)
-            items.append(item)
+            track_ids.append(item.track_id)
             self.__progress_count += 1
-        return items
+        return track_ids
 
     def __notify_ui(self, item):
         """
@@ -728,12 +758,13 @@ class CollectionScanner(GObject.GObject, TagReader):
                     Logger.warning("Removed, file has been deleted: %s", uri)
                     self.del_from_db(uri, True)
 
-    def __get_tags(self, discoverer, uri, track_mtime):
+    def __get_tags(self, discoverer, uri, track_mtime, history):
         """
             Read track tags
             @param discoverer as Discoverer
             @param uri as string
             @param track_mtime as int
+            @param history as {}, see History.get_many()
             @return ()
         """
         f = Gio.File.new_for_uri(uri)
@@ -748,10 +779,11 @@ class CollectionScanner(GObject.GObject, TagReader):
             track_id = App().tracks.get_id_by_basename_duration(name,
                                                                 duration)
         if track_id is None:
+            # History has been fetched for all names, no entry on miss
+            stats = history.get((name, duration // 1000), (0,) * 9)
             (track_pop, track_rate, track_ltime,
              album_mtime, track_loved, album_loved,
-             album_pop, album_rate, album_synced) = self.__history.get(
-                name, duration)
+             album_pop, album_rate, album_synced) = stats
         # Delete track and restore from it
         else:
             (track_pop, track_rate, track_ltime,
@@ -0,0 +1,540 @@
+# Copyright (c) 2014-2021 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from gi.repository import GLib
+
+import itertools
+from array import array
+from bisect import bisect_left, bisect_right
+from functools import cmp_to_key
+from threading import Lock
+
+from lollypop.sqlcursor import SqlCursor
+from lollypop.define import App, Type, OrderBy, LovedFlags, TaskPriority
+from lollypop.localized import LocalizedCollation
+from lollypop.utils import remove_static
+from lollypop.logger import Logger
+
+
+class CollectionSnapshot:
+    """
+        In memory column store of albums used to filter and sort albums and
+        artists without SQL
+        Columns are array backed and indexed by album row. Artist -> albums
+        and genre -> albums are CSR adjacency arrays: albums for key at
+        index i are rows[offsets[i]:offsets[i + 1]]
+        Methods return None when snapshot is not available, caller should
+        then use the database
+        Albums updated by scanner are synced with database: new albums get
+        a new row, removed rows are masked and adjacency changes go to
+        overlays. Snapshot is rebuilt once scanner is idle
+    """
+
+    # Delay before syncing albums updated by scanner (ms)
+    __SYNC_DELAY = 500
+    # Delay before rebuilding snapshot after a collection update (ms)
+    __REBUILD_DELAY = 2000
+    # Python sort key matching SQL COLLATE LOCALIZED
+    __COLLATION_KEY = cmp_to_key(LocalizedCollation())
+
+    def __init__(self):
+        """
+            Init snapshot
+        """
+        self.__lock = Lock()
+        self.__sync_lock = Lock()
+        self.__loaded = False
+        self.__rebuild_timeout_id = None
+        self.__sync_timeout_id = None
+        self.__pending_album_ids = set()
+        # Incremented on each sync, a rebuild loaded before is outdated
+        self.__generation = 0
+        self.__album_rows = {}
+        self.__album_ids = array("l")
+        self.__storage_types = array("l")
+        self.__loved = array("l")
+        self.__popularities = array("l")
+        self.__years = array("l")
+        self.__timestamps = array("l")
+        # Rank of album name with SQL collation
+        self.__name_ranks = array("d")
+        # Rank of first album artist sortname with SQL collation
+        self.__artist_ranks = array("d")
+        self.__artists = None
+        self.__genres = None
+        # Synced rows adjacency: {key: set(rows)}
+        self.__artists_delta = {}
+        self.__genres_delta = {}
+        # Synced rows keys, CSR is ignored for them:
+        # {row: (artist ids as set, genre ids as set)}
+        self.__row_keys = {}
+        # Album names sorted with SQL collation and their ranks
+        self.__sorted_names = []
+        self.__sorted_name_ranks = []
+        # (artist id, name, sortname) ordered by sortname
+        self.__artist_infos = []
+        # Artist sortnames sorted with SQL collation and their ranks
+        self.__sorted_sortnames = []
+        self.__sorted_sortname_ranks = []
+        # {artist id: rank}
+        self.__artist_rank = {}
+        App().scanner.connect("updated", self.__on_collection_updated)
+
+    def load(self):
+        """
+            Load snapshot from database
+            @thread safe
+        """
+        if not App().settings.get_value("collection-snapshot"):
+            return
+        try:
+            self.__load()
+        except Exception as e:
+            Logger.error("CollectionSnapshot::load(): %s", e)
+
+    def update_album(self, album_id):
+        """
+            Update album popularity and loved columns
+            @param album_id as int
+            @thread safe
+        """
+        with self.__lock:
+            row = self.__album_rows.get(album_id, None)
+        if row is None:
+            return
+        with SqlCursor(App().db) as sql:
+            result = sql.execute("SELECT popularity, loved\
+                                  FROM albums WHERE rowid=?", (album_id,))
+            v = result.fetchone()
+        with self.__lock:
+            if v is not None and self.__loaded:
+                self.__popularities[row] = v[0] or 0
+                self.__loved[row] = v[1] or 0
+
+    def get_album_ids(self, genre_ids, artist_ids, storage_type,
+                      skipped=False, orderby=None):
+        """
+            Get albums ids, same as AlbumsDatabase.get_ids()
+            @param genre_ids as [int]
+            @param artist_ids as [int]
+            @param storage_type as StorageType
+            @param skipped as bool
+            @param orderby as OrderBy
+            @return [int]/None
+        """
+        genre_ids = remove_static(genre_ids)
+        artist_ids = remove_static(artist_ids)
+        if orderby is None:
+            orderby = App().settings.get_enum("orderby")
+        with self.__lock:
+            if not self.__loaded:
+                return None
+            rows = self.__get_rows(self.__artists, self.__artists_delta, 0,
+                                   artist_ids)
+            if genre_ids:
+                genre_rows = self.__get_rows(self.__genres,
+                                             self.__genres_delta, 1,
+                                             genre_ids)
+                rows = genre_rows if rows is None else rows & genre_rows
+            elif rows is None:
+                rows = self.__get_rows(self.__artists, self.__artists_delta,
+                                       0, None)
+            storage_types = self.__storage_types
+            loved = self.__loved
+            rows = [row for row in rows
+                    if storage_types[row] & storage_type and
+                    (skipped or not loved[row] & LovedFlags.SKIPPED)]
+            rows.sort(key=self.__get_sort_key(orderby))
+            return [self.__album_ids[row] for row in rows]
+
+    def get_artists(self, genre_ids, storage_type):
+        """
+            Get artists, same as ArtistsDatabase.get()
+            @param genre_ids as [int]
+            @param storage_type as StorageType
+            @return [(int, str, str)]/None
+        """
+        genre_ids = remove_static(genre_ids)
+        show_sortname = App().settings.get_value("show-artist-sort")
+        with self.__lock:
+            if not self.__loaded:
+                return None
+            if not genre_ids or genre_ids[0] == Type.ALL:
+                rows = self.__get_rows(self.__artists, self.__artists_delta,
+                                       0, None)
+            else:
+                rows = self.__get_rows(self.__genres, self.__genres_delta, 1,
+                                       genre_ids)
+            storage_types = self.__storage_types
+            rows = set([row for row in rows
+                        if storage_types[row] & storage_type])
+            artists = []
+            for (artist_id, name, sortname) in self.__artist_infos:
+                for row in self.__get_key_rows(self.__artists,
+                                               self.__artists_delta, 0,
+                                               artist_id):
+                    if row in rows:
+                        artists.append((artist_id,
+                                        sortname if show_sortname else name,
+                                        sortname))
+                        break
+            return artists
+
+#######################
+# PRIVATE             #
+#######################
+    def __load(self):
+        """
+            Load snapshot from database
+        """
+        with self.__lock:
+            generation = self.__generation
+        album_rows = {}
+        columns = [array("l") for i in range(6)]
+        with SqlCursor(App().db) as sql:
+            result = sql.execute("SELECT rowid, storage_type, loved,\
+                                  popularity, year, timestamp FROM albums")
+            for values in result:
+                album_rows[values[0]] = len(columns[0])
+                for (column, value) in zip(columns, values):
+                    column.append(value or 0)
+            # Albums without a year first in ascending order, as in SQL
+            nulls = list(itertools.chain(*sql.execute(
+                "SELECT rowid FROM albums WHERE year IS NULL")))
+            name_ranks = array("d", [0] * len(columns[0]))
+            sorted_names = []
+            result = sql.execute("SELECT rowid, name FROM albums\
+                                  ORDER BY name\
+                                  COLLATE NOCASE COLLATE LOCALIZED")
+            for (rank, (album_id, name)) in enumerate(result):
+                name_ranks[album_rows[album_id]] = rank
+                sorted_names.append(self.__COLLATION_KEY(name or ""))
+            artist_infos = list(sql.execute(
+                "SELECT rowid, name, sortname FROM artists\
+                 ORDER BY sortname COLLATE NOCASE COLLATE LOCALIZED"))
+            artist_ranks = dict([(info[0], rank)
+                                 for (rank, info) in enumerate(artist_infos)])
+            sorted_sortnames = [self.__COLLATION_KEY(info[2] or "")
+                                for info in artist_infos]
+            artists = self.__get_csr(sql.execute(
+                "SELECT album_artists.artist_id, album_artists.album_id\
+                 FROM album_artists, artists\
+                 WHERE artists.rowid=album_artists.artist_id\
+                 ORDER BY album_artists.artist_id"), album_rows)
+            genres = self.__get_csr(sql.execute(
+                "SELECT genre_id, album_id FROM album_genres\
+                 ORDER BY genre_id"), album_rows)
+        first_artist_ranks = array("d", [float("inf")] * len(columns[0]))
+        (keys, offsets, rows) = artists
+        for i in range(len(keys)):
+            rank = artist_ranks[keys[i]]
+            for row in rows[offsets[i]:offsets[i + 1]]:
+                if rank < first_artist_ranks[row]:
+                    first_artist_ranks[row] = rank
+        for album_id in nulls:
+            # Lower than any year
+            columns[4][album_rows[album_id]] = -1
+        with self.__lock:
+            if self.__loaded and generation != self.__generation:
+                # Synced while loading, rebuild again later
+                GLib.idle_add(self.__schedule_rebuild)
+                return
+            self.__album_rows = album_rows
+            (self.__album_ids, self.__storage_types, self.__loved,
+             self.__popularities, self.__years, self.__timestamps) = columns
+            self.__name_ranks = name_ranks
+            self.__artist_ranks = first_artist_ranks
+            self.__artists = artists
+            self.__genres = genres
+            self.__artists_delta = {}
+            self.__genres_delta = {}
+            self.__row_keys = {}
+            self.__sorted_names = sorted_names
+            self.__sorted_name_ranks = list(range(len(sorted_names)))
+            self.__artist_infos = artist_infos
+            self.__sorted_sortnames = sorted_sortnames
+            self.__sorted_sortname_ranks = list(range(len(artist_infos)))
+            self.__artist_rank = artist_ranks
+            self.__loaded = True
+
+    def __sync_albums(self, album_ids):
+        """
+            Sync album rows with database
+            @param album_ids as [int]
+        """
+        with self.__sync_lock:
+            albums = {}
+            artists = {}
+            with SqlCursor(App().db) as sql:
+                for album_id in album_ids:
+                    result = sql.execute("SELECT storage_type, loved,\
+                                          popularity, year, timestamp, name\
+                                          FROM albums WHERE rowid=?",
+                                         (album_id,))
+                    values = result.fetchone()
+                    if values is None:
+                        albums[album_id] = None
+                        continue
+                    artist_ids = list(itertools.chain(*sql.execute(
+                        "SELECT artist_id FROM album_artists\
+                         WHERE album_id=?", (album_id,))))
+                    genre_ids = list(itertools.chain(*sql.execute(
+                        "SELECT genre_id FROM album_genres\
+                         WHERE album_id=?", (album_id,))))
+                    albums[album_id] = (values, artist_ids, genre_ids)
+                    for artist_id in artist_ids:
+                        if artist_id in artists.keys():
+                            continue
+                        result = sql.execute("SELECT name, sortname\
+                                              FROM artists WHERE rowid=?",
+                                             (artist_id,))
+                        info = result.fetchone()
+                        if info is not None:
+                            artists[artist_id] = info
+            with self.__lock:
+                if not self.__loaded:
+                    return
+                self.__generation += 1
+                for (artist_id, (name, sortname)) in artists.items():
+                    self.__add_artist(artist_id, name, sortname)
+                for (album_id, album) in albums.items():
+                    if album is None:
+                        self.__remove_row(album_id)
+                    else:
+                        self.__set_row(album_id, *album)
+
+    def __set_row(self, album_id, values, artist_ids, genre_ids):
+        """
+            Set album row, add it if needed
+            @param album_id as int
+            @param values as (int, int, int, int, int, str)
+            @param artist_ids as [int]
+            @param genre_ids as [int]
+        """
+        (storage_type, loved, popularity, year, timestamp, name) = values
+        row = self.__album_rows.get(album_id, None)
+        key = self.__COLLATION_KEY(name or "")
+        if row is None:
+            row = len(self.__album_ids)
+            self.__album_rows[album_id] = row
+            self.__album_ids.append(album_id)
+            for column in [self.__storage_types, self.__loved,
+                           self.__popularities, self.__years,
+                           self.__timestamps, self.__name_ranks,
+                           self.__artist_ranks]:
+                column.append(0)
+            self.__name_ranks[row] = self.__insert_rank(
+                self.__sorted_names, self.__sorted_name_ranks, key)[1]
+        else:
+            i = bisect_left(self.__sorted_name_ranks, self.__name_ranks[row])
+            if i == len(self.__sorted_names) or\
+                    self.__sorted_names[i] != key:
+                self.__name_ranks[row] = self.__insert_rank(
+                    self.__sorted_names, self.__sorted_name_ranks, key)[1]
+        self.__storage_types[row] = storage_type or 0
+        self.__loved[row] = loved or 0
+        self.__popularities[row] = popularity or 0
+        # Albums without a year first in ascending order, as in SQL
+        self.__years[row] = -1 if year is None else year
+        self.__timestamps[row] = timestamp or 0
+        artist_ids = set([artist_id for artist_id in artist_ids
+                          if artist_id in self.__artist_rank.keys()])
+        self.__artist_ranks[row] = min(
+            [self.__artist_rank[artist_id] for artist_id in artist_ids],
+            default=float("inf"))
+        self.__row_keys[row] = (artist_ids, set(genre_ids))
+        for artist_id in artist_ids:
+            self.__artists_delta.setdefault(artist_id, set()).add(row)
+        for genre_id in genre_ids:
+            self.__genres_delta.setdefault(genre_id, set()).add(row)
+
+    def __remove_row(self, album_id):
+        """
+            Mask album row
+            @param album_id as int
+        """
+        row = self.__album_rows.pop(album_id, None)
+        if row is not None:
+            self.__storage_types[row] = 0
+            self.__row_keys[row] = (set(), set())
+
+    def __add_artist(self, artist_id, name, sortname):
+        """
+            Add artist to sorted artists if missing
+            @param artist_id as int
+            @param name as str
+            @param sortname as str
+        """
+        if artist_id in self.__artist_rank.keys():
+            return
+        (i, rank) = self.__insert_rank(self.__sorted_sortnames,
+                                       self.__sorted_sortname_ranks,
+                                       self.__COLLATION_KEY(sortname or ""))
+        self.__artist_infos.insert(i, (artist_id, name, sortname))
+        self.__artist_rank[artist_id] = rank
+
+    def __insert_rank(self, keys, ranks, key):
+        """
+            Insert key in sorted keys with a rank between its neighbours
+            @param keys as [object]
+            @param ranks as [float]
+            @param key as object
+            @return (int, float) => index, rank
+        """
+        i = bisect_right(keys, key)
+        if not ranks:
+            rank = 0
+        elif i == 0:
+            rank = ranks[0] - 1
+        elif i == len(ranks):
+            rank = ranks[-1] + 1
+        else:
+            rank = (ranks[i - 1] + ranks[i]) / 2
+        keys.insert(i, key)
+        ranks.insert(i, rank)
+        return (i, rank)
+
+    def __get_csr(self, result, album_rows):
+        """
+            Get CSR adjacency from (key, album id) rows ordered by key
+            @param result as sqlite3.Cursor
+            @param album_rows as {int: int}
+            @return (array, array, array) => keys, offsets, album rows
+        """
+        keys = array("l")
+        offsets = array("l")
+        rows = array("l")
+        for (key, album_id) in result:
+            row = album_rows.get(album_id, None)
+            if row is None:
+                continue
+            if not keys or keys[-1] != key:
+                keys.append(key)
+                offsets.append(len(rows))
+            rows.append(row)
+        offsets.append(len(rows))
+        return (keys, offsets, rows)
+
+    def __get_rows(self, csr, delta, index, ids):
+        """
+            Get album rows for ids in CSR adjacency and its overlay
+            @param csr as (array, array, array)
+            @param delta as {int: set}
+            @param index as int => keys index in synced rows keys
+            @param ids as [int] => None for all keys
+            @return set/None => None if ids is empty
+        """
+        if ids is None:
+            result = set(csr[2])
+            for rows in delta.values():
+                result.update(rows)
+            row_keys = self.__row_keys
+            if row_keys:
+                result = set([row for row in result
+                              if row not in row_keys or
+                              row_keys[row][index]])
+            return result
+        if not ids:
+            return None
+        result = set()
+        for key in ids:
+            result.update(self.__get_key_rows(csr, delta, index, key))
+        return result
+
+    def __get_key_rows(self, csr, delta, index, key):
+        """
+            Get album rows for key in CSR adjacency and its overlay
+            @param csr as (array, array, array)
+            @param delta as {int: set}
+            @param index as int => keys index in synced rows keys
+            @param key as int
+            @return [int]
+        """
+        (keys, offsets, rows) = csr
+        result = []
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            result += rows[offsets[i]:offsets[i + 1]]
+        result += delta.get(key, [])
+        row_keys = self.__row_keys
+        if row_keys:
+            result = [row for row in result
+                      if row not in row_keys or key in row_keys[row][index]]
+        return result
+
+    def __get_sort_key(self, orderby):
+        """
+            Get sort key for album rows, same order as AlbumsDatabase
+            @param orderby as OrderBy
+            @return function
+        """
+        names = self.__name_ranks
+        artists = self.__artist_ranks
+        years = self.__years
+        timestamps = self.__timestamps
+        popularities = self.__popularities
+        if orderby == OrderBy.ARTIST_YEAR:
+            return lambda row: (artists[row], years[row],
+                                timestamps[row], names[row])
+        elif orderby == OrderBy.ARTIST_TITLE:
+            return lambda row: (artists[row], names[row])
+        elif orderby == OrderBy.TITLE:
+            return lambda row: names[row]
+        elif orderby == OrderBy.YEAR_DESC:
+            return lambda row: (-years[row], -timestamps[row], names[row])
+        elif orderby == OrderBy.YEAR_ASC:
+            return lambda row: (years[row], timestamps[row], names[row])
+        else:
+            return lambda row: (-popularities[row], names[row])
+
+    def __schedule_rebuild(self):
+        """
+            Rebuild snapshot later, overlays are merged
+        """
+        if self.__rebuild_timeout_id is not None:
+            GLib.source_remove(self.__rebuild_timeout_id)
+        self.__rebuild_timeout_id = GLib.timeout_add(
+            self.__REBUILD_DELAY, self.__on_rebuild_timeout)
+
+    def __on_rebuild_timeout(self):
+        """
+            Rebuild snapshot in background if scanner is idle
+        """
+        if App().scanner.is_locked():
+            return True
+        self.__rebuild_timeout_id = None
+        App().task_helper.run(self.load, priority=TaskPriority.BACKGROUND)
+
+    def __on_sync_timeout(self):
+        """
+            Sync pending albums in background
+        """
+        self.__sync_timeout_id = None
+        album_ids = list(self.__pending_album_ids)
+        self.__pending_album_ids = set()
+        App().task_helper.run(self.__sync_albums, album_ids,
+                              priority=TaskPriority.BACKGROUND)
+        self.__schedule_rebuild()
+
+    def __on_collection_updated(self, scanner, item, scan_update):
+        """
+            Sync updated album with database
+            @param scanner as CollectionScanner
+            @param item as CollectionItem
+            @param scan_update as ScanUpdate
+        """
+        if not self.__loaded or item.album_id is None:
+            return
+        self.__pending_album_ids.add(item.album_id)
+        if self.__sync_timeout_id is None:
+            self.__sync_timeout_id = GLib.timeout_add(
+                self.__SYNC_DELAY, self.__on_sync_timeout)
@@ -148,7 +148,9 @@ class ListsContainer:
         """
         def load():
             storage_type = get_default_storage_type()
-            artists = App().artists.get(genre_ids, storage_type)
+            artists = App().snapshot.get_artists(genre_ids, storage_type)
+            if artists is None:
+                artists = App().artists.get(genre_ids, storage_type)
             return artists
         selection_list.set_mask(SelectionListMask.ARTISTS)
         App().task_helper.run(load, callback=(selection_list.populate,))
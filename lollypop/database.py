@@ -15,7 +15,6 @@ from gi.repository import Gio
 import sqlite3
 from threading import Lock
 from random import shuffle
-import itertools
 
 from lollypop.define import App, LOLLYPOP_DATA_PATH
 from lollypop.database_upgrade import DatabaseAlbumsUpgrade
@@ -91,6 +90,16 @@ class Database:
                                                 album_id INT NOT NULL,
                                                 mtime INT NOT NULL,
                                                 popularity INT NOT NULL)"""
+    __create_album_moment_popularity = """CREATE TABLE
+                                albums_moment_popularity (
+                                                album_id INTEGER PRIMARY KEY,
+                                                score DOUBLE NOT NULL)"""
+    __create_listens = """CREATE TABLE listens (
+                                                track_id INT NOT NULL,
+                                                album_id INT NOT NULL,
+                                                timestamp INT NOT NULL,
+                                                played_ms INT NOT NULL,
+                                                skipped BOOLEAN NOT NULL)"""
     __create_tracks = """CREATE TABLE tracks (id INTEGER PRIMARY KEY,
                                               name TEXT NOT NULL,
                                               uri TEXT NOT NULL,
@@ -109,7 +118,13 @@ class Database:
                                               storage_type INT NOT NULL,
                                               mb_track_id TEXT,
                                               lp_track_id TEXT,
-                                              bpm DOUBLE
+                                              bpm DOUBLE,
+                                              rg_track_gain DOUBLE,
+                                              rg_track_peak DOUBLE,
+                                              rg_album_gain DOUBLE,
+                                              rg_album_peak DOUBLE,
+                                              analysis_failed INT NOT NULL\
+                                                DEFAULT 0
                                               )"""
     __create_track_artists = """CREATE TABLE track_artists (
                                                 track_id INT NOT NULL,
@@ -125,6 +140,24 @@ class Database:
                                                 album_id)"""
     __create_track_genres_idx = """CREATE index idx_tg ON track_genres(
                                                 track_id)"""
+    __create_albums_storage_popularity_idx = """CREATE index idx_asp ON albums(
+                                                storage_type, popularity)"""
+    __create_albums_storage_mtime_idx = """CREATE index idx_asm ON albums(
+                                                storage_type, mtime)"""
+    __create_tracks_storage_popularity_idx = """CREATE index idx_tsp ON tracks(
+                                                storage_type, popularity)"""
+    __create_tracks_storage_ltime_idx = """CREATE index idx_tsl ON tracks(
+                                                storage_type, ltime)"""
+    __create_tracks_album_idx = """CREATE index idx_tal ON tracks(
+                                                album_id, ltime)"""
+    __create_album_timed_popularity_idx = """CREATE index idx_atp ON
+                                albums_timed_popularity(album_id, mtime)"""
+    __create_album_moment_popularity_idx = """CREATE index idx_amp ON
+                                albums_moment_popularity(score)"""
+    __create_listens_idx = """CREATE index idx_lts ON listens(
+                                timestamp, skipped, track_id, album_id)"""
+    __create_listens_track_idx = """CREATE index idx_lt ON listens(
+                                                track_id)"""
 
     def __init__(self):
         """
@@ -147,6 +180,8 @@ class Database:
                     sql.execute(self.__create_album_genres)
                     sql.execute(self.__create_album_artists)
                     sql.execute(self.__create_album_timed_popularity)
+                    sql.execute(self.__create_album_moment_popularity)
+                    sql.execute(self.__create_listens)
                     sql.execute(self.__create_tracks)
                     sql.execute(self.__create_track_artists)
                     sql.execute(self.__create_track_genres)
@@ -154,6 +189,15 @@ class Database:
                     sql.execute(self.__create_track_artists_idx)
                     sql.execute(self.__create_album_genres_idx)
                     sql.execute(self.__create_track_genres_idx)
+                    sql.execute(self.__create_albums_storage_popularity_idx)
+                    sql.execute(self.__create_albums_storage_mtime_idx)
+                    sql.execute(self.__create_tracks_storage_popularity_idx)
+                    sql.execute(self.__create_tracks_storage_ltime_idx)
+                    sql.execute(self.__create_tracks_album_idx)
+                    sql.execute(self.__create_album_timed_popularity_idx)
+                    sql.execute(self.__create_album_moment_popularity_idx)
+                    sql.execute(self.__create_listens_idx)
+                    sql.execute(self.__create_listens_track_idx)
                     sql.execute("PRAGMA user_version=%s" % upgrade.version)
             except Exception as e:
                 Logger.error("Database::__init__(): %s" % e)
@@ -190,7 +234,8 @@ class Database:
             with SqlCursor(App().db) as sql:
                 for request in requests:
                     result = sql.execute(request)
-                    ids += list(itertools.chain(*result))
+                    # OR requests also select the ORDER BY column
+                    ids += [row[0] for row in result]
                 if union_random:
                     shuffle(ids)
                     return ids[:limit_int]
@@ -11,6 +11,7 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 import itertools
+from math import log2
 from time import time
 from random import shuffle
 
@@ -18,6 +19,7 @@ from lollypop.sqlcursor import SqlCursor
 from lollypop.define import App, Type, OrderBy, StorageType, LovedFlags
 from lollypop.logger import Logger
 from lollypop.utils import remove_static, make_subrequest
+from lollypop.utils import make_storage_type_subrequest
 
 
 class AlbumsDatabase:
@@ -25,6 +27,16 @@ class AlbumsDatabase:
         Albums database helper
     """
 
+    # Timed popularity buckets: one per day, then one per week
+    TIMED_POPULARITY_DAY = 86400
+    TIMED_POPULARITY_WEEK = 604800
+    # For now, we don't need to keep more data than a month
+    TIMED_POPULARITY_MAX_AGE = 2678400
+    # Popularity at the moment is divided by two every week
+    MOMENT_HALF_LIFE = 604800
+    # SQLite variables limit
+    __CHUNK_SIZE = 500
+
     def __init__(self, db):
         """
             Init albums database object
@@ -222,13 +234,15 @@ class AlbumsDatabase:
                        WHERE album_artists.album_id = albums.rowid\
                        AND (album_artists.artist_id = artists.rowid\
                             OR album_artists.artist_id=?)\
-                       AND synced & (1 << ?) AND albums.storage_type & ?"
+                       AND synced & (1 << ?) AND %s" %\
+                make_storage_type_subrequest(StorageType.COLLECTION,
+                                             "albums.storage_type")
             order = " ORDER BY artists.sortname\
                      COLLATE NOCASE COLLATE LOCALIZED,\
                      albums.timestamp,\
                      albums.name\
                      COLLATE NOCASE COLLATE LOCALIZED"
-            filters = (Type.COMPILATIONS, index, StorageType.COLLECTION)
+            filters = (Type.COMPILATIONS, index)
             result = sql.execute(request + order, filters)
             return list(itertools.chain(*result))
 
@@ -284,10 +298,11 @@ class AlbumsDatabase:
             @return [int]
         """
         with SqlCursor(self.__db) as sql:
-            filters = (storage_type, limit)
+            filters = (limit,)
             request = "SELECT rowid\
                        FROM albums\
-                       WHERE storage_type=? ORDER BY RANDOM() LIMIT ?"
+                       WHERE %s ORDER BY RANDOM() LIMIT ?" %\
+                make_storage_type_subrequest(storage_type)
             result = sql.execute(request, filters)
             return list(itertools.chain(*result))
 
@@ -299,9 +314,10 @@ class AlbumsDatabase:
             @return [int]
         """
         with SqlCursor(self.__db) as sql:
-            filters = (storage_type, timestamp)
+            filters = (timestamp,)
             request = "SELECT rowid FROM albums\
-                       WHERE storage_type=? and mtime>?"
+                       WHERE %s and mtime>?" %\
+                make_storage_type_subrequest(storage_type)
             result = sql.execute(request, filters)
             return list(itertools.chain(*result))
 
@@ -313,9 +329,10 @@ class AlbumsDatabase:
             @return [int]
         """
         with SqlCursor(self.__db) as sql:
-            filters = (storage_type, limit)
+            filters = (limit,)
             request = "SELECT rowid FROM albums\
-                       WHERE storage_type&? ORDER BY mtime ASC LIMIT ?"
+                       WHERE %s ORDER BY mtime ASC LIMIT ?" %\
+                make_storage_type_subrequest(storage_type)
             result = sql.execute(request, filters)
             return list(itertools.chain(*result))
 
@@ -326,9 +343,9 @@ class AlbumsDatabase:
             @return int
         """
         with SqlCursor(self.__db) as sql:
-            filters = (storage_type,)
-            request = "SELECT COUNT(*) FROM albums WHERE storage_type=?"
-            result = sql.execute(request, filters)
+            request = "SELECT COUNT(*) FROM albums WHERE %s" %\
+                make_storage_type_subrequest(storage_type)
+            result = sql.execute(request)
             v = result.fetchone()
             if v is not None:
                 return v[0]
@@ -383,24 +400,41 @@ class AlbumsDatabase:
             current += pop_to_add
             sql.execute("UPDATE albums SET popularity=? WHERE rowid=?",
                         (current, album_id))
-            # Then increment timed popularity
-            result = sql.execute("SELECT popularity\
+            # Then increment timed popularity for today bucket
+            now = int(time())
+            day = now - now % self.TIMED_POPULARITY_DAY
+            result = sql.execute("SELECT rowid\
                                   FROM albums_timed_popularity\
-                                  WHERE album_id=?",
-                                 (album_id,))
-            pop = result.fetchone()
-            mtime = int(time())
-            if pop is not None:
-                popularity = pop[0] + pop_to_add
+                                  WHERE album_id=? AND mtime=?",
+                                 (album_id, day))
+            v = result.fetchone()
+            if v is not None:
                 sql.execute("UPDATE albums_timed_popularity\
-                             SET popularity=?, mtime=?\
-                             WHERE album_id=?",
-                            (popularity, mtime, album_id))
+                             SET popularity=popularity+?\
+                             WHERE rowid=?",
+                            (pop_to_add, v[0]))
             else:
                 sql.execute("INSERT INTO albums_timed_popularity\
                              (album_id, popularity, mtime)\
-                             VALUES (?, 1, ?)",
-                            (album_id, mtime))
+                             VALUES (?, ?, ?)",
+                            (album_id, pop_to_add, day))
+            # Then update popularity at the moment
+            # Score is stored as log2(decayed popularity) + now / half life:
+            # ordering on it is the same as ordering on current decayed
+            # popularity, so old scores never need to be rewritten
+            offset = now / self.MOMENT_HALF_LIFE
+            result = sql.execute("SELECT score\
+                                  FROM albums_moment_popularity\
+                                  WHERE album_id=?",
+                                 (album_id,))
+            v = result.fetchone()
+            popularity = pop_to_add
+            if v is not None:
+                popularity += 2 ** (v[0] - offset)
+            if popularity > 0:
+                sql.execute("INSERT OR REPLACE INTO albums_moment_popularity\
+                             (album_id, score) VALUES (?, ?)",
+                            (album_id, offset + log2(popularity)))
 
     def get_higher_popularity(self):
         """
@@ -646,6 +680,23 @@ class AlbumsDatabase:
                 return v[0]
             return ""
 
+    def get_metas(self, storage_type):
+        """
+            Get name, Lollypop id, popularity and artists for albums
+            @param storage_type as StorageType
+            @return [(int, str, str, int, str)]
+        """
+        with SqlCursor(self.__db) as sql:
+            request = "SELECT albums.rowid, albums.name, albums.lp_album_id,\
+                       albums.popularity, GROUP_CONCAT(artists.name, ', ')\
+                       FROM albums, album_artists, artists\
+                       WHERE album_artists.album_id=albums.rowid\
+                       AND album_artists.artist_id=artists.rowid AND %s\
+                       GROUP BY albums.rowid" % make_storage_type_subrequest(
+                storage_type, "albums.storage_type")
+            result = sql.execute(request)
+            return list(result)
+
     def get_uri(self, album_id):
         """
             Get album uri for album id
@@ -693,10 +744,11 @@ class AlbumsDatabase:
             @return [int]
         """
         with SqlCursor(self.__db) as sql:
-            filters = (storage_type,)
+            filters = ()
             request = "SELECT DISTINCT albums.rowid\
                        FROM albums\
-                       WHERE rate>=4 AND storage_type & ?"
+                       WHERE rate>=4 AND %s" %\
+                make_storage_type_subrequest(storage_type)
             if not skipped:
                 request += " AND not loved & ?"
                 filters += (LovedFlags.SKIPPED,)
@@ -714,9 +766,10 @@ class AlbumsDatabase:
             @return [int]
         """
         with SqlCursor(self.__db) as sql:
-            filters = (storage_type,)
+            filters = ()
             request = "SELECT DISTINCT albums.rowid FROM albums\
-                       WHERE popularity!=0 AND storage_type & ?"
+                       WHERE popularity!=0 AND %s" %\
+                make_storage_type_subrequest(storage_type)
             if not skipped:
                 request += " AND not loved & ?"
                 filters += (LovedFlags.SKIPPED,)
@@ -734,15 +787,16 @@ class AlbumsDatabase:
             @return [int]
         """
         with SqlCursor(self.__db) as sql:
-            filters = (storage_type,)
-            request = "SELECT DISTINCT albums.rowid\
-                       FROM albums, albums_timed_popularity\
-                       WHERE albums.storage_type & ? AND\
-                             albums.rowid = albums_timed_popularity.album_id"
+            filters = ()
+            request = "SELECT albums.rowid\
+                       FROM albums_moment_popularity, albums\
+                       WHERE albums.rowid = albums_moment_popularity.album_id\
+                       AND %s" % make_storage_type_subrequest(
+                           storage_type, "albums.storage_type")
             if not skipped:
                 request += " AND not loved & ?"
                 filters += (LovedFlags.SKIPPED,)
-            request += "ORDER BY albums_timed_popularity.popularity DESC\
+            request += " ORDER BY albums_moment_popularity.score DESC\
                         LIMIT ?"
             filters += (limit,)
             result = sql.execute(request, filters)
@@ -761,8 +815,9 @@ class AlbumsDatabase:
             request = "SELECT albums.rowid\
                        FROM albums\
                        WHERE loved & ? AND\
-                       storage_type & ? ORDER BY popularity DESC"
-            result = sql.execute(request, (LovedFlags.LOVED, storage_type,))
+                       %s ORDER BY popularity DESC" %\
+                make_storage_type_subrequest(storage_type)
+            result = sql.execute(request, (LovedFlags.LOVED,))
             return list(itertools.chain(*result))
 
     def get_recents(self, storage_type, skipped, limit):
@@ -774,9 +829,9 @@ class AlbumsDatabase:
             @return [int]
         """
         with SqlCursor(self.__db) as sql:
-            filters = (storage_type,)
+            filters = ()
             request = "SELECT DISTINCT albums.rowid FROM albums\
-                       WHERE albums.storage_type & ?"
+                       WHERE %s" % make_storage_type_subrequest(storage_type)
             if not skipped:
                 request += " AND not loved & ?"
                 filters += (LovedFlags.SKIPPED,)
@@ -796,21 +851,24 @@ class AlbumsDatabase:
         """
         with SqlCursor(self.__db) as sql:
             if genre_id is not None:
-                filters = (storage_type, genre_id)
+                filters = (genre_id,)
                 request = "SELECT DISTINCT albums.rowid\
                            FROM albums, album_genres\
-                           WHERE albums.storage_type & ? AND\
+                           WHERE %s AND\
                                  album_genres.album_id = albums.rowid AND\
-                                 album_genres.genre_id = ?"
+                                 album_genres.genre_id = ?" %\
+                    make_storage_type_subrequest(storage_type,
+                                                 "albums.storage_type")
                 if not skipped:
                     request += " AND not loved & ?"
                     filters += (LovedFlags.SKIPPED,)
                 request += "ORDER BY random() LIMIT ?"
                 filters += (limit,)
             else:
-                filters = (storage_type,)
+                filters = ()
                 request = "SELECT DISTINCT rowid FROM albums\
-                           WHERE storage_type & ?"
+                           WHERE %s" %\
+                    make_storage_type_subrequest(storage_type)
                 if not skipped:
                     request += " AND not loved & ?"
                     filters += (LovedFlags.SKIPPED,)
@@ -831,14 +889,16 @@ class AlbumsDatabase:
         """
         with SqlCursor(self.__db) as sql:
             if genre_id is not None:
-                filters = (storage_type, genre_id)
+                filters = (genre_id,)
                 request = "SELECT rowid, artist_id FROM (\
                                SELECT albums.rowid, album_artists.artist_id\
                                FROM albums, album_genres, album_artists\
                                WHERE albums.rowid = album_artists.album_id AND\
-                                     albums.storage_type & ? AND\
+                                     %s AND\
                                      album_genres.album_id = albums.rowid AND\
-                                     album_genres.genre_id = ?"
+                                     album_genres.genre_id = ?" %\
+                    make_storage_type_subrequest(storage_type,
+                                                 "albums.storage_type")
                 if not skipped:
                     request += " AND not loved & ?"
                     filters += (LovedFlags.SKIPPED,)
@@ -846,12 +906,14 @@ class AlbumsDatabase:
                 request += "ORDER BY random() LIMIT ?)\
                             GROUP BY artist_id ORDER BY random() LIMIT ?"
             else:
-                filters = (storage_type,)
+                filters = ()
                 request = "SELECT rowid, artist_id FROM (\
                                SELECT albums.rowid, album_artists.artist_id\
                                FROM albums, album_artists\
                                WHERE albums.rowid = album_artists.album_id AND\
-                                     albums.storage_type & ?"
+                                     %s" %\
+                    make_storage_type_subrequest(storage_type,
+                                                 "albums.storage_type")
                 if not skipped:
                     request += " AND not loved & ?"
                     filters += (LovedFlags.SKIPPED,)
@@ -943,7 +1005,7 @@ class AlbumsDatabase:
         genre_ids = remove_static(genre_ids)
         artist_ids = remove_static(artist_ids)
         with SqlCursor(self.__db) as sql:
-            filters = (album_id, disc, storage_type)
+            filters = (album_id, disc)
             request = "SELECT DISTINCT tracks.rowid\
                        FROM tracks"
             if genre_ids:
@@ -952,7 +1014,9 @@ class AlbumsDatabase:
             if artist_ids:
                 request += ", track_artists"
                 filters += tuple(artist_ids)
-            request += " WHERE album_id=? AND discnumber=? AND storage_type&?"
+            request += " WHERE album_id=? AND discnumber=? AND "
+            request += make_storage_type_subrequest(storage_type,
+                                                    "tracks.storage_type")
             if genre_ids:
                 request += " AND track_genres.track_id = tracks.rowid AND"
                 request += make_subrequest("track_genres.genre_id=?",
@@ -970,6 +1034,63 @@ class AlbumsDatabase:
             result = sql.execute(request, filters)
             return list(itertools.chain(*result))
 
+    def get_tracks_for_ids(self, album_ids, genre_ids, storage_type, skipped):
+        """
+            Get tracks for album ids, one row per track artist
+            @param album_ids as [int]
+            @param genre_ids as [int]
+            @param storage_type as StorageType
+            @param skipped as bool
+            @return [(album id, disc, track id, number, artist id)]
+        """
+        genre_ids = remove_static(genre_ids)
+        rows = []
+        with SqlCursor(self.__db) as sql:
+            for i in range(0, len(album_ids), self.__CHUNK_SIZE):
+                chunk = album_ids[i:i + self.__CHUNK_SIZE]
+                filters = tuple(chunk) + tuple(genre_ids)
+                request = "SELECT tracks.album_id, tracks.discnumber,\
+                           tracks.rowid, tracks.tracknumber,\
+                           track_artists.artist_id\
+                           FROM tracks LEFT JOIN track_artists\
+                           ON track_artists.track_id=tracks.rowid"
+                if genre_ids:
+                    request += ", track_genres"
+                request += " WHERE tracks.album_id IN (%s) AND " %\
+                    ", ".join(["?"] * len(chunk))
+                request += make_storage_type_subrequest(storage_type,
+                                                        "tracks.storage_type")
+                if genre_ids:
+                    request += " AND track_genres.track_id = tracks.rowid AND"
+                    request += make_subrequest("track_genres.genre_id=?",
+                                               "OR",
+                                               len(genre_ids))
+                if not skipped:
+                    request += " AND not tracks.loved & ?"
+                    filters += (LovedFlags.SKIPPED,)
+                request += " ORDER BY tracks.album_id, discnumber,\
+                             tracknumber, tracks.name"
+                rows += list(sql.execute(request, filters))
+        return rows
+
+    def get_artist_ids_for_ids(self, album_ids):
+        """
+            Get album artist ids for album ids
+            @param album_ids as [int]
+            @return {int: [int]}
+        """
+        artist_ids = {album_id: [] for album_id in album_ids}
+        with SqlCursor(self.__db) as sql:
+            for i in range(0, len(album_ids), self.__CHUNK_SIZE):
+                chunk = album_ids[i:i + self.__CHUNK_SIZE]
+                result = sql.execute("SELECT album_id, artist_id\
+                                      FROM album_artists\
+                                      WHERE album_id IN (%s)" %
+                                     ", ".join(["?"] * len(chunk)), chunk)
+                for (album_id, artist_id) in result:
+                    artist_ids[album_id].append(artist_id)
+        return artist_ids
+
     def get_tracks_count(self, album_id, genre_ids, artist_ids):
         """
             Get tracks count for album
@@ -1067,16 +1188,19 @@ class AlbumsDatabase:
                      albums.name\
                      COLLATE NOCASE COLLATE LOCALIZED"
 
+        storage_type_subrequest = make_storage_type_subrequest(
+            storage_type, "albums.storage_type")
         with SqlCursor(self.__db) as sql:
             result = []
             # Get albums for all artists
             if not artist_ids and not genre_ids:
-                filters = (storage_type,)
+                filters = ()
                 request = "SELECT DISTINCT albums.rowid\
                            FROM albums, album_artists, artists\
                            WHERE albums.rowid = album_artists.album_id AND\
-                           albums.storage_type & ? AND\
-                           artists.rowid = album_artists.artist_id"
+                           %s AND\
+                           artists.rowid = album_artists.artist_id" %\
+                    storage_type_subrequest
                 if not skipped:
                     request += " AND not albums.loved & ?"
                     filters += (LovedFlags.SKIPPED,)
@@ -1084,14 +1208,14 @@ class AlbumsDatabase:
                 result = sql.execute(request, filters)
             # Get albums for genres
             elif not artist_ids:
-                filters = (storage_type,)
-                filters += tuple(genre_ids)
+                filters = tuple(genre_ids)
                 request = "SELECT DISTINCT albums.rowid FROM albums,\
                            album_genres, album_artists, artists\
                            WHERE albums.rowid = album_artists.album_id AND\
                            artists.rowid = album_artists.artist_id AND\
-                           albums.storage_type & ? AND\
-                           album_genres.album_id=albums.rowid AND"
+                           %s AND\
+                           album_genres.album_id=albums.rowid AND" %\
+                    storage_type_subrequest
                 request += make_subrequest("album_genres.genre_id=?",
                                            "OR",
                                            len(genre_ids))
@@ -1102,13 +1226,13 @@ class AlbumsDatabase:
                 result = sql.execute(request, filters)
             # Get albums for artist
             elif not genre_ids:
-                filters = (storage_type,)
-                filters += tuple(artist_ids)
+                filters = tuple(artist_ids)
                 request = "SELECT DISTINCT albums.rowid\
                            FROM albums, album_artists, artists\
                            WHERE album_artists.album_id=albums.rowid AND\
-                           albums.storage_type & ? AND\
-                           artists.rowid = album_artists.artist_id AND"
+                           %s AND\
+                           artists.rowid = album_artists.artist_id AND" %\
+                    storage_type_subrequest
                 request += make_subrequest("artists.rowid=?",
                                            "OR",
                                            len(artist_ids))
@@ -1119,15 +1243,15 @@ class AlbumsDatabase:
                 result = sql.execute(request, filters)
             # Get albums for artist id and genre id
             else:
-                filters = (storage_type,)
-                filters += tuple(artist_ids)
+                filters = tuple(artist_ids)
                 filters += tuple(genre_ids)
                 request = "SELECT DISTINCT albums.rowid\
                            FROM albums, album_genres, album_artists, artists\
                            WHERE album_genres.album_id=albums.rowid AND\
                            artists.rowid = album_artists.artist_id AND\
-                           albums.storage_type & ? AND\
-                           album_artists.album_id=albums.rowid AND"
+                           %s AND\
+                           album_artists.album_id=albums.rowid AND" %\
+                    storage_type_subrequest
                 request += make_subrequest("artists.rowid=?",
                                            "OR",
                                            len(artist_ids))
@@ -1151,17 +1275,20 @@ class AlbumsDatabase:
             @return [int]
         """
         genre_ids = remove_static(genre_ids)
+        storage_type_subrequest = make_storage_type_subrequest(
+            storage_type, "albums.storage_type")
         with SqlCursor(self.__db) as sql:
             order = " ORDER BY albums.name, albums.timestamp"
             result = []
             # Get all compilations
             if not genre_ids:
-                filters = (storage_type, Type.COMPILATIONS)
+                filters = (Type.COMPILATIONS,)
                 request = "SELECT DISTINCT albums.rowid\
                            FROM albums, album_artists\
-                           WHERE albums.storage_type & ?\
+                           WHERE %s\
                            AND album_artists.artist_id=?\
-                           AND album_artists.album_id=albums.rowid"
+                           AND album_artists.album_id=albums.rowid" %\
+                    storage_type_subrequest
                 if not skipped:
                     request += " AND not albums.loved & ?"
                     filters += (LovedFlags.SKIPPED,)
@@ -1169,14 +1296,15 @@ class AlbumsDatabase:
                 result = sql.execute(request, filters)
             # Get compilation for genre id
             else:
-                filters = (storage_type, Type.COMPILATIONS)
+                filters = (Type.COMPILATIONS,)
                 filters += tuple(genre_ids)
                 request = "SELECT DISTINCT albums.rowid\
                            FROM albums, album_genres, album_artists\
                            WHERE album_genres.album_id=albums.rowid\
-                           AND albums.storage_type & ?\
+                           AND %s\
                            AND album_artists.album_id=albums.rowid\
-                           AND album_artists.artist_id=? AND"
+                           AND album_artists.artist_id=? AND" %\
+                    storage_type_subrequest
                 request += make_subrequest("album_genres.genre_id=?",
                                            "OR",
                                            len(genre_ids))
@@ -1273,9 +1401,11 @@ class AlbumsDatabase:
             @return album ids as [int]
         """
         with SqlCursor(self.__db) as sql:
-            filters = (storage_type,)
+            filters = ()
             request = "SELECT album_id FROM tracks, albums\
-                       WHERE albums.storage_type & ? AND albums.rowid=album_id"
+                       WHERE %s AND albums.rowid=album_id" %\
+                make_storage_type_subrequest(storage_type,
+                                             "albums.storage_type")
             if not skipped:
                 request += " AND not albums.loved & ?"
                 filters += (LovedFlags.SKIPPED,)
@@ -1285,18 +1415,31 @@ class AlbumsDatabase:
             result = sql.execute(request, filters)
             return list(itertools.chain(*result))
 
-    def search(self, searched, storage_type):
+    def search(self, searched, storage_type, words=None, limit=25):
         """
-            Search for albums looking like string
+            Search for albums looking like searched or any of words
+            Albums matching more words come first, then albums starting
+            with searched
             @param searched as str without accents
             @param storage_type as StorageType
-            @return album ids as [int]
+            @param words as [str] without accents
+            @param limit as int
+            @return [(int, str)]
         """
+        terms = [searched] + [word for word in words or []
+                              if word != searched]
         with SqlCursor(self.__db) as sql:
-            filters = ("%" + searched + "%", storage_type)
+            filters = tuple(["%" + term + "%" for term in terms]) * 2
+            filters += (searched + "%", limit)
             request = "SELECT rowid, name FROM albums\
-                       WHERE noaccents(name) LIKE ?\
-                       AND albums.storage_type & ? LIMIT 25"
+                       WHERE %s AND %s\
+                       ORDER BY %s DESC, noaccents(name) LIKE ? DESC\
+                       LIMIT ?" % (
+                make_subrequest("noaccents(name) LIKE ?", "OR", len(terms)),
+                make_storage_type_subrequest(storage_type,
+                                             "albums.storage_type"),
+                make_subrequest("(noaccents(name) LIKE ?)", "+",
+                                len(terms)))
             result = sql.execute(request, filters)
             return list(result)
 
@@ -1347,9 +1490,9 @@ class AlbumsDatabase:
         """
         with SqlCursor(self.__db) as sql:
             result = sql.execute("SELECT COUNT(1) FROM albums\
-                                  WHERE storage_type & ?",
-                                 ((StorageType.COLLECTION |
-                                   StorageType.SAVED,)))
+                                  WHERE %s" % make_storage_type_subrequest(
+                                      StorageType.COLLECTION |
+                                      StorageType.SAVED))
             v = result.fetchone()
             if v is not None:
                 return v[0]
@@ -1364,10 +1507,11 @@ class AlbumsDatabase:
             StorageType.COLLECTION | StorageType.EXTERNAL
         with SqlCursor(self.__db, commit) as sql:
             sql.execute("DELETE FROM albums WHERE\
-                         albums.storage_type&? AND\
+                         %s AND\
                          albums.rowid NOT IN (\
-                            SELECT tracks.album_id FROM tracks)",
-                        (storage_type,))
+                            SELECT tracks.album_id FROM tracks)" %
+                        make_storage_type_subrequest(storage_type,
+                                                     "albums.storage_type"))
             sql.execute("DELETE FROM album_genres\
                          WHERE album_genres.album_id NOT IN (\
                             SELECT albums.rowid FROM albums)")
@@ -1377,11 +1521,10 @@ class AlbumsDatabase:
             sql.execute("DELETE FROM albums_timed_popularity\
                          WHERE albums_timed_popularity.album_id NOT IN (\
                             SELECT albums.rowid FROM albums)")
-            # We clear timed popularity based on mtime
-            # For now, we don't need to keep more data than a month
-            month = int(time()) - 2678400
-            sql.execute("DELETE FROM albums_timed_popularity\
-                         WHERE albums_timed_popularity.mtime < ?", (month,))
+            sql.execute("DELETE FROM albums_moment_popularity\
+                         WHERE albums_moment_popularity.album_id NOT IN (\
+                            SELECT albums.rowid FROM albums)")
+            self.__compact_timed_popularity(sql)
 
     @property
     def max_count(self):
@@ -1408,3 +1551,32 @@ class AlbumsDatabase:
 #######################
 # PRIVATE             #
 #######################
+    def __compact_timed_popularity(self, sql):
+        """
+            Keep timed popularity tables bounded:
+            - daily buckets older than a week are rolled up in weekly buckets
+            - buckets older than a month are removed
+            - popularities at the moment decayed under 1/1024 are removed
+            @param sql as sqlite cursor
+        """
+        now = int(time())
+        month = now - self.TIMED_POPULARITY_MAX_AGE
+        sql.execute("DELETE FROM albums_timed_popularity\
+                     WHERE albums_timed_popularity.mtime < ?", (month,))
+        week = now - self.TIMED_POPULARITY_WEEK
+        result = sql.execute("SELECT album_id, mtime - mtime % ?,\
+                                     SUM(popularity)\
+                              FROM albums_timed_popularity\
+                              WHERE mtime < ?\
+                              GROUP BY album_id, mtime - mtime % ?",
+                             (self.TIMED_POPULARITY_WEEK, week,
+                              self.TIMED_POPULARITY_WEEK))
+        buckets = list(result)
+        sql.execute("DELETE FROM albums_timed_popularity\
+                     WHERE mtime < ?", (week,))
+        sql.executemany("INSERT INTO albums_timed_popularity\
+                         (album_id, mtime, popularity)\
+                         VALUES (?, ?, ?)", buckets)
+        sql.execute("DELETE FROM albums_moment_popularity\
+                     WHERE score < ?",
+                    (now / self.MOMENT_HALF_LIFE - 10,))
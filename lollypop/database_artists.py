@@ -17,6 +17,7 @@ from lollypop.sqlcursor import SqlCursor
 from lollypop.define import App, Type, StorageType, OrderBy, LovedFlags
 from lollypop.utils import get_default_storage_type, make_subrequest
 from lollypop.utils import format_artist_name, remove_static
+from lollypop.utils import make_storage_type_subrequest
 
 
 class ArtistsDatabase:
@@ -184,8 +185,9 @@ class ArtistsDatabase:
                        FROM album_artists, albums\
                        WHERE albums.rowid=album_artists.album_id\
                        AND album_artists.artist_id=?\
-                       AND albums.storage_type & ?"
-            result = sql.execute(request, (artist_id, storage_type))
+                       AND %s" % make_storage_type_subrequest(
+                           storage_type, "albums.storage_type")
+            result = sql.execute(request, (artist_id,))
             return len(list(itertools.chain(*result))) != 0
 
     def get(self, genre_ids, storage_type):
@@ -200,6 +202,8 @@ class ArtistsDatabase:
             select = "artists.rowid, artists.sortname, artists.sortname"
         else:
             select = "artists.rowid, artists.name, artists.sortname"
+        storage_type_subrequest = make_storage_type_subrequest(
+            storage_type, "albums.storage_type")
         with SqlCursor(self.__db) as sql:
             result = []
             if not genre_ids or genre_ids[0] == Type.ALL:
@@ -208,25 +212,25 @@ class ArtistsDatabase:
                     "SELECT DISTINCT %s FROM artists, albums, album_artists\
                                   WHERE album_artists.artist_id=artists.rowid\
                                   AND album_artists.album_id=albums.rowid\
-                                  AND albums.storage_type & ?\
+                                  AND %s\
                                   ORDER BY artists.sortname\
-                                  COLLATE NOCASE COLLATE LOCALIZED" % select,
-                    (storage_type,))
+                                  COLLATE NOCASE COLLATE LOCALIZED" %
+                    (select, storage_type_subrequest))
             else:
-                filters = (storage_type,)
-                filters += tuple(genre_ids)
+                filters = tuple(genre_ids)
                 request = "SELECT DISTINCT %s\
                            FROM artists, albums, album_genres, album_artists\
                            WHERE artists.rowid=album_artists.artist_id\
                            AND albums.rowid=album_artists.album_id\
-                           AND albums.storage_type & ?\
+                           AND %s\
                            AND album_genres.album_id=albums.rowid AND"
                 request += make_subrequest("album_genres.genre_id=?",
                                            "OR",
                                            len(genre_ids))
                 request += " ORDER BY artists.sortname\
                             COLLATE NOCASE COLLATE LOCALIZED"
-                result = sql.execute(request % select, filters)
+                result = sql.execute(
+                    request % (select, storage_type_subrequest), filters)
             return [(row[0], row[1], row[2]) for row in result]
 
     def get_randoms(self, limit, storage_type):
@@ -242,12 +246,13 @@ class ArtistsDatabase:
                                   FROM artists, albums, album_artists\
                                   WHERE album_artists.artist_id=artists.rowid\
                                   AND album_artists.album_id=albums.rowid\
-                                  AND albums.storage_type & ?\
+                                  AND %s\
                                   AND not albums.loved & ?\
                                   ORDER BY random() LIMIT ?\
-                                  COLLATE NOCASE COLLATE LOCALIZED"
-            result = sql.execute(
-                request, (storage_type, LovedFlags.SKIPPED, limit))
+                                  COLLATE NOCASE COLLATE LOCALIZED" %\
+                make_storage_type_subrequest(storage_type,
+                                             "albums.storage_type")
+            result = sql.execute(request, (LovedFlags.SKIPPED, limit))
             return [(row[0], row[1], row[2]) for row in result]
 
     def get_ids(self, genre_ids, storage_type):
@@ -257,6 +262,8 @@ class ArtistsDatabase:
             @param storage_type as StorageType
             @return artist ids as [int]
         """
+        storage_type_subrequest = make_storage_type_subrequest(
+            storage_type, "albums.storage_type")
         with SqlCursor(self.__db) as sql:
             result = []
             if not genre_ids or genre_ids[0] == Type.ALL:
@@ -266,19 +273,19 @@ class ArtistsDatabase:
                                   FROM artists, albums, album_artists\
                                   WHERE album_artists.artist_id=artists.rowid\
                                   AND album_artists.album_id=albums.rowid\
-                                  AND albums.storage_type & ?\
+                                  AND %s\
                                   ORDER BY artists.sortname\
-                                  COLLATE NOCASE COLLATE LOCALIZED",
-                    (storage_type,))
+                                  COLLATE NOCASE COLLATE LOCALIZED" %
+                    storage_type_subrequest)
             else:
-                filters = (storage_type,)
-                filters += tuple(genre_ids)
+                filters = tuple(genre_ids)
                 request = "SELECT DISTINCT artists.rowid\
                            FROM artists, albums, album_genres, album_artists\
                            WHERE artists.rowid=album_artists.artist_id\
-                           AND albums.storage_type & ?\
+                           AND %s\
                            AND albums.rowid=album_artists.album_id\
-                           AND album_genres.album_id=albums.rowid AND"
+                           AND album_genres.album_id=albums.rowid AND" %\
+                    storage_type_subrequest
                 request += make_subrequest("album_genres.genre_id=?",
                                            "OR",
                                            len(genre_ids))
@@ -295,13 +302,14 @@ class ArtistsDatabase:
             @return genre ids as [int]
         """
         with SqlCursor(self.__db) as sql:
-            filters = (storage_type,)
-            filters += tuple(artist_ids)
+            filters = tuple(artist_ids)
             request = "SELECT DISTINCT album_genres.genre_id\
                        FROM artists, album_genres, album_artists, albums\
                        WHERE album_artists.album_id=album_genres.album_id\
-                       AND albums.storage_type & ?\
-                       AND albums.rowid=album_artists.album_id AND"
+                       AND %s\
+                       AND albums.rowid=album_artists.album_id AND" %\
+                make_storage_type_subrequest(storage_type,
+                                             "albums.storage_type")
             request += make_subrequest("album_artists.artist_id=?",
                                        "OR",
                                        len(artist_ids))
@@ -364,10 +372,12 @@ class ArtistsDatabase:
         with SqlCursor(self.__db) as sql:
             request = "SELECT DISTINCT featuring.album_id\
                        FROM featuring, album_genres, albums, artists\
-                       WHERE albums.storage_type&? AND\
+                       WHERE %s AND\
                              artists.rowid=featuring.artist_id AND\
-                             albums.rowid=featuring.album_id AND "
-            filters = (storage_type,)
+                             albums.rowid=featuring.album_id AND " %\
+                make_storage_type_subrequest(storage_type,
+                                             "albums.storage_type")
+            filters = ()
             if artist_ids:
                 filters += tuple(artist_ids)
                 request += make_subrequest("featuring.artist_id=?",
@@ -399,21 +409,36 @@ class ArtistsDatabase:
                 return bool(v[0])
             return False
 
-    def search(self, searched, storage_type):
+    def search(self, searched, storage_type, words=None, limit=25):
         """
-            Search for artists looking like searched
+            Search for artists looking like searched or any of words
+            Artists matching more words come first, then artists starting
+            with searched
             @param searched as str without accents
             @param storage_type as StorageType
-            @return artist ids as [int]
+            @param words as [str] without accents
+            @param limit as int
+            @return [(int, str)]
         """
+        terms = [searched] + [word for word in words or []
+                              if word != searched]
         with SqlCursor(self.__db) as sql:
-            filters = ("%" + searched + "%", storage_type)
+            filters = tuple(["%" + term + "%" for term in terms]) * 2
+            filters += (searched + "%", limit)
             request = "SELECT DISTINCT artists.rowid, artists.name\
                    FROM albums, album_artists, artists\
                    WHERE album_artists.artist_id=artists.rowid AND\
                    album_artists.album_id=albums.rowid AND\
-                   noaccents(artists.name) LIKE ? AND\
-                   albums.storage_type & ? LIMIT 25"
+                   %s AND %s\
+                   ORDER BY %s DESC,\
+                   noaccents(artists.name) LIKE ? DESC\
+                   LIMIT ?" % (
+                make_subrequest("noaccents(artists.name) LIKE ?",
+                                "OR", len(terms)),
+                make_storage_type_subrequest(storage_type,
+                                             "albums.storage_type"),
+                make_subrequest("(noaccents(artists.name) LIKE ?)", "+",
+                                len(terms)))
             result = sql.execute(request, filters)
             return list(result)
 
@@ -427,8 +452,10 @@ class ArtistsDatabase:
                                   FROM artists, album_artists, albums\
                                   WHERE album_artists.album_id=albums.rowid\
                                   AND artists.rowid=album_artists.artist_id\
-                                  AND albums.storage_type & ?",
-                                 (StorageType.COLLECTION | StorageType.SAVED,))
+                                  AND %s" % make_storage_type_subrequest(
+                                      StorageType.COLLECTION |
+                                      StorageType.SAVED,
+                                      "albums.storage_type"))
             v = result.fetchone()
             if v is not None:
                 return v[0]
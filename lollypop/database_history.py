@@ -24,8 +24,8 @@ class History:
     """
     __LOCAL_PATH = GLib.get_user_data_dir() + "/lollypop"
     __DB_PATH = "%s/history.db" % __LOCAL_PATH
-    __LIMIT = 1000000  # Delete when limit is reached
-    __DELETE = 100     # How many elements to delete
+    # Max SQL variables in a request
+    __BATCH = 500
     __create_history = """CREATE TABLE history (
                             id INTEGER PRIMARY KEY,
                             name TEXT NOT NULL,
@@ -39,6 +39,8 @@ class History:
                             album_loved INT NOT NULL,
                             album_synced INT NOT NULL,
                             album_popularity INT NOT NULL)"""
+    __create_history_idx = """CREATE INDEX IF NOT EXISTS idx_hnd ON history(
+                                                name, duration)"""
 
     def __init__(self):
         """
@@ -52,15 +54,7 @@ class History:
         except:
             pass
         with SqlCursor(self, True) as sql:
-            result = sql.execute("SELECT COUNT(*)\
-                                  FROM history")
-            v = result.fetchone()
-            if v is not None and v[0] > self.__LIMIT:
-                sql.execute("DELETE FROM history\
-                             WHERE rowid IN (SELECT rowid\
-                                             FROM history\
-                                             LIMIT %s)" % self.__DELETE)
-                sql.execute("VACUUM")
+            sql.execute(self.__create_history_idx)
 
     def add(self, name, duration, popularity, rate, ltime, mtime, loved,
             album_loved, album_popularity, album_rate, album_synced):
@@ -83,25 +77,18 @@ class History:
             # Needed because of seconds to ms DB migration
             # Value in DB is rounded version of Gstreamer value
             duration //= 1000
-            if self.exists(name, duration):
-                sql.execute("UPDATE history\
-                             SET popularity=?,rate=?,ltime=?,mtime=?,loved=?,\
-                             album_loved=?,album_popularity=?,album_rate=?,\
-                             album_synced=?\
-                             WHERE name=? AND duration=?",
-                            (popularity, rate, ltime, mtime, loved,
-                             album_loved, album_popularity, album_rate,
-                             album_synced,
-                             name, duration))
-            else:
-                sql.execute("INSERT INTO history\
-                             (name, duration, popularity, rate, ltime, mtime,\
-                             loved, album_loved, album_popularity, album_rate,\
-                             album_synced)\
-                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                            (name, duration, popularity, rate, ltime, mtime,
-                             loved, album_loved, album_popularity, album_rate,
-                             album_synced))
+            # Always insert a new row: rowid order is then the LRU order
+            # used by trim()
+            sql.execute("DELETE FROM history WHERE name=? AND duration=?",
+                        (name, duration))
+            sql.execute("INSERT INTO history\
+                         (name, duration, popularity, rate, ltime, mtime,\
+                         loved, album_loved, album_popularity, album_rate,\
+                         album_synced)\
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (name, duration, popularity, rate, ltime, mtime,
+                         loved, album_loved, album_popularity, album_rate,
+                         album_synced))
 
     def get(self, name, duration):
         """
@@ -126,6 +113,41 @@ class History:
                 return v
             return (0, 0, 0, 0, 0, 0, 0, 0, 0)
 
+    def get_many(self, names):
+        """
+            Get stats for all tracks with names, one request per batch
+            @param names as [str]
+            @return {(name as str, duration as int): stats}
+            with duration in seconds and stats as returned by get()
+        """
+        stats = {}
+        names = list(set(names))
+        with SqlCursor(self) as sql:
+            for i in range(0, len(names), self.__BATCH):
+                batch = names[i:i + self.__BATCH]
+                result = sql.execute("SELECT name, duration,\
+                                      popularity, rate, ltime, mtime,\
+                                      loved, album_loved, album_popularity,\
+                                      album_rate, album_synced\
+                                      FROM history\
+                                      WHERE name IN (%s)" %
+                                     ", ".join(["?"] * len(batch)),
+                                     batch)
+                for row in result:
+                    stats[(row[0], row[1])] = row[2:]
+        return stats
+
+    def trim(self, size):
+        """
+            Remove least recently added entries, keeping size entries
+            @param size as int
+        """
+        with SqlCursor(self, True) as sql:
+            sql.execute("DELETE FROM history\
+                         WHERE rowid <= (SELECT rowid FROM history\
+                                         ORDER BY rowid DESC\
+                                         LIMIT 1 OFFSET ?)", (size,))
+
     def exists(self, name, duration):
         """
             Return True if entry exists
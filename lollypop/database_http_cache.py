@@ -0,0 +1,282 @@
+# Copyright (c) 2014-2021 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from gi.repository import Gio
+
+import sqlite3
+import json
+from threading import Lock
+from time import time
+from urllib.parse import urlparse, parse_qsl, urlencode
+
+from lollypop.define import CACHE_PATH
+from lollypop.sqlcursor import SqlCursor
+from lollypop.logger import Logger
+
+
+class HttpCacheDatabase:
+    """
+        Cache metadata providers responses into database
+        Responses are kept for a provider TTL then revalidated with
+        ETag/Last-Modified, not found and empty responses are kept less
+    """
+    DB_PATH = "%s/http_cache_v1.db" % CACHE_PATH
+
+    # Cache lifetime for each provider host in seconds
+    __TTLS = {
+        "musicbrainz.org": 30 * 86400,
+        "theaudiodb.com": 30 * 86400,
+        "webservice.fanart.tv": 30 * 86400,
+        "api.deezer.com": 7 * 86400,
+        "ws.audioscrobbler.com": 7 * 86400,
+        "itunes.apple.com": 7 * 86400,
+        "api.jamendo.com": 7 * 86400,
+        "wikipedia.org": 7 * 86400,
+        "api.spotify.com": 86400
+    }
+    # Cache lifetime for not found and empty responses
+    __NEGATIVE_TTL = 86400
+    # Never cache authenticated or user related requests
+    __PRIVATE_PARAMS = ["api_sig", "sk", "token", "session"]
+    __PRIVATE_METHODS = ["auth.", "user."]
+    __MAX_SIZE = 32 << 20
+    # Check size every N writes
+    __EVICT_INTERVAL = 100
+    # Do not update access time more than once in this delay
+    __ATIME_DELAY = 3600
+
+    __create_responses = """CREATE TABLE responses (
+                            key TEXT PRIMARY KEY,
+                            status INT NOT NULL,
+                            etag TEXT,
+                            last_modified TEXT,
+                            expires INT NOT NULL,
+                            atime INT NOT NULL,
+                            size INT NOT NULL,
+                            data BLOB NOT NULL)"""
+    __create_responses_idx = """CREATE INDEX IF NOT EXISTS idx_atime
+                                ON responses(atime)"""
+
+    def __init__(self):
+        """
+            Create database tables
+        """
+        self.thread_lock = Lock()
+        self.__writes = 0
+        f = Gio.File.new_for_path(self.DB_PATH)
+        if not f.query_exists():
+            try:
+                d = Gio.File.new_for_path(CACHE_PATH)
+                if not d.query_exists():
+                    d.make_directory_with_parents()
+                # Create db schema
+                with SqlCursor(self, True) as sql:
+                    sql.execute(self.__create_responses)
+                    sql.execute(self.__create_responses_idx)
+            except Exception as e:
+                Logger.error("HttpCacheDatabase::__init__(): %s" % e)
+
+    def get_ttl(self, uri):
+        """
+            Get cache lifetime for uri
+            @param uri as str
+            @return int => 0 if uri should not be cached
+        """
+        parsed = urlparse(uri)
+        host = parsed.netloc.lower()
+        ttl = 0
+        for (domain, value) in self.__TTLS.items():
+            if host == domain or host.endswith("." + domain):
+                ttl = value
+                break
+        if ttl == 0:
+            return 0
+        for (key, value) in parse_qsl(parsed.query):
+            if key in self.__PRIVATE_PARAMS:
+                return 0
+            if key == "method":
+                for method in self.__PRIVATE_METHODS:
+                    if value.startswith(method):
+                        return 0
+        return ttl
+
+    def get_key(self, uri, headers):
+        """
+            Get normalized cache key for request
+            @param uri as str
+            @param headers as [(str, str)]
+            @return str
+        """
+        parsed = urlparse(uri)
+        query = urlencode(sorted(parse_qsl(parsed.query,
+                                           keep_blank_values=True)))
+        key = "%s://%s%s?%s" % (parsed.scheme.lower(),
+                                parsed.netloc.lower(),
+                                parsed.path or "/",
+                                query)
+        # Tokens change, response does not
+        for (name, value) in sorted(headers):
+            if name.lower() != "authorization":
+                key += "\n%s: %s" % (name.lower(), value)
+        return key
+
+    def get_negative_ttl(self, status, data):
+        """
+            Get cache lifetime for a not found or empty response
+            @param status as int
+            @param data as bytes
+            @return int => 0 if response is not negative
+        """
+        if status == 404 or self.__is_empty(data):
+            return self.__NEGATIVE_TTL
+        return 0
+
+    def get(self, key):
+        """
+            Get cached response
+            @param key as str
+            @return (status as int, etag as str, last_modified as str,
+                     expires as int, data as bytes)/None
+        """
+        try:
+            with SqlCursor(self) as sql:
+                result = sql.execute("SELECT status, etag, last_modified,\
+                                      expires, atime, data\
+                                      FROM responses\
+                                      WHERE key=?", (key,))
+                v = result.fetchone()
+            if v is None:
+                return None
+            (status, etag, last_modified, expires, atime, data) = v
+            now = int(time())
+            if atime + self.__ATIME_DELAY < now:
+                with SqlCursor(self, True) as sql:
+                    sql.execute("UPDATE responses SET atime=?\
+                                 WHERE key=?", (now, key))
+            return (status, etag, last_modified, expires, bytes(data))
+        except Exception as e:
+            Logger.error("HttpCacheDatabase::get(): %s", e)
+        return None
+
+    def set(self, key, status, etag, last_modified, ttl, data):
+        """
+            Cache response
+            @param key as str
+            @param status as int
+            @param etag as str/None
+            @param last_modified as str/None
+            @param ttl as int
+            @param data as bytes
+        """
+        try:
+            now = int(time())
+            with SqlCursor(self, True) as sql:
+                sql.execute("INSERT OR REPLACE INTO responses\
+                             (key, status, etag, last_modified,\
+                              expires, atime, size, data)\
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (key, status, etag, last_modified,
+                             now + ttl, now, len(data), data))
+            self.__writes += 1
+            if self.__writes % self.__EVICT_INTERVAL == 0:
+                self.__evict()
+        except Exception as e:
+            Logger.error("HttpCacheDatabase::set(): %s", e)
+
+    def refresh(self, key, ttl):
+        """
+            Mark cached response as valid for ttl
+            @param key as str
+            @param ttl as int
+        """
+        try:
+            now = int(time())
+            with SqlCursor(self, True) as sql:
+                sql.execute("UPDATE responses SET expires=?, atime=?\
+                             WHERE key=?", (now + ttl, now, key))
+        except Exception as e:
+            Logger.error("HttpCacheDatabase::refresh(): %s", e)
+
+    def clean(self):
+        """
+            Remove expired responses that can't be revalidated
+            and evict least recently used responses
+        """
+        try:
+            with SqlCursor(self, True) as sql:
+                sql.execute("DELETE FROM responses\
+                             WHERE expires<? AND etag IS NULL\
+                             AND last_modified IS NULL", (int(time()),))
+            self.__evict()
+        except Exception as e:
+            Logger.error("HttpCacheDatabase::clean(): %s", e)
+
+    def get_cursor(self):
+        """
+            Return a new sqlite cursor
+        """
+        try:
+            c = sqlite3.connect(self.DB_PATH, 600.0)
+            return c
+        except:
+            exit(-1)
+
+#######################
+# PRIVATE             #
+#######################
+    def __evict(self):
+        """
+            Remove least recently used responses until size is under 3/4
+            of max size
+        """
+        with SqlCursor(self, True) as sql:
+            result = sql.execute("SELECT SUM(size) FROM responses")
+            size = result.fetchone()[0] or 0
+            if size <= self.__MAX_SIZE:
+                return
+            result = sql.execute("SELECT key, size FROM responses\
+                                  ORDER BY atime")
+            keys = []
+            for (key, key_size) in result.fetchall():
+                if size <= self.__MAX_SIZE * 3 // 4:
+                    break
+                keys.append((key,))
+                size -= key_size
+            sql.executemany("DELETE FROM responses WHERE key=?", keys)
+        Logger.info("HttpCacheDatabase: %s responses evicted", len(keys))
+
+    def __is_empty(self, data):
+        """
+            True if response has no result
+            Any JSON without a non empty list while having lists or
+            null values is an empty result
+            @param data as bytes
+            @return bool
+        """
+        if not data or not data.strip():
+            return True
+        try:
+            content = json.loads(data.decode("utf-8"))
+        except:
+            return False
+        if content in [None, [], {}]:
+            return True
+        values = []
+
+        def collect(value):
+            if isinstance(value, dict):
+                for child in value.values():
+                    collect(child)
+            elif isinstance(value, list) or value is None:
+                values.append(value)
+        collect(content)
+        return len(values) > 0 and not any(values)
@@ -0,0 +1,236 @@
+# Copyright (c) 2014-2021 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import itertools
+from threading import Lock
+
+from lollypop.sqlcursor import SqlCursor
+from lollypop.define import LovedFlags
+from lollypop.logger import Logger
+from lollypop.utils import make_storage_type_subrequest
+
+
+class ListensDatabase:
+    """
+        Append only listening events log, written by batch
+        Time windows are [start, end[ timestamps, end=None means now
+    """
+
+    # Pending listens are written to DB by batch
+    BATCH_SIZE = 10
+    # Views showing current listening habits use this window
+    MOMENT_WINDOW = 30 * 86400
+
+    def __init__(self, db):
+        """
+            Init listens database object
+            @param db as Database
+        """
+        self.__db = db
+        self.__pending = []
+        self.__lock = Lock()
+
+    def add(self, track_id, album_id, timestamp, played_ms, skipped):
+        """
+            Add a listening event, written on next batch
+            @param track_id as int
+            @param album_id as int
+            @param timestamp as int
+            @param played_ms as int
+            @param skipped as bool
+        """
+        with self.__lock:
+            self.__pending.append((track_id, album_id, timestamp,
+                                   played_ms, skipped))
+            if len(self.__pending) < self.BATCH_SIZE:
+                return
+        self.flush()
+
+    def flush(self):
+        """
+            Write pending listening events to DB
+        """
+        with self.__lock:
+            pending = self.__pending
+            self.__pending = []
+        if not pending:
+            return
+        try:
+            with SqlCursor(self.__db, True) as sql:
+                sql.executemany("INSERT INTO listens\
+                                 (track_id, album_id, timestamp,\
+                                  played_ms, skipped)\
+                                 VALUES (?, ?, ?, ?, ?)", pending)
+        except Exception as e:
+            Logger.error("ListensDatabase::flush(): %s", e)
+            # Database is locked, retry on next batch
+            with self.__lock:
+                self.__pending = pending + self.__pending
+
+    def get_track_ids(self, storage_type, skipped, limit, start, end=None):
+        """
+            Get most listened tracks in time window
+            @param storage_type as StorageType
+            @param skipped as bool
+            @param limit as int
+            @param start as int
+            @param end as int/None
+            @return [(track id as int, count as int)]
+        """
+        (where, filters) = self.__get_window(start, end, skipped, "tracks")
+        with SqlCursor(self.__db) as sql:
+            request = "SELECT listens.track_id, COUNT(*) FROM listens, tracks\
+                       WHERE %s AND tracks.rowid=listens.track_id AND %s\
+                       GROUP BY listens.track_id\
+                       ORDER BY COUNT(*) DESC LIMIT ?" % (
+                where, make_storage_type_subrequest(storage_type,
+                                                    "tracks.storage_type"))
+            result = sql.execute(request, filters + (limit,))
+            return list(result)
+
+    def get_album_ids(self, storage_type, skipped, limit, start, end=None):
+        """
+            Get most listened albums in time window
+            @param storage_type as StorageType
+            @param skipped as bool
+            @param limit as int
+            @param start as int
+            @param end as int/None
+            @return [(album id as int, count as int)]
+        """
+        (where, filters) = self.__get_window(start, end, skipped, "albums")
+        with SqlCursor(self.__db) as sql:
+            request = "SELECT listens.album_id, COUNT(*) FROM listens, albums\
+                       WHERE %s AND albums.rowid=listens.album_id AND %s\
+                       GROUP BY listens.album_id\
+                       ORDER BY COUNT(*) DESC LIMIT ?" % (
+                where, make_storage_type_subrequest(storage_type,
+                                                    "albums.storage_type"))
+            result = sql.execute(request, filters + (limit,))
+            return list(result)
+
+    def get_artist_ids(self, storage_type, skipped, limit, start, end=None):
+        """
+            Get most listened artists in time window
+            @param storage_type as StorageType
+            @param skipped as bool
+            @param limit as int
+            @param start as int
+            @param end as int/None
+            @return [(artist id as int, count as int)]
+        """
+        (where, filters) = self.__get_window(start, end, skipped, "tracks")
+        with SqlCursor(self.__db) as sql:
+            request = "SELECT track_artists.artist_id, COUNT(*)\
+                       FROM listens, tracks, track_artists\
+                       WHERE %s AND tracks.rowid=listens.track_id AND %s\
+                       AND track_artists.track_id=listens.track_id\
+                       GROUP BY track_artists.artist_id\
+                       ORDER BY COUNT(*) DESC LIMIT ?" % (
+                where, make_storage_type_subrequest(storage_type,
+                                                    "tracks.storage_type"))
+            result = sql.execute(request, filters + (limit,))
+            return list(result)
+
+    def get_genre_ids(self, storage_type, skipped, limit, start, end=None):
+        """
+            Get most listened genres in time window
+            @param storage_type as StorageType
+            @param skipped as bool
+            @param limit as int
+            @param start as int
+            @param end as int/None
+            @return [(genre id as int, count as int)]
+        """
+        (where, filters) = self.__get_window(start, end, skipped, "tracks")
+        with SqlCursor(self.__db) as sql:
+            request = "SELECT track_genres.genre_id, COUNT(*)\
+                       FROM listens, tracks, track_genres\
+                       WHERE %s AND tracks.rowid=listens.track_id AND %s\
+                       AND track_genres.track_id=listens.track_id\
+                       GROUP BY track_genres.genre_id\
+                       ORDER BY COUNT(*) DESC LIMIT ?" % (
+                where, make_storage_type_subrequest(storage_type,
+                                                    "tracks.storage_type"))
+            result = sql.execute(request, filters + (limit,))
+            return list(result)
+
+    def get_recent_album_ids(self, storage_type, skipped, limit,
+                             start=0, end=None):
+        """
+            Get albums ordered by last listen in time window
+            @param storage_type as StorageType
+            @param skipped as bool
+            @param limit as int
+            @param start as int
+            @param end as int/None
+            @return [int]
+        """
+        (where, filters) = self.__get_window(start, end, skipped, "albums")
+        with SqlCursor(self.__db) as sql:
+            request = "SELECT listens.album_id FROM listens, albums\
+                       WHERE %s AND albums.rowid=listens.album_id AND %s\
+                       GROUP BY listens.album_id\
+                       ORDER BY MAX(listens.timestamp) DESC LIMIT ?" % (
+                where, make_storage_type_subrequest(storage_type,
+                                                    "albums.storage_type"))
+            result = sql.execute(request, filters + (limit,))
+            return list(itertools.chain(*result))
+
+    def count(self, start, end=None):
+        """
+            Count listens in time window
+            @param start as int
+            @param end as int/None
+            @return int
+        """
+        (where, filters) = self.__get_window(start, end, True)
+        with SqlCursor(self.__db) as sql:
+            result = sql.execute("SELECT COUNT(*) FROM listens\
+                                  WHERE %s" % where, filters)
+            v = result.fetchone()
+            if v is not None:
+                return v[0]
+            return 0
+
+    def clean(self, commit=True):
+        """
+            Remove listens for removed tracks
+            @param commit as bool
+        """
+        with SqlCursor(self.__db, commit) as sql:
+            sql.execute("DELETE FROM listens\
+                         WHERE listens.track_id NOT IN (\
+                            SELECT tracks.rowid FROM tracks)")
+
+#######################
+# PRIVATE             #
+#######################
+    def __get_window(self, start, end, skipped, table=None):
+        """
+            Get SQL filter for listens in time window, skipped listens
+            are never counted
+            @param start as int
+            @param end as int/None
+            @param skipped as bool => allow items flagged as skipped
+            @param table as str/None => table holding loved flags
+            @return (str, tuple)
+        """
+        where = "listens.skipped=0 AND listens.timestamp >= ?"
+        filters = (start,)
+        if end is not None:
+            where += " AND listens.timestamp < ?"
+            filters += (end,)
+        if not skipped and table is not None:
+            where += " AND not %s.loved & ?" % table
+            filters += (LovedFlags.SKIPPED,)
+        return (where, filters)
@@ -0,0 +1,123 @@
+# Copyright (c) 2014-2021 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import sqlite3
+import json
+from threading import Lock
+
+from lollypop.sqlcursor import SqlCursor
+from lollypop.define import LOLLYPOP_DATA_PATH
+from lollypop.logger import Logger
+
+
+class ScrobblesDatabase:
+    """
+        Scrobbles waiting to be submitted, one queue per service
+        Kept out of collection DB so a collection reset does not lose them
+    """
+    __DB_PATH = "%s/scrobbles.db" % LOLLYPOP_DATA_PATH
+    __create_scrobbles = """CREATE TABLE IF NOT EXISTS scrobbles (
+                            id INTEGER PRIMARY KEY,
+                            service TEXT NOT NULL,
+                            timestamp INT NOT NULL,
+                            payload TEXT NOT NULL)"""
+    __create_scrobbles_idx = """CREATE INDEX IF NOT EXISTS idx_ss
+                                ON scrobbles(service, id)"""
+
+    def __init__(self):
+        """
+            Create database tables
+        """
+        self.thread_lock = Lock()
+        # Only one submitter for a service queue: {service: Lock}
+        self.__submit_locks = {}
+        try:
+            with SqlCursor(self, True) as sql:
+                sql.execute(self.__create_scrobbles)
+                sql.execute(self.__create_scrobbles_idx)
+        except Exception as e:
+            Logger.error("ScrobblesDatabase::__init__(): %s", e)
+
+    def add(self, service, scrobbles):
+        """
+            Queue scrobbles for service
+            @param service as str
+            @param scrobbles as [(timestamp as int, payload as {})]
+        """
+        try:
+            with SqlCursor(self, True) as sql:
+                sql.executemany("INSERT INTO scrobbles\
+                                 (service, timestamp, payload)\
+                                 VALUES (?, ?, ?)",
+                                [(service, timestamp, json.dumps(payload))
+                                 for (timestamp, payload) in scrobbles])
+        except Exception as e:
+            Logger.error("ScrobblesDatabase::add(): %s", e)
+
+    def get(self, service, limit):
+        """
+            Get oldest queued scrobbles for service
+            @param service as str
+            @param limit as int
+            @return [(id as int, timestamp as int, payload as {})]
+        """
+        with SqlCursor(self) as sql:
+            result = sql.execute("SELECT id, timestamp, payload\
+                                  FROM scrobbles\
+                                  WHERE service=?\
+                                  ORDER BY id LIMIT ?",
+                                 (service, limit))
+            return [(rowid, timestamp, json.loads(payload))
+                    for (rowid, timestamp, payload) in result]
+
+    def remove(self, scrobble_ids):
+        """
+            Remove submitted scrobbles
+            @param scrobble_ids as [int]
+        """
+        with SqlCursor(self, True) as sql:
+            sql.executemany("DELETE FROM scrobbles WHERE id=?",
+                            [(scrobble_id,) for scrobble_id in scrobble_ids])
+
+    def count(self, service):
+        """
+            Count queued scrobbles for service
+            @param service as str
+            @return int
+        """
+        with SqlCursor(self) as sql:
+            result = sql.execute("SELECT COUNT(*) FROM scrobbles\
+                                  WHERE service=?", (service,))
+            v = result.fetchone()
+            if v is not None:
+                return v[0]
+            return 0
+
+    def get_submit_lock(self, service):
+        """
+            Get lock to hold while submitting service queue
+            @param service as str
+            @return Lock
+        """
+        with self.thread_lock:
+            if service not in self.__submit_locks.keys():
+                self.__submit_locks[service] = Lock()
+            return self.__submit_locks[service]
+
+    def get_cursor(self):
+        """
+            Return a new sqlite cursor
+        """
+        try:
+            return sqlite3.connect(self.__DB_PATH, 600.0)
+        except:
+            exit(-1)
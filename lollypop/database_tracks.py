@@ -16,7 +16,9 @@ import itertools
 
 from lollypop.sqlcursor import SqlCursor
 from lollypop.define import App, StorageType, Type, LovedFlags
+from lollypop.define import AnalysisFlags
 from lollypop.utils import noaccents, make_subrequest
+from lollypop.utils import make_storage_type_subrequest
 
 
 class TracksDatabase:
@@ -107,9 +109,9 @@ class TracksDatabase:
             @return track ids as [int]
         """
         with SqlCursor(self.__db) as sql:
-            filters = (storage_type,)
+            filters = ()
             request = "SELECT rowid FROM tracks\
-                       WHERE storage_type & ?"
+                       WHERE %s" % make_storage_type_subrequest(storage_type)
             if not skipped:
                 request += " AND not loved &? "
                 filters += (LovedFlags.SKIPPED,)
@@ -174,6 +176,24 @@ class TracksDatabase:
                 return v[0]
             return ""
 
+    def get_metas(self, storage_type):
+        """
+            Get name, album Lollypop id, popularity and artists for tracks
+            @param storage_type as StorageType
+            @return [(int, str, str, int, str)]
+        """
+        with SqlCursor(self.__db) as sql:
+            request = "SELECT tracks.rowid, tracks.name, albums.lp_album_id,\
+                       tracks.popularity, GROUP_CONCAT(artists.name, ', ')\
+                       FROM tracks, albums, track_artists, artists\
+                       WHERE tracks.album_id=albums.rowid\
+                       AND track_artists.track_id=tracks.rowid\
+                       AND track_artists.artist_id=artists.rowid AND %s\
+                       GROUP BY tracks.rowid" % make_storage_type_subrequest(
+                storage_type, "tracks.storage_type")
+            result = sql.execute(request)
+            return list(result)
+
     def get_year(self, track_id):
         """
             Get track year
@@ -438,8 +458,9 @@ class TracksDatabase:
         with SqlCursor(self.__db) as sql:
             mtimes = {}
             result = sql.execute("SELECT DISTINCT uri, mtime\
-                                  FROM tracks WHERE storage_type & ?",
-                                 (StorageType.COLLECTION,))
+                                  FROM tracks WHERE %s" %
+                                 make_storage_type_subrequest(
+                                    StorageType.COLLECTION))
             for row in result:
                 mtimes.update((row,))
             return mtimes
@@ -459,8 +480,9 @@ class TracksDatabase:
             @param commit as bool
         """
         with SqlCursor(self.__db, commit) as sql:
-            sql.execute("DELETE FROM tracks WHERE storage_type & ?",
-                        (StorageType.EPHEMERAL | StorageType.EXTERNAL,))
+            sql.execute("DELETE FROM tracks WHERE %s" %
+                        make_storage_type_subrequest(
+                            StorageType.EPHEMERAL | StorageType.EXTERNAL))
 
     def del_persistent(self, commit=True):
         """
@@ -468,8 +490,8 @@ class TracksDatabase:
             @param commit as bool
         """
         with SqlCursor(self.__db, commit) as sql:
-            sql.execute("DELETE FROM tracks WHERE storage_type & ?",
-                        (StorageType.COLLECTION,))
+            sql.execute("DELETE FROM tracks WHERE %s" %
+                        make_storage_type_subrequest(StorageType.COLLECTION))
 
     def get_uris(self, uris_concerned=None):
         """
@@ -477,6 +499,8 @@ class TracksDatabase:
             @param uris_concerned as [uri as str]
             @return [str]
         """
+        storage_type_subrequest = make_storage_type_subrequest(
+            StorageType.COLLECTION)
         with SqlCursor(self.__db) as sql:
             uris = []
             if uris_concerned:
@@ -484,13 +508,12 @@ class TracksDatabase:
                     result = sql.execute("SELECT uri\
                                           FROM tracks\
                                           WHERE uri LIKE ? AND\
-                                          storage_type & ?",
-                                         (uri + "%", StorageType.COLLECTION))
+                                          %s" % storage_type_subrequest,
+                                         (uri + "%",))
                     uris += list(itertools.chain(*result))
             else:
                 result = sql.execute("SELECT uri FROM tracks\
-                                      WHERE  storage_type & ?",
-                                     (StorageType.COLLECTION,))
+                                      WHERE %s" % storage_type_subrequest)
                 uris = list(itertools.chain(*result))
             return uris
 
@@ -586,6 +609,102 @@ class TracksDatabase:
             sql.execute("UPDATE tracks SET mtime=? WHERE rowid=?",
                         (mtime, track_id))
 
+    def get_album_ids_without_replay_gain(self):
+        """
+            Get albums with local tracks not analyzed for ReplayGain
+            @return [int]
+        """
+        with SqlCursor(self.__db) as sql:
+            result = sql.execute("SELECT DISTINCT album_id FROM tracks\
+                                  WHERE rg_track_gain IS NULL AND\
+                                  NOT analysis_failed & ? AND\
+                                  uri LIKE 'file:%%' AND %s" %
+                                 make_storage_type_subrequest(
+                                    StorageType.COLLECTION |
+                                    StorageType.EXTERNAL),
+                                 (AnalysisFlags.REPLAY_GAIN,))
+            return list(itertools.chain(*result))
+
+    def get_replay_gain_uris(self, album_id):
+        """
+            Get local tracks to analyze for ReplayGain
+            @param album_id as int
+            @return [(int, str)] => (track id, uri)
+        """
+        with SqlCursor(self.__db) as sql:
+            result = sql.execute("SELECT rowid, uri FROM tracks\
+                                  WHERE album_id=? AND\
+                                  NOT analysis_failed & ? AND\
+                                  uri LIKE 'file:%%' AND %s\
+                                  ORDER BY discnumber, tracknumber" %
+                                 make_storage_type_subrequest(
+                                    StorageType.COLLECTION |
+                                    StorageType.EXTERNAL),
+                                 (album_id, AnalysisFlags.REPLAY_GAIN))
+            return list(result)
+
+    def get_ids_without_bpm(self):
+        """
+            Get local tracks without bpm
+            @return [int]
+        """
+        with SqlCursor(self.__db) as sql:
+            result = sql.execute("SELECT rowid FROM tracks\
+                                  WHERE bpm IS NULL AND\
+                                  NOT analysis_failed & ? AND\
+                                  uri LIKE 'file:%%' AND %s" %
+                                 make_storage_type_subrequest(
+                                    StorageType.COLLECTION |
+                                    StorageType.EXTERNAL),
+                                 (AnalysisFlags.BPM,))
+            return list(itertools.chain(*result))
+
+    def set_bpms(self, values):
+        """
+            Set bpm for tracks in one transaction
+            @param values as [(float, int)] => bpm, track id
+        """
+        with SqlCursor(self.__db, True) as sql:
+            sql.executemany("UPDATE tracks SET bpm=? WHERE rowid=?", values)
+
+    def set_analysis_failed(self, track_ids, flag):
+        """
+            Mark tracks as failing analysis, they are not analyzed again
+            until file is modified
+            @param track_ids as [int]
+            @param flag as AnalysisFlags
+        """
+        with SqlCursor(self.__db, True) as sql:
+            sql.executemany("UPDATE tracks\
+                             SET analysis_failed=analysis_failed|?\
+                             WHERE rowid=?",
+                            [(flag, track_id) for track_id in track_ids])
+
+    def get_replay_gain(self, track_id):
+        """
+            Get computed ReplayGain for track
+            @param track_id as int
+            @return (float, float, float, float)/None
+                    => track gain, track peak, album gain, album peak
+        """
+        with SqlCursor(self.__db) as sql:
+            result = sql.execute("SELECT rg_track_gain, rg_track_peak,\
+                                  rg_album_gain, rg_album_peak\
+                                  FROM tracks WHERE rowid=? AND\
+                                  rg_track_gain IS NOT NULL", (track_id,))
+            return result.fetchone()
+
+    def set_replay_gains(self, values):
+        """
+            Set computed ReplayGain for tracks in one transaction
+            @param values as [(float, float, float, float, int)]
+                   => track gain, track peak, album gain, album peak, track id
+        """
+        with SqlCursor(self.__db, True) as sql:
+            sql.executemany("UPDATE tracks SET rg_track_gain=?,\
+                             rg_track_peak=?, rg_album_gain=?,\
+                             rg_album_peak=? WHERE rowid=?", values)
+
     def is_empty(self):
         """
             Return True if no tracks in db
@@ -604,13 +723,13 @@ class TracksDatabase:
             @return [int]
         """
         with SqlCursor(self.__db) as sql:
-            filters = (LovedFlags.LOVED, storage_type)
+            filters = (LovedFlags.LOVED,)
             request = "SELECT tracks.rowid\
                        FROM tracks, album_artists, artists\
                        WHERE loved=? AND\
                        artists.rowid=album_artists.artist_id AND\
                        tracks.album_id=album_artists.album_id AND\
-                       storage_type & ?"
+                       %s" % make_storage_type_subrequest(storage_type)
             if artist_ids:
                 filters += tuple(artist_ids)
                 request += " AND "
@@ -630,14 +749,15 @@ class TracksDatabase:
             @param limit as int
             @return track ids as [int]
         """
+        storage_type_subrequest = make_storage_type_subrequest(storage_type)
         with SqlCursor(self.__db) as sql:
-            filters = (storage_type,)
+            filters = ()
             request = "SELECT tracks.rowid FROM"
             if artist_ids:
                 request += " tracks, track_artists "
             else:
                 request += " tracks "
-            request += "WHERE rate >= 4 AND storage_type & ?"
+            request += "WHERE rate >= 4 AND %s" % storage_type_subrequest
             if artist_ids:
                 filters += tuple(artist_ids)
                 request += " AND track_artists.track_id=tracks.rowid AND"
@@ -652,14 +772,14 @@ class TracksDatabase:
             result = sql.execute(request, filters)
             track_ids = list(itertools.chain(*result))
             if len(track_ids) < limit:
-                filters = (storage_type,)
+                filters = ()
                 request = "SELECT tracks.rowid FROM"
                 if artist_ids:
                     request += " tracks, track_artists "
                 else:
                     request += " tracks "
                 request += "WHERE popularity!=0 AND\
-                            storage_type & ?"
+                            %s" % storage_type_subrequest
                 if artist_ids:
                     filters += tuple(artist_ids)
                     request += " AND track_artists.track_id=tracks.rowid AND"
@@ -741,11 +861,12 @@ class TracksDatabase:
             @return tracks as [int]
         """
         with SqlCursor(self.__db) as sql:
-            request = "SELECT rowid FROM tracks WHERE storage_type & ?"
+            request = "SELECT rowid FROM tracks WHERE %s" %\
+                make_storage_type_subrequest(storage_type)
             if not skipped:
                 request += " AND loved !=-1 "
             request += " ORDER BY ltime, random() LIMIT ?"
-            result = sql.execute(request, (storage_type, limit))
+            result = sql.execute(request, (limit,))
             return list(itertools.chain(*result))
 
     def get_recently_listened_to(self, storage_type, skipped, limit):
@@ -757,9 +878,10 @@ class TracksDatabase:
             @return tracks as [int]
         """
         with SqlCursor(self.__db) as sql:
-            filters = (storage_type,)
+            filters = ()
             request = "SELECT tracks.rowid FROM tracks\
-                       WHERE ltime!=0 AND storage_type & ?"
+                       WHERE ltime!=0 AND %s" %\
+                make_storage_type_subrequest(storage_type)
             if not skipped:
                 request += " AND not loved &? "
                 filters += (LovedFlags.SKIPPED,)
@@ -776,8 +898,9 @@ class TracksDatabase:
         """
         with SqlCursor(self.__db) as sql:
             request = "SELECT rowid FROM tracks\
-                       WHERE loved & ? AND storage_type & ?"
-            result = sql.execute(request, (LovedFlags.SKIPPED, storage_type))
+                       WHERE loved & ? AND %s" %\
+                make_storage_type_subrequest(storage_type)
+            result = sql.execute(request, (LovedFlags.SKIPPED,))
             return list(itertools.chain(*result))
 
     def get_randoms(self, genre_ids, storage_type, skipped, limit):
@@ -790,11 +913,12 @@ class TracksDatabase:
             @return track ids as [int]
         """
         with SqlCursor(self.__db) as sql:
-            filters = (storage_type,)
+            filters = ()
             request = "SELECT tracks.rowid FROM tracks"
             if genre_ids:
                 request += ",track_genres"
-            request += " WHERE storage_type & ? "
+            request += " WHERE %s " % make_storage_type_subrequest(
+                storage_type, "tracks.storage_type")
             if not skipped:
                 request += " AND not loved &? "
                 filters += (LovedFlags.SKIPPED,)
@@ -911,8 +1035,8 @@ class TracksDatabase:
         with SqlCursor(self.__db) as sql:
             result = sql.execute("SELECT tracks.year\
                                   FROM tracks\
-                                  WHERE storage_type & ?",
-                                 (storage_type,))
+                                  WHERE %s" %
+                                 make_storage_type_subrequest(storage_type))
             years = []
             unknown = False
             for year in list(itertools.chain(*result)):
@@ -946,8 +1070,10 @@ class TracksDatabase:
                        WHERE albums.rowid=album_artists.album_id AND\
                        artists.rowid=album_artists.artist_id AND\
                        tracks.album_id=albums.rowid AND\
-                       tracks.year=? AND albums.storage_type & ?"
-            filters = (year, storage_type)
+                       tracks.year=? AND %s" %\
+                make_storage_type_subrequest(storage_type,
+                                             "albums.storage_type")
+            filters = (year,)
             if not skipped:
                 request += " AND not albums.loved &? "
                 filters += (LovedFlags.SKIPPED,)
@@ -978,9 +1104,11 @@ class TracksDatabase:
                        WHERE album_artists.artist_id=?\
                        AND album_artists.album_id=albums.rowid\
                        AND tracks.album_id=albums.rowid\
-                       AND albums.storage_type & ?\
-                       AND tracks.year=?"
-            filters = (Type.COMPILATIONS, storage_type, year)
+                       AND %s\
+                       AND tracks.year=?" %\
+                make_storage_type_subrequest(storage_type,
+                                             "albums.storage_type")
+            filters = (Type.COMPILATIONS, year)
             if not skipped:
                 request += " AND not albums.loved &? "
                 filters += (LovedFlags.SKIPPED,)
@@ -1018,8 +1146,9 @@ class TracksDatabase:
         """
         with SqlCursor(self.__db) as sql:
             result = sql.execute("SELECT COUNT(1) FROM tracks\
-                                  WHERE storage_type & ?",
-                                 (StorageType.COLLECTION | StorageType.SAVED,))
+                                  WHERE %s" % make_storage_type_subrequest(
+                                      StorageType.COLLECTION |
+                                      StorageType.SAVED))
             v = result.fetchone()
             if v is not None:
                 return v[0]
@@ -1038,40 +1167,47 @@ class TracksDatabase:
                          WHERE track_genres.track_id NOT IN (\
                             SELECT tracks.rowid FROM tracks)")
 
-    def search(self, searched, storage_type):
-        """
-            Search for tracks looking like searched
-            @param searched as str without accents
-            @param storage_type as StorageType
-            @return [(int, name)]
-        """
-        with SqlCursor(self.__db) as sql:
-            filters = ("%" + searched + "%", storage_type)
-            request = "SELECT rowid, name FROM tracks\
-                       WHERE noaccents(name) LIKE ?\
-                       AND tracks.storage_type & ? LIMIT 25"
-            result = sql.execute(request, filters)
-            return list(result)
-
-    def search_performed(self, searched, storage_type):
+    def search(self, searched, storage_type, words=None, limit=25):
         """
-            Search tracks looking like searched with performers
+            Search for tracks looking like searched or any of words
+            Tracks performed by a matching artist, not an album artist, are
+            also returned. Tracks matching more words in name or artists
+            come first, then tracks starting with searched
             @param searched as str without accents
             @param storage_type as StorageType
-            @return [(int, name)]
+            @param words as [str] without accents
+            @param limit as int
+            @return [(int, str, str)] => (track id, name, artists)
         """
+        terms = [searched] + [word for word in words or []
+                              if word != searched]
         with SqlCursor(self.__db) as sql:
-            filters = ("%" + searched + "%", storage_type)
-            request = "SELECT DISTINCT tracks.rowid, artists.name\
-                   FROM track_artists, tracks, artists\
-                   WHERE track_artists.artist_id=artists.rowid AND\
-                   track_artists.track_id=tracks.rowid AND\
-                   noaccents(artists.name) LIKE ? AND\
-                   tracks.storage_type & ? AND NOT EXISTS (\
-                        SELECT album_artists.artist_id\
-                        FROM album_artists\
-                        WHERE album_artists.artist_id=artists.rowid)\
-                    LIMIT 25"
+            filters = tuple(["%" + term + "%" for term in terms]) * 2
+            for term in terms:
+                filters += ("%" + term + "%",) * 2
+            filters += (searched + "%", limit)
+            request = "SELECT tracks.rowid, tracks.name,\
+                       GROUP_CONCAT(artists.name, ' ')\
+                       FROM tracks, track_artists, artists\
+                       WHERE track_artists.track_id=tracks.rowid AND\
+                       track_artists.artist_id=artists.rowid AND %s AND\
+                       (%s OR (%s AND NOT EXISTS (\
+                            SELECT album_artists.artist_id\
+                            FROM album_artists\
+                            WHERE album_artists.artist_id=artists.rowid)))\
+                       GROUP BY tracks.rowid\
+                       ORDER BY %s DESC,\
+                       noaccents(tracks.name) LIKE ? DESC\
+                       LIMIT ?" % (
+                make_storage_type_subrequest(storage_type,
+                                             "tracks.storage_type"),
+                make_subrequest("noaccents(tracks.name) LIKE ?",
+                                "OR", len(terms)),
+                make_subrequest("noaccents(artists.name) LIKE ?",
+                                "OR", len(terms)),
+                make_subrequest("MAX(noaccents(tracks.name) LIKE ? OR\
+                                     noaccents(artists.name) LIKE ?)",
+                                "+", len(terms)))
             result = sql.execute(request, filters)
             return list(result)
 
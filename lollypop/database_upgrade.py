@@ -13,6 +13,7 @@
 from gi.repository import GLib, Gio, Gtk
 
 import itertools
+from math import log2
 from time import time
 from gettext import gettext as _
 
@@ -88,7 +89,15 @@ class DatabasePlaylistsUpgrade(DatabaseUpgrade):
            2: "ALTER TABLE playlists ADD smart_enabled INT NOT NULL DEFAULT 0",
            3: "ALTER TABLE playlists ADD smart_sql TEXT",
            4: self.__upgrade_4,
-           5: "ALTER TABLE playlists ADD uri TEXT"
+           5: "ALTER TABLE playlists ADD uri TEXT",
+           6: """CREATE TABLE smart_tracks (
+                              playlist_id INT NOT NULL,
+                              position INT NOT NULL,
+                              track_id INT NOT NULL,
+                              uri TEXT NOT NULL)""",
+           7: "CREATE INDEX idx_stp ON smart_tracks(playlist_id, position)",
+           8: "CREATE INDEX idx_stt ON smart_tracks(track_id)",
+           9: self.__upgrade_9
         }
 
 #######################
@@ -107,6 +116,18 @@ class DatabasePlaylistsUpgrade(DatabaseUpgrade):
                     sql2.execute("UPDATE tracks SET loved=1 WHERE uri=?",
                                  (uri,))
 
+    def __upgrade_9(self, db):
+        """
+            Store smart playlists tracks
+        """
+        with SqlCursor(db) as sql:
+            result = sql.execute("SELECT rowid\
+                                  FROM playlists\
+                                  WHERE smart_enabled=1")
+            playlist_ids = list(itertools.chain(*result))
+        for playlist_id in playlist_ids:
+            db.refresh_smart(playlist_id)
+
 
 class DatabaseAlbumsUpgrade(DatabaseUpgrade):
     """
@@ -175,6 +196,30 @@ class DatabaseAlbumsUpgrade(DatabaseUpgrade):
             46: self.__upgrade_46,
             47: self.__upgrade_47,
             48: self.__upgrade_48,
+            # Index friendly storage_type filtering, see
+            # make_storage_type_subrequest()
+            49: "CREATE index idx_asp ON albums(storage_type, popularity)",
+            50: "CREATE index idx_asm ON albums(storage_type, mtime)",
+            51: "CREATE index idx_tsp ON tracks(storage_type, popularity)",
+            52: "CREATE index idx_tsl ON tracks(storage_type, ltime)",
+            53: "CREATE index idx_tal ON tracks(album_id, ltime)",
+            54: self.__upgrade_54,
+            55: """CREATE TABLE listens (track_id INT NOT NULL,
+                                         album_id INT NOT NULL,
+                                         timestamp INT NOT NULL,
+                                         played_ms INT NOT NULL,
+                                         skipped BOOLEAN NOT NULL)""",
+            56: """CREATE index idx_lts ON listens(
+                            timestamp, skipped, track_id, album_id)""",
+            57: "CREATE index idx_lt ON listens(track_id)",
+            # ReplayGain computed by CollectionReplayGain
+            58: "ALTER TABLE tracks ADD rg_track_gain DOUBLE",
+            59: "ALTER TABLE tracks ADD rg_track_peak DOUBLE",
+            60: "ALTER TABLE tracks ADD rg_album_gain DOUBLE",
+            61: "ALTER TABLE tracks ADD rg_album_peak DOUBLE",
+            # AnalysisFlags for tracks failing analysis
+            62: """ALTER TABLE tracks ADD
+                   analysis_failed INT NOT NULL DEFAULT 0""",
         }
 
 #######################
@@ -837,3 +882,29 @@ class DatabaseAlbumsUpgrade(DatabaseUpgrade):
             sql.execute("UPDATE albums set loved=2 where loved=1")
             sql.execute("UPDATE albums set loved=1 where loved=0")
             sql.execute("UPDATE albums set loved=4 where loved=-1")
+
+    def __upgrade_54(self, db):
+        """
+            Bucket timed popularity and add popularity at the moment
+        """
+        from lollypop.database_albums import AlbumsDatabase
+        with SqlCursor(db, True) as sql:
+            sql.execute("CREATE TABLE albums_moment_popularity (\
+                                            album_id INTEGER PRIMARY KEY,\
+                                            score DOUBLE NOT NULL)")
+            sql.execute("CREATE index idx_amp ON\
+                         albums_moment_popularity(score)")
+            sql.execute("CREATE index idx_atp ON\
+                         albums_timed_popularity(album_id, mtime)")
+            result = sql.execute("SELECT album_id, mtime, popularity\
+                                  FROM albums_timed_popularity\
+                                  WHERE popularity > 0")
+            for (album_id, mtime, popularity) in list(result):
+                score = mtime / AlbumsDatabase.MOMENT_HALF_LIFE +\
+                    log2(popularity)
+                sql.execute("INSERT OR REPLACE INTO albums_moment_popularity\
+                             (album_id, score) VALUES (?, ?)",
+                            (album_id, score))
+            sql.execute("UPDATE albums_timed_popularity\
+                         SET mtime = mtime - mtime % ?",
+                        (AlbumsDatabase.TIMED_POPULARITY_DAY,))
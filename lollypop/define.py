@@ -70,6 +70,11 @@ class LovedFlags:
     SKIPPED = 1 << 2
 
 
+class AnalysisFlags:
+    BPM = 1 << 0
+    REPLAY_GAIN = 1 << 1
+
+
 class GstPlayFlags:
     GST_PLAY_FLAG_VIDEO = 1 << 0  # We want video output
     GST_PLAY_FLAG_AUDIO = 1 << 1  # We want audio output
@@ -177,6 +182,12 @@ class ArtSize:
     MPRIS = 900
 
 
+class TaskPriority:
+    UI = 0
+    PREFETCH = 1
+    BACKGROUND = 2
+
+
 class ScanType:
     EXTERNAL = 0
     NEW_FILES = 1
@@ -217,7 +228,13 @@ class PowerManagement:
 class ReplayGain:
     NONE = 0
     TRACK = 1
-    ALBUM = 1
+    ALBUM = 2
+
+
+class TransitionsCurve:
+    LINEAR = 0
+    SMOOTH = 1          # Cubic, no overshoot
+    EQUAL_POWER = 2     # Constant loudness across crossfade
 
 
 class Size:
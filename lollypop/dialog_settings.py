@@ -14,7 +14,7 @@ from gi.repository import Gtk, GLib, Gdk, Handy
 
 from gettext import gettext as _
 
-from lollypop.define import App, ScanType, NetworkAccessACL
+from lollypop.define import App, ScanType, NetworkAccessACL, TaskPriority
 from lollypop.widgets_row_device import DeviceRow
 from lollypop.helper_passwords import PasswordsHelper
 
@@ -151,17 +151,14 @@ class SettingsDialog:
         setting = widget.get_name()
         value = widget.get_active()
         App().settings.set_enum(setting, value)
-        if setting == "replay-gain":
-            for plugin in App().player.plugins:
-                plugin.build_audiofilter()
-            App().player.reload_track()
 
     def _on_clean_artwork_cache_clicked(self, button):
         """
             Clean artwork cache
             @param button as Gtk.Button
         """
-        App().task_helper.run(App().art.clean_all_cache)
+        App().task_helper.run(App().art.clean_all_cache,
+                              priority=TaskPriority.BACKGROUND)
         button.set_sensitive(False)
 
     def _on_google_api_key_changed(self, entry):
@@ -300,7 +297,8 @@ class SettingsDialog:
             @param widget as Gtk.Range
         """
         self.__timeout_id = None
-        App().task_helper.run(App().art.clean_all_cache)
+        App().task_helper.run(App().art.clean_all_cache,
+                              priority=TaskPriority.BACKGROUND)
         App().art.update_art_size()
         App().window.container.reload_view()
 
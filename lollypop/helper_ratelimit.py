@@ -0,0 +1,192 @@
+# Copyright (c) 2014-2021 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from threading import Condition
+from urllib.parse import urlparse
+from email.utils import parsedate_to_datetime
+from time import time
+
+from lollypop.define import TaskPriority
+from lollypop.logger import Logger
+
+
+class RateLimitHelper:
+    """
+        Token bucket for each host
+        Waiting requests get tokens by priority, hosts asking to slow down
+        with Retry-After or X-RateLimit-* are blocked until given time
+    """
+
+    # (requests per second, burst) for each host
+    __LIMITS = {
+        "musicbrainz.org": (1, 1),
+        "ws.audioscrobbler.com": (5, 5),
+        "libre.fm": (5, 5),
+        "api.spotify.com": (5, 10),
+        "api.deezer.com": (10, 50)
+    }
+    __DEFAULT_LIMIT = (10, 20)
+    # Blocked hosts fail requests instead of waiting more than this delay
+    __MAX_WAIT = 60
+    # Delay if server does not tell when to retry
+    __RETRY_DELAY = 5
+
+    def __init__(self):
+        """
+            Init helper
+        """
+        self.__condition = Condition()
+        # {host: [tokens, timestamp, blocked until, waiting for priority]}
+        self.__buckets = {}
+
+    def acquire(self, uri, priority=TaskPriority.UI, cancellable=None):
+        """
+            Wait for a token for uri host
+            @param uri as str
+            @param priority as TaskPriority
+            @param cancellable as Gio.Cancellable
+            @return bool => False if cancelled or host blocked for long
+        """
+        (host, limit) = self.__get_host(uri)
+        with self.__condition:
+            bucket = self.__get_bucket(host, limit)
+            bucket[3][priority] += 1
+            try:
+                while True:
+                    if cancellable is not None and cancellable.is_cancelled():
+                        return False
+                    delay = self.__refill(bucket, limit)
+                    if delay > self.__MAX_WAIT:
+                        Logger.warning("RateLimitHelper: %s blocked", host)
+                        return False
+                    if delay <= 0 and not any(bucket[3][:priority]):
+                        bucket[0] -= 1
+                        return True
+                    # Wake up to check cancellable or a priority change
+                    self.__condition.wait(min(max(delay, 0.1), 1))
+            finally:
+                bucket[3][priority] -= 1
+                self.__condition.notify_all()
+
+    def reserve(self, uri):
+        """
+            Reserve a token for uri host without waiting
+            @param uri as str
+            @return float/None => delay before sending request,
+                                  None if host blocked for long
+        """
+        (host, limit) = self.__get_host(uri)
+        with self.__condition:
+            bucket = self.__get_bucket(host, limit)
+            delay = self.__refill(bucket, limit)
+            if delay > self.__MAX_WAIT:
+                Logger.warning("RateLimitHelper: %s blocked", host)
+                return None
+            bucket[0] -= 1
+            return max(delay, 0)
+
+    def handle_response(self, uri, status, headers):
+        """
+            Block host if response asks to slow down
+            @param uri as str
+            @param status as int
+            @param headers as Soup.MessageHeaders
+            @return bool => True if request should be sent again
+        """
+        delay = None
+        try:
+            retry_after = headers.get_one("Retry-After")
+            if retry_after is not None:
+                if retry_after.isdigit():
+                    delay = int(retry_after)
+                else:
+                    delay = parsedate_to_datetime(
+                        retry_after).timestamp() - time()
+            else:
+                delay = self.__get_ratelimit_delay(headers)
+        except Exception as e:
+            Logger.warning("RateLimitHelper::handle_response(): %s", e)
+        if delay is None and status == 429:
+            delay = self.__RETRY_DELAY
+        if delay is not None and delay > 0:
+            (host, limit) = self.__get_host(uri)
+            Logger.info("RateLimitHelper: %s blocked for %ss", host, delay)
+            with self.__condition:
+                bucket = self.__get_bucket(host, limit)
+                bucket[2] = max(bucket[2], time() + delay)
+                self.__condition.notify_all()
+        return status == 429 or (status == 503 and delay is not None)
+
+#######################
+# PRIVATE             #
+#######################
+    def __get_host(self, uri):
+        """
+            Get host and its limit
+            @param uri as str
+            @return (str, (float, int))
+        """
+        host = urlparse(uri).netloc.lower()
+        for (domain, limit) in self.__LIMITS.items():
+            if host == domain or host.endswith("." + domain):
+                return (host, limit)
+        return (host, self.__DEFAULT_LIMIT)
+
+    def __get_bucket(self, host, limit):
+        """
+            Get bucket for host, create a full one if needed
+            @param host as str
+            @param limit as (float, int)
+            @return [float, float, float, [int]]
+        """
+        bucket = self.__buckets.get(host, None)
+        if bucket is None:
+            bucket = [limit[1], time(), 0, [0, 0, 0]]
+            self.__buckets[host] = bucket
+        return bucket
+
+    def __refill(self, bucket, limit):
+        """
+            Add tokens for elapsed time
+            @param bucket as [float, float, float, [int]]
+            @param limit as (float, int)
+            @return float => delay before a token is available
+        """
+        (rate, burst) = limit
+        now = time()
+        bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        delay = (1 - bucket[0]) / rate if bucket[0] < 1 else 0
+        return max(delay, bucket[2] - now)
+
+    def __get_ratelimit_delay(self, headers):
+        """
+            Get delay from X-RateLimit-* headers
+            @param headers as Soup.MessageHeaders
+            @return float/None
+        """
+        remaining_keys = ["X-RateLimit-Remaining", "X-Rate-Limit-Remaining"]
+        reset_keys = ["X-RateLimit-Reset", "X-Rate-Limit-Reset",
+                      "X-RateLimit-Reset-In", "X-RateLimit-Reset-At"]
+        for key in remaining_keys:
+            remaining = headers.get_one(key)
+            if remaining is not None:
+                break
+        for key in reset_keys:
+            reset = headers.get_one(key)
+            if reset is not None:
+                break
+        if remaining is None or reset is None or int(remaining) > 0:
+            return None
+        reset = float(reset)
+        # Timestamp or delay in seconds
+        return reset - time() if reset > 1000000000 else reset
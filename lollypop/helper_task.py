@@ -14,40 +14,123 @@ import gi
 gi.require_version("Soup", "3.0")
 from gi.repository import GLib, Soup
 
-from threading import Thread
-from urllib.parse import urlparse
-from time import time, sleep
+from threading import Thread, Condition, Lock, Event, local
+from heapq import heappush, heappop
+from time import time
 
-from lollypop.define import App
+from lollypop.define import App, TaskPriority, CACHE_PATH
 from lollypop.logger import Logger
+from lollypop.helper_ratelimit import RateLimitHelper
 
 
 class TaskHelper:
     """
         Simple helper for running a task in background
+        Tasks run in a bounded pool of threads, by priority then by order
     """
 
+    # Pool threads, long running tasks should use run_thread()
+    __MAX_THREADS = 8
+    # Idle pool threads exit after this delay in seconds
+    __IDLE_TIMEOUT = 30
+    # Kept alive connections
+    __MAX_CONNS = 32
+    __MAX_CONNS_PER_HOST = 4
+    __HTTP_CACHE_PATH = CACHE_PATH + "/http"
+    __HTTP_CACHE_SIZE = 50 << 20
+    # Retries for rate limited requests
+    __MAX_RETRIES = 5
+
     def __init__(self):
         """
             Init helper
         """
-        self.__ratelimit = {}
-        self.__retries = {}
+        self.__ratelimit = RateLimitHelper()
+        # Identical sync requests in flight
+        self.__inflight = {}
+        self.__inflight_lock = Lock()
+        # Priority of task running in thread
+        self.__priorities = local()
+        self.__condition = Condition()
+        # Heap of (priority, order, command, kwargs, args)
+        self.__queue = []
+        self.__order = 0
+        self.__threads = 0
+        self.__idle = 0
+        self.__running = 0
+        # Queued tasks for priority
+        self.__depths = [0, 0, 0]
+        self.__session = None
+        self.__http_cache = None
+        self.__session_lock = Lock()
+        # libsoup < 3.2 sessions can't be shared between threads
+        self.__thread_sessions = local()
+        self.__share_session = Soup.get_major_version() > 3 or\
+            Soup.get_minor_version() >= 2
 
     def run(self, command, *args, **kwargs):
         """
-            Run command with params and return to callback
+            Run command with params in pool and return to callback
+            Task is dropped if its cancellable is cancelled before it starts
+            @param command as function
+            @param *args as command arguments
+            @param **kwargs as {"callback": (function, *args),
+                                "priority": TaskPriority,
+                                "cancellable": Gio.Cancellable}
+        """
+        priority = kwargs.get("priority", TaskPriority.UI)
+        with self.__condition:
+            heappush(self.__queue,
+                     (priority, self.__order, command, kwargs, args))
+            self.__order += 1
+            self.__depths[priority] += 1
+            if len(self.__queue) > self.__idle and\
+                    self.__threads < self.__MAX_THREADS:
+                self.__threads += 1
+                thread = Thread(target=self.__pool_thread)
+                thread.daemon = True
+                thread.start()
+            self.__condition.notify()
+
+    def run_thread(self, command, *args, **kwargs):
+        """
+            Run long running command in a new thread and return to callback
             @param command as function
             @param *args as command arguments
-            @param **kwargs
+            @param **kwargs as {"callback": (function, *args),
+                                "priority": TaskPriority}
             @return thread as Thread
         """
+        kwargs.setdefault("priority", TaskPriority.BACKGROUND)
         thread = Thread(target=self.__run,
                         args=(command, kwargs, *args))
         thread.daemon = True
         thread.start()
         return thread
 
+    def dump_http_cache(self):
+        """
+            Save HTTP cache index, call on quit
+        """
+        try:
+            if self.__http_cache is not None:
+                self.__http_cache.flush()
+                self.__http_cache.dump()
+        except Exception as e:
+            Logger.warning("TaskHelper::dump_http_cache(): %s", e)
+
+    @property
+    def metrics(self):
+        """
+            Get pool metrics
+            @return {"queued": [int] => for each TaskPriority,
+                     "running": int, "threads": int}
+        """
+        with self.__condition:
+            return {"queued": list(self.__depths),
+                    "running": self.__running,
+                    "threads": self.__threads}
+
     def load_uri_content(self, uri, cancellable, callback, *args):
         """
             Load uri content async
@@ -71,35 +154,9 @@ class TaskHelper:
         """
         if cancellable is not None and cancellable.is_cancelled():
             callback(uri, False, b"", *args)
-        try:
-            delay = self.__get_delay_for_uri(uri)
-            if delay > 0:
-                GLib.timeout_add_seconds(
-                                 delay,
-                                 self.load_uri_content_with_headers,
-                                 uri, headers, cancellable,
-                                 callback, *args)
-                return
-
-            session = Soup.Session.new()
-            session.set_property('accept-language-auto', True)
-            session.set_property(
-                "user-agent",
-                "Lollypop/%s (cedric.bellegarde@adishatz.org)" % App().version)
-            msg = Soup.Message.new("GET", uri)
-            if headers:
-                headers = msg.get_property("request-headers")
-                for header in headers:
-                    headers.append(header[0],
-                                   header[1])
-            session.send_and_read_async(
-                               msg, 0, cancellable,
-                               self.__on_load_uri_content, msg, headers,
-                               callback, cancellable, uri, *args)
-        except Exception as e:
-            Logger.warning(
-                "HelperTask::load_uri_content_with_headers(): %s" % e)
-            callback(uri, False, b"", *args)
+            return
+        self.__load_uri_content_async(uri, headers, cancellable, 0,
+                                      callback, *args)
 
     def load_uri_content_sync(self, uri, cancellable=None):
         """
@@ -113,186 +170,353 @@ class TaskHelper:
     def load_uri_content_sync_with_headers(self, uri, headers,
                                            cancellable=None):
         """
-            Load uri
+            Load uri, identical requests running in other threads are
+            shared
+            @param uri as str
+            @param headers as []
+            @param cancellable as Gio.Cancellable
+            @return (loaded as bool, content as bytes)
+        """
+        key = (uri, tuple(tuple(header) for header in headers))
+        return self.__coalesce(key, cancellable, (False, b""),
+                               self.__load_uri_content_sync_with_cache,
+                               uri, headers, cancellable)
+
+    def send_message(self, message, cancellable, callback, *args):
+        """
+            Send message async
+            @param message as Soup.Message
+            @param cancellable as Gio.Cancellable
+            @param callback as a function
+            @callback (uri as str, status as bool, content as bytes, args)
+        """
+        self.__send_message_async(message, cancellable, 0, callback, *args)
+
+    def send_message_sync(self, message, cancellable):
+        """
+            Send message sync
+            @param message as Soup.Message
+            @param cancellable as Gio.Cancellable
+            @return bytes
+        """
+        try:
+            uri = message.get_uri().to_string()
+            session = self.__get_session()
+            for retries in range(0, self.__MAX_RETRIES + 1):
+                if not self.__ratelimit.acquire(uri, self.__get_priority(),
+                                                cancellable):
+                    return None
+                bytes = session.send_and_read(message,
+                                              cancellable).get_data()
+                if not self.__ratelimit.handle_response(
+                        uri, message.get_status(),
+                        message.get_property("response-headers")):
+                    break
+            return bytes
+        except Exception as e:
+            Logger.warning("TaskHelper::send_message_sync(): %s" % e)
+        return None
+
+#######################
+# PRIVATE             #
+#######################
+    def __load_uri_content_sync_with_cache(self, uri, headers, cancellable):
+        """
+            Load uri, metadata providers responses are cached on disk
             @param uri as str
             @param headers as []
             @param cancellable as Gio.Cancellable
             @return (loaded as bool, content as bytes)
         """
+        http_cache = App().http_cache
+        ttl = http_cache.get_ttl(uri)
+        if ttl == 0:
+            (msg, bytes) = self.__load_uri_content_sync(uri, headers,
+                                                        cancellable)
+            return (False, b"") if bytes is None else (True, bytes)
+        key = http_cache.get_key(uri, headers)
+        cached = http_cache.get(key)
+        request_headers = list(headers)
+        if cached is not None:
+            (status, etag, last_modified, expires, data) = cached
+            if expires > time():
+                return (True, data)
+            if etag is not None:
+                request_headers.append(("If-None-Match", etag))
+            if last_modified is not None:
+                request_headers.append(("If-Modified-Since", last_modified))
+        (msg, bytes) = self.__load_uri_content_sync(uri, request_headers,
+                                                    cancellable)
+        status = 0 if msg is None else int(msg.get_status())
+        if cached is not None:
+            if status == Soup.Status.NOT_MODIFIED:
+                negative_ttl = http_cache.get_negative_ttl(cached[0],
+                                                           cached[4])
+                http_cache.refresh(key, negative_ttl or ttl)
+                return (True, cached[4])
+            # Offline, use stale response
+            if bytes is None:
+                return (True, cached[4])
+        if bytes is None:
+            return (False, b"")
+        if status in [Soup.Status.OK, Soup.Status.NOT_FOUND]:
+            response_headers = msg.get_property("response-headers")
+            negative_ttl = http_cache.get_negative_ttl(status, bytes)
+            http_cache.set(key, status,
+                           response_headers.get_one("ETag"),
+                           response_headers.get_one("Last-Modified"),
+                           negative_ttl or ttl, bytes)
+        return (True, bytes)
+
+    def __new_session(self):
+        """
+            Get a new HTTP session keeping connections alive
+            @return Soup.Session
+        """
+        session = Soup.Session.new()
+        session.set_property("accept-language-auto", True)
+        session.set_property(
+            "user-agent",
+            "Lollypop/%s (cedric.bellegarde@adishatz.org)" % App().version)
+        session.set_property("max-conns", self.__MAX_CONNS)
+        session.set_property("max-conns-per-host", self.__MAX_CONNS_PER_HOST)
+        return session
+
+    def __get_session(self):
+        """
+            Get shared HTTP session, one per thread if libsoup can't share
+            it between threads
+            @return Soup.Session
+        """
+        if not self.__share_session:
+            session = getattr(self.__thread_sessions, "session", None)
+            if session is None:
+                session = self.__new_session()
+                self.__thread_sessions.session = session
+            return session
+        with self.__session_lock:
+            if self.__session is None:
+                self.__session = self.__new_session()
+                try:
+                    self.__http_cache = Soup.Cache.new(
+                        self.__HTTP_CACHE_PATH, Soup.CacheType.SINGLE_USER)
+                    self.__http_cache.set_max_size(self.__HTTP_CACHE_SIZE)
+                    self.__http_cache.load()
+                    self.__session.add_feature(self.__http_cache)
+                except Exception as e:
+                    Logger.warning("TaskHelper::__get_session(): %s", e)
+                    self.__http_cache = None
+            return self.__session
+
+    def __load_uri_content_sync(self, uri, headers, cancellable):
+        """
+            Load uri when host allows it, retry if asked to
+            @param uri as str
+            @param headers as []
+            @param cancellable as Gio.Cancellable
+            @return (Soup.Message/None, bytes/None)
+        """
         try:
-            delay = self.__get_delay_for_uri(uri)
-            if delay > 0:
-                sleep(delay)
-                if cancellable is not None and cancellable.is_cancelled():
-                    return (False, b"")
-
-            session = Soup.Session.new()
-            session.set_property('accept-language-auto', True)
-            session.set_property(
-                "user-agent",
-                "Lollypop/%s (cedric.bellegarde@adishatz.org)" % App().version)
+            session = self.__get_session()
+            for retries in range(0, self.__MAX_RETRIES + 1):
+                if not self.__ratelimit.acquire(uri, self.__get_priority(),
+                                                cancellable):
+                    return (None, None)
+                msg = Soup.Message.new("GET", uri)
+                if headers:
+                    request_headers = msg.get_property("request-headers")
+                    for header in headers:
+                        request_headers.append(header[0], header[1])
+                bytes = session.send_and_read(msg, cancellable).get_data()
+                if not self.__ratelimit.handle_response(
+                        uri, msg.get_status(),
+                        msg.get_property("response-headers")):
+                    break
+            return (msg, bytes)
+        except Exception as e:
+            Logger.warning(
+                "TaskHelper::__load_uri_content_sync(): %s" % e)
+            return (None, None)
+
+    def __load_uri_content_async(self, uri, headers, cancellable, retries,
+                                 callback, *args):
+        """
+            Load uri content async when host allows it
+            @param uri as str
+            @param headers as []
+            @param cancellable as Gio.Cancellable
+            @param retries as int
+            @param callback as a function
+        """
+        try:
+            delay = self.__ratelimit.reserve(uri)
+            if delay is None:
+                callback(uri, False, b"", *args)
+            elif delay > 0:
+                GLib.timeout_add(int(delay * 1000),
+                                 self.__send_uri_content_async,
+                                 uri, headers, cancellable, retries,
+                                 callback, *args)
+            else:
+                self.__send_uri_content_async(uri, headers, cancellable,
+                                              retries, callback, *args)
+        except Exception as e:
+            Logger.warning(
+                "HelperTask::__load_uri_content_async(): %s" % e)
+            callback(uri, False, b"", *args)
+
+    def __send_uri_content_async(self, uri, headers, cancellable, retries,
+                                 callback, *args):
+        """
+            Send GET request
+            @param uri as str
+            @param headers as []
+            @param cancellable as Gio.Cancellable
+            @param retries as int
+            @param callback as a function
+        """
+        try:
+            session = self.__get_session()
             msg = Soup.Message.new("GET", uri)
             if headers:
                 request_headers = msg.get_property("request-headers")
                 for header in headers:
                     request_headers.append(header[0], header[1])
-            bytes = session.send_and_read(msg, cancellable).get_data()
-            if bytes is None:
-                response_headers = msg.get_property("response-headers")
-                wait = self.__handle_ratelimit(response_headers, uri)
-                if wait is not None:
-                    retries = self.__get_retries_for_uri(uri)
-                    if retries < 5:
-                        parsed = urlparse(uri)
-                        self.__ratelimit[parsed.netloc] = wait
-                        return self.load_uri_content_sync_with_headers(
-                            uri, headers, cancellable)
-                    else:
-                        del self.__retries[uri]
-            else:
-                return (True, bytes)
+            session.send_and_read_async(
+                               msg, 0, cancellable,
+                               self.__on_load_uri_content, msg, headers,
+                               retries, callback, cancellable, uri, *args)
         except Exception as e:
             Logger.warning(
-                "TaskHelper::load_uri_content_sync_with_headers(): %s" % e)
-            return (False, b"")
+                "HelperTask::__send_uri_content_async(): %s" % e)
+            callback(uri, False, b"", *args)
 
-    def send_message(self, message, cancellable, callback, *args):
+    def __send_message_async(self, message, cancellable, retries,
+                             callback, *args):
         """
-            Send message async
+            Send message async when host allows it
             @param message as Soup.Message
             @param cancellable as Gio.Cancellable
+            @param retries as int
             @param callback as a function
-            @callback (uri as str, status as bool, content as bytes, args)
         """
         try:
-            uri = message.get_uri().to_string(False)
-            delay = self.__get_delay_for_uri(uri)
-            if delay > 0:
-                GLib.timeout_add_seconds(delay,
-                                         self.send_message,
-                                         message, cancellable,
-                                         callback, *args)
+            uri = message.get_uri().to_string()
+            delay = self.__ratelimit.reserve(uri)
+            if delay is None:
+                callback(uri, False, b"", *args)
                 return
+            elif delay > 0:
+                GLib.timeout_add(int(delay * 1000),
+                                 self.__send_message_async_now,
+                                 message, cancellable, retries,
+                                 callback, *args)
+            else:
+                self.__send_message_async_now(message, cancellable,
+                                              retries, callback, *args)
+        except Exception as e:
+            Logger.warning("TaskHelper::__send_message_async(): %s" % e)
 
-            session = Soup.Session.new()
+    def __send_message_async_now(self, message, cancellable, retries,
+                                 callback, *args):
+        """
+            Send message async
+            @param message as Soup.Message
+            @param cancellable as Gio.Cancellable
+            @param retries as int
+            @param callback as a function
+        """
+        try:
+            uri = message.get_uri().to_string()
+            session = self.__get_session()
             session.send_and_read_async(
                                message,
                                0,
                                cancellable,
                                self.__on_message_send_async,
                                message,
+                               retries,
                                callback,
                                cancellable,
                                uri,
                                *args)
         except Exception as e:
-            Logger.warning("TaskHelper::send_message(): %s" % e)
+            Logger.warning("TaskHelper::__send_message_async_now(): %s" % e)
 
-    def send_message_sync(self, message, cancellable):
+    def __coalesce(self, key, cancellable, default, command, *args):
         """
-            Send message sync
-            @param message as Soup.Message
+            Run command once for identical requests running in threads
+            Request is run again if its owner cancelled it
+            @param key as object
             @param cancellable as Gio.Cancellable
-            @return bytes
+            @param default as object => result if command raised
+            @param command as function
+            @param *args as command arguments
+            @return command result
         """
-        try:
-            uri = message.get_uri().to_string()
-            delay = self.__get_delay_for_uri(uri)
-            if delay > 0:
-                sleep(delay)
-                if cancellable is not None and cancellable.is_cancelled():
-                    return None
+        while True:
+            with self.__inflight_lock:
+                request = self.__inflight.get(key, None)
+                owner = request is None
+                if owner:
+                    # [done, result, owner cancellable]
+                    request = [Event(), default, cancellable]
+                    self.__inflight[key] = request
+            if owner:
+                try:
+                    request[1] = command(*args)
+                finally:
+                    with self.__inflight_lock:
+                        del self.__inflight[key]
+                    request[0].set()
+                return request[1]
+            request[0].wait()
+            owner_cancellable = request[2]
+            if owner_cancellable is None or\
+                    not owner_cancellable.is_cancelled() or\
+                    (cancellable is not None and cancellable.is_cancelled()):
+                return request[1]
 
-            session = Soup.Session.new()
-            bytes = session.send_and_read(message, cancellable).get_data()
-            if bytes is None:
-                response_headers = message.get_property("response-headers")
-                wait = self.__handle_ratelimit(response_headers, uri)
-                if wait is not None:
-                    retries = self.__get_retries_for_uri(uri)
-                    if retries < 5:
-                        parsed = urlparse(uri)
-                        self.__ratelimit[parsed.netloc] = wait
-                        return self.send_message_sync(message, cancellable)
-                    else:
-                        del self.__retries[uri]
-            else:
-                return bytes
-        except Exception as e:
-            Logger.warning("TaskHelper::send_message_sync(): %s" % e)
-        return None
-
-#######################
-# PRIVATE             #
-#######################
-    def __get_delay_for_uri(self, uri):
+    def __get_priority(self):
         """
-            Get delay for last ratelimit
-            @param uri as str
-            @return int
+            Get priority of task running in current thread
+            @return TaskPriority
         """
-        delay = 0
-        now = time()
-        parsed = urlparse(uri)
-        if parsed.netloc in self.__ratelimit.keys():
-            wait = self.__ratelimit[parsed.netloc]
-            delay = wait - now
-            if delay < 0:
-                del self.__ratelimit[parsed.netloc]
-        return delay
+        return getattr(self.__priorities, "priority", TaskPriority.UI)
 
-    def __get_retries_for_uri(self, uri):
-        """
-            Get retries for uri
-            @param uri as str
-            @return int
+    def __pool_thread(self):
         """
-        retries = 0
-        if uri in self.__retries.keys():
-            retries = self.__retries[uri]
-        else:
-            self.__retries[uri] = 0
-        return retries
-
-    def __handle_ratelimit(self, response, uri):
+            Run queued tasks until pool is idle
         """
-            Set rate limit from response
-            @param response as Soup.MessageHeaders
-            @param uri as str
-            @return next_time as int
-        """
-        remaining_keys = ["X-RateLimit-Remaining", "X-Rate-Limit-Remaining"]
-        reset_keys = ["X-RateLimit-Reset", "X-Rate-Limit-Reset",
-                      "X-RateLimit-Reset-In", "X-RateLimit-Reset-At"]
-        for key in remaining_keys:
-            remaining = response.get_one(key)
-            if remaining is not None:
-                break
-        for key in reset_keys:
-            reset = response.get_one(key)
-            if reset is not None:
-                break
-        if remaining is None or reset is None:
-            return None
-        # No more request available
-        if (int(remaining) < 1):
-            Logger.info(uri)
-            Logger.info("X-RateLimit-Remaining: %s" % remaining)
-            Logger.info("X-RateLimit-Reset: %s" % reset)
-            return int(reset)
-
-        if uri in self.__retries.keys():
-            del self.__retries[uri]
-        return None
+        while True:
+            with self.__condition:
+                while not self.__queue:
+                    self.__idle += 1
+                    notified = self.__condition.wait(self.__IDLE_TIMEOUT)
+                    self.__idle -= 1
+                    if not notified and not self.__queue:
+                        self.__threads -= 1
+                        return
+                (priority, order, command, kwargs, args) =\
+                    heappop(self.__queue)
+                self.__depths[priority] -= 1
+                self.__running += 1
+            cancellable = kwargs.get("cancellable", None)
+            if cancellable is None or not cancellable.is_cancelled():
+                self.__run(command, kwargs, *args)
+            with self.__condition:
+                self.__running -= 1
 
     def __run(self, command, kwd, *args):
         """
             Pass command result to callback
             @param command as function
             @param *args as command arguments
-            @param kwd as { "callback": (function, *args) }
+            @param kwd as { "callback": (function, *args),
+                            "priority": TaskPriority }
         """
         try:
+            self.__priorities.priority = kwd.get("priority", TaskPriority.UI)
             result = command(*args)
             if "callback" in kwd.keys():
                 (callback, *callback_args) = kwd["callback"]
@@ -323,64 +547,55 @@ class TaskHelper:
             Logger.warning("TaskHelper::__on_soup_msg_finished(): %s" % e)
             callback(uri, False, b"", *args)
 
-    def __on_message_send_async(self, source, result, message, callback,
-                                cancellable, uri, *args):
+    def __on_message_send_async(self, source, result, message, retries,
+                                callback, cancellable, uri, *args):
         """
             Get stream and start reading from it
             @param source as Soup.Session
             @param result as Gio.AsyncResult
             @param message as Soup.Message
+            @param retries as int
             @param cancellable as Gio.Cancellable
             @param callback as a function
             @param uri as str
         """
         try:
-            response_headers = message.get_property("response-headers")
-            wait = self.__handle_ratelimit(response_headers, uri)
-            if wait is None:
-                bytes = source.send_and_read_finish(result).get_data()
-                callback(uri, True, bytes, *args)
+            bytes = source.send_and_read_finish(result).get_data()
+            if self.__ratelimit.handle_response(
+                    uri, message.get_status(),
+                    message.get_property("response-headers")) and\
+                    retries < self.__MAX_RETRIES:
+                self.__send_message_async(message, cancellable, retries + 1,
+                                          callback, *args)
             else:
-                parsed = urlparse(uri)
-                self.__ratelimit[parsed.netloc] = wait
-                retries = self.__get_retries_for_uri(uri)
-                if retries < 5:
-                    self.__retries[uri] += 1
-                    self.send_message(message, cancellable, callback, *args)
-                else:
-                    del self.__retries[uri]
+                callback(uri, True, bytes, *args)
         except Exception as e:
             Logger.warning("TaskHelper::__on_soup_msg_finished(): %s" % e)
             callback(uri, False, b"", *args)
 
-    def __on_load_uri_content(self, source, result, msg, headers, callback,
-                              cancellable, uri, *args):
+    def __on_load_uri_content(self, source, result, msg, headers, retries,
+                              callback, cancellable, uri, *args):
         """
             Get stream and start reading from it
             @param source as Soup.Session
             @param result as Gio.AsyncResult
             @param msg as Soup.Message
             @param headers as []
+            @param retries as int
             @param cancellable as Gio.Cancellable
             @param callback as a function
             @param uri as str
         """
         try:
-            response_headers = msg.get_property("response-headers")
-            wait = self.__handle_ratelimit(response_headers, uri)
-            if wait is None:
-                bytes = source.send_and_read_finish(result).get_data()
-                callback(uri, True, bytes, *args)
+            bytes = source.send_and_read_finish(result).get_data()
+            if self.__ratelimit.handle_response(
+                    uri, msg.get_status(),
+                    msg.get_property("response-headers")) and\
+                    retries < self.__MAX_RETRIES:
+                self.__load_uri_content_async(uri, headers, cancellable,
+                                              retries + 1, callback, *args)
             else:
-                parsed = urlparse(uri)
-                self.__ratelimit[parsed.netloc] = wait
-                retries = self.__get_retries_for_uri(uri)
-                if retries < 5:
-                    self.__retries[uri] += 1
-                    self.load_uri_content_sync_with_headers(uri, headers,
-                                                            callback, *args)
-                else:
-                    del self.__retries[uri]
+                callback(uri, True, bytes, *args)
         except Exception as e:
             Logger.warning("TaskHelper::__on_soup_msg_finished(): %s" % e)
             callback(uri, False, b"", *args)
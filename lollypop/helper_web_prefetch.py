@@ -0,0 +1,130 @@
+# Copyright (c) 2014-2021 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from gi.repository import Gio
+
+from re import search
+from time import time
+
+from lollypop.logger import Logger
+from lollypop.utils import get_network_available
+
+
+class WebPrefetchHelper:
+    """
+        Resolve stream URIs of upcoming web tracks before they are played
+        Resolved URIs are kept in memory until they expire
+    """
+
+    # Resolutions running in parallel
+    __MAX_JOBS = 2
+    # Stream URI lifetime in seconds if URI does not tell it
+    __TTL = 3600
+    # Do not use an URI expiring in less than this delay in seconds
+    __MARGIN = 120
+
+    def __init__(self):
+        """
+            Init helper
+        """
+        # {track id: (uri, expire timestamp)}
+        self.__uris = {}
+        # {track id: Gio.Cancellable}
+        self.__running = {}
+        self.__pending = []
+
+    def get_uri(self, track):
+        """
+            Get resolved stream URI for track
+            @param track as Track
+            @return str/None
+        """
+        (uri, expire) = self.__uris.get(track.id, (None, 0))
+        if uri is not None and expire > time() + self.__MARGIN:
+            return uri
+        return None
+
+    def update(self, tracks):
+        """
+            Resolve URIs for tracks, cancel resolutions for other tracks
+            @param tracks as [Track]
+        """
+        track_ids = [track.id for track in tracks]
+        for track_id in list(self.__running.keys()):
+            if track_id not in track_ids:
+                self.__running.pop(track_id).cancel()
+        self.__pending = [track for track in tracks
+                          if track.id not in self.__running and
+                          self.get_uri(track) is None]
+        # Forget expired URIs
+        now = time()
+        for (track_id, (uri, expire)) in list(self.__uris.items()):
+            if expire < now:
+                del self.__uris[track_id]
+        self.__run_jobs()
+
+    def cancel(self):
+        """
+            Cancel all resolutions
+        """
+        self.__pending = []
+        for cancellable in self.__running.values():
+            cancellable.cancel()
+        self.__running = {}
+
+#######################
+# PRIVATE             #
+#######################
+    def __run_jobs(self):
+        """
+            Start resolutions until max jobs reached
+        """
+        if not get_network_available():
+            return
+        from lollypop.helper_web import WebHelper
+        while self.__pending and len(self.__running) < self.__MAX_JOBS:
+            track = self.__pending.pop(0)
+            cancellable = Gio.Cancellable.new()
+            self.__running[track.id] = cancellable
+            helper = WebHelper(track, cancellable)
+            helper.connect("loaded", self.__on_web_helper_loaded,
+                           track, cancellable)
+            helper.load()
+
+    def __get_expire(self, uri):
+        """
+            Get expire timestamp for stream URI
+            @param uri as str
+            @return int
+        """
+        expire = time() + self.__TTL
+        match = search(r"[?&/]expire[=/](\d+)", uri)
+        if match is not None:
+            expire = min(expire, int(match.group(1)))
+        return expire
+
+    def __on_web_helper_loaded(self, helper, uri, track, cancellable):
+        """
+            Keep resolved URI
+            @param helper as WebHelper
+            @param uri as str
+            @param track as Track
+            @param cancellable as Gio.Cancellable
+        """
+        if cancellable.is_cancelled():
+            return
+        if self.__running.get(track.id, None) == cancellable:
+            del self.__running[track.id]
+        if uri:
+            Logger.info("Prefetched %s", track.uri)
+            self.__uris[track.id] = (uri, self.__get_expire(uri))
+        self.__run_jobs()
@@ -14,6 +14,7 @@ from gi.repository import GLib, Gio
 
 from re import sub
 
+from lollypop.define import App
 from lollypop.helper_web_base import BaseWebHelper
 from lollypop.utils import emit_signal
 from lollypop.utils_file import get_youtube_dl
@@ -45,9 +46,26 @@ class YouTubeWebHelper(BaseWebHelper):
             proxy = GLib.environ_getenv(GLib.get_environ(), "all_proxy")
             if proxy is not None and proxy.startswith("socks://"):
                 proxy = proxy.replace("socks://", "socks4://")
-            (path, env) = get_youtube_dl()
             # Remove playlist args
             uri = sub("list=.*", "", uri)
+            App().youtube_dl.resolve(uri, proxy,
+                                     self.__on_youtube_dl_resolved,
+                                     uri, proxy, cancellable)
+        except Exception as e:
+            Logger.error("YouTubeWebHelper::get_uri_content(): %s", e)
+
+#######################
+# PRIVATE             #
+#######################
+    def __get_uri_content_with_process(self, uri, proxy, cancellable):
+        """
+            Get content uri with a new youtube-dl process
+            @param uri as str
+            @param proxy as str/None
+            @param cancellable as Gio.Cancellable
+        """
+        try:
+            (path, env) = get_youtube_dl()
             argv = [path, "--no-cache-dir", "-g", "-f", "bestaudio", uri]
             if proxy is not None:
                 argv += ["--proxy", proxy, None]
@@ -56,11 +74,22 @@ class YouTubeWebHelper(BaseWebHelper):
             process = Gio.Subprocess.new(argv, Gio.SubprocessFlags.STDOUT_PIPE)
             process.wait_async(cancellable, self.__on_youtube_dl, cancellable)
         except Exception as e:
-            Logger.error("YouTubeWebHelper::get_uri_content(): %s", e)
+            Logger.error("YouTubeWebHelper::"
+                         "__get_uri_content_with_process(): %s", e)
+
+    def __on_youtube_dl_resolved(self, content, uri, proxy, cancellable):
+        """
+            Emit signal for content, fallback to a process if worker failed
+            @param content as str/None
+            @param uri as str
+            @param proxy as str/None
+            @param cancellable as Gio.Cancellable
+        """
+        if content is None:
+            self.__get_uri_content_with_process(uri, proxy, cancellable)
+        else:
+            emit_signal(self, "uri-content-loaded", content)
 
-#######################
-# PRIVATE             #
-#######################
     def __on_youtube_dl(self, process, result, cancellable):
         """
             Emit signal for content
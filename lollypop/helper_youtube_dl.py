@@ -0,0 +1,227 @@
+# Copyright (c) 2014-2021 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from gi.repository import GLib, Gio
+
+import json
+import sys
+from os import path
+
+from lollypop.logger import Logger
+from lollypop.utils_file import get_youtube_dl
+
+
+class YouTubeDlHelper:
+    """
+        Resolve stream URIs with a long-lived youtube-dl/yt-dlp process
+        Extractors are imported once, requests are written by batch and
+        answered over pipes. Worker is restarted on next request if it dies
+        and at once if a request times out
+    """
+
+    __WORKER = path.join(path.dirname(path.abspath(__file__)),
+                         "youtube_dl_worker.py")
+    # Request timeout in seconds
+    __TIMEOUT = 30
+
+    def __init__(self):
+        """
+            Init helper
+        """
+        self.__process = None
+        self.__stdin = None
+        self.__ready = False
+        # False if extractors can't be imported, use a process per request
+        self.__available = True
+        self.__next_id = 0
+        # {request id: (callback, args, timeout id, request line)}
+        self.__requests = {}
+        self.__batch = []
+        self.__batch_id = None
+
+    def resolve(self, uri, proxy, callback, *args):
+        """
+            Resolve stream URI
+            Callback gets None if worker is not available
+            @param uri as str
+            @param proxy as str/None
+            @param callback as function(str/None, *args)
+        """
+        if not self.__available:
+            callback(None, *args)
+            return
+        if self.__process is None and not self.__spawn():
+            callback(None, *args)
+            return
+        request_id = self.__next_id
+        self.__next_id += 1
+        timeout_id = GLib.timeout_add_seconds(self.__TIMEOUT,
+                                              self.__on_timeout,
+                                              request_id)
+        line = json.dumps({"id": request_id,
+                           "uri": uri,
+                           "proxy": proxy}) + "\n"
+        self.__requests[request_id] = (callback, args, timeout_id, line)
+        self.__batch.append(line)
+        if self.__batch_id is None:
+            self.__batch_id = GLib.idle_add(self.__write_batch)
+
+    def stop(self):
+        """
+            Stop worker
+        """
+        if self.__process is not None:
+            self.__process.force_exit()
+        self.__reset(None)
+
+    @property
+    def available(self):
+        """
+            True if worker can be used
+            @return bool
+        """
+        return self.__available
+
+#######################
+# PRIVATE             #
+#######################
+    def __spawn(self):
+        """
+            Spawn worker process
+            @return bool
+        """
+        try:
+            (youtube_dl, env) = get_youtube_dl()
+            if youtube_dl is None:
+                return False
+            launcher = Gio.SubprocessLauncher.new(
+                Gio.SubprocessFlags.STDIN_PIPE |
+                Gio.SubprocessFlags.STDOUT_PIPE)
+            for variable in env:
+                (key, value) = variable.split("=", 1)
+                launcher.setenv(key, value, True)
+            process = launcher.spawnv([sys.executable, "-u", self.__WORKER])
+            self.__process = process
+            self.__stdin = process.get_stdin_pipe()
+            self.__ready = False
+            stdout = Gio.DataInputStream.new(process.get_stdout_pipe())
+            stdout.read_line_async(GLib.PRIORITY_LOW, None,
+                                   self.__on_read_line, process)
+            return True
+        except Exception as e:
+            Logger.error("YouTubeDlHelper::__spawn(): %s", e)
+            self.__available = False
+            return False
+
+    def __reset(self, process):
+        """
+            Forget worker process, pending requests get None
+            @param process as Gio.Subprocess/None => None for any process
+        """
+        if process is not None and process != self.__process:
+            return
+        self.__process = None
+        self.__stdin = None
+        self.__batch = []
+        if self.__batch_id is not None:
+            GLib.source_remove(self.__batch_id)
+            self.__batch_id = None
+        requests = self.__requests
+        self.__requests = {}
+        for (callback, args, timeout_id, line) in requests.values():
+            GLib.source_remove(timeout_id)
+            callback(None, *args)
+
+    def __restart(self):
+        """
+            Kill worker and send pending requests to a new one
+        """
+        process = self.__process
+        if process is None:
+            return
+        requests = self.__requests
+        self.__requests = {}
+        process.force_exit()
+        self.__reset(process)
+        if not requests:
+            return
+        if not self.__spawn():
+            for (callback, args, timeout_id, line) in requests.values():
+                GLib.source_remove(timeout_id)
+                callback(None, *args)
+            return
+        self.__requests = requests
+        self.__batch = [request[3] for request in requests.values()]
+        self.__batch_id = GLib.idle_add(self.__write_batch)
+
+    def __write_batch(self):
+        """
+            Write pending requests to worker
+        """
+        self.__batch_id = None
+        batch = self.__batch
+        self.__batch = []
+        try:
+            if self.__stdin is not None and batch:
+                self.__stdin.write_all("".join(batch).encode("utf-8"), None)
+                self.__stdin.flush(None)
+        except Exception as e:
+            Logger.error("YouTubeDlHelper::__write_batch(): %s", e)
+            self.stop()
+
+    def __on_read_line(self, stdout, result, process):
+        """
+            Dispatch worker response
+            @param stdout as Gio.DataInputStream
+            @param result as Gio.AsyncResult
+            @param process as Gio.Subprocess
+        """
+        try:
+            (line, length) = stdout.read_line_finish_utf8(result)
+        except Exception as e:
+            Logger.error("YouTubeDlHelper::__on_read_line(): %s", e)
+            line = None
+        if line is None:
+            # Worker died
+            if process == self.__process and not self.__ready:
+                Logger.warning("YouTubeDlHelper: worker not available")
+                self.__available = False
+            self.__reset(process)
+            return
+        try:
+            response = json.loads(line)
+            if "ready" in response:
+                self.__ready = response["ready"]
+                if not self.__ready:
+                    Logger.warning("YouTubeDlHelper: %s", response["error"])
+            else:
+                request = self.__requests.pop(response["id"], None)
+                if request is not None:
+                    (callback, args, timeout_id, line) = request
+                    GLib.source_remove(timeout_id)
+                    callback(response["uri"], *args)
+        except Exception as e:
+            Logger.error("YouTubeDlHelper::__on_read_line(): %s", e)
+        stdout.read_line_async(GLib.PRIORITY_LOW, None,
+                               self.__on_read_line, process)
+
+    def __on_timeout(self, request_id):
+        """
+            Give up request and restart worker, it may be stuck
+            @param request_id as int
+        """
+        request = self.__requests.pop(request_id, None)
+        if request is not None:
+            (callback, args, timeout_id, line) = request
+            Logger.warning("YouTubeDlHelper: request timed out")
+            callback("", *args)
+            self.__restart()
@@ -16,7 +16,7 @@ from hashlib import md5
 from lollypop.define import App, StorageType, ScanUpdate, Type
 from lollypop.objects_track import Track
 from lollypop.objects import Base
-from lollypop.utils import emit_signal
+from lollypop.utils import emit_signal, remove_static
 from lollypop.collection_item import CollectionItem
 from lollypop.logger import Logger
 
@@ -172,6 +172,92 @@ class Album(Base):
         """
         self.__discs = discs
 
+    @staticmethod
+    def preload_tracks(albums):
+        """
+            Load discs and tracks for albums with one query per filter set
+            instead of one query per album disc
+            @param albums as [Album]
+        """
+        groups = {}
+        for album in albums:
+            if album.id is None or album.id < 0 or album.__tracks or\
+                    album.__discs:
+                continue
+            key = (tuple(remove_static(album.genre_ids)),
+                   album.__tracks_storage_type,
+                   album.__skipped,
+                   album.__disc_number)
+            groups.setdefault(key, []).append(album)
+        # Album artist ids are lazy loaded, fetch missing ones at once
+        missing = [album for group in groups.values() for album in group
+                   if album.__dict__.get("artist_ids",
+                                         album.__dict__.get("_artist_ids"))
+                   is None]
+        if missing:
+            artist_ids = App().albums.get_artist_ids_for_ids(
+                [album.id for album in missing])
+            for album in missing:
+                album._artist_ids = artist_ids[album.id]
+        for (key, group) in groups.items():
+            (genre_ids, storage_type, skipped, disc_number) = key
+            rows = {}
+            for row in App().albums.get_tracks_for_ids(
+                    [album.id for album in group],
+                    list(genre_ids), storage_type, skipped):
+                rows.setdefault(row[0], []).append(row[1:])
+            for album in group:
+                artist_ids = remove_static(album.artist_ids)
+                track_ids = set()
+                discs = {}
+                for (disc, track_id, number, artist_id) in rows.get(album.id,
+                                                                    []):
+                    if track_id in track_ids or\
+                            (disc_number is not None and
+                             disc != disc_number) or\
+                            (artist_ids and artist_id not in artist_ids):
+                        continue
+                    track_ids.add(track_id)
+                    track = Track(track_id, album)
+                    track.set_number(number)
+                    discs.setdefault(disc, []).append(track)
+                album.__discs = []
+                album.__tracks = []
+                # Rows are ordered by disc number
+                for (number, tracks) in discs.items():
+                    disc = Disc(album, number, storage_type, skipped)
+                    disc.set_tracks(tracks)
+                    album.__discs.append(disc)
+                    album.__tracks += tracks
+
+    @staticmethod
+    def new_from_state(state):
+        """
+            Get album from compact state, tracks not in state are loaded
+            from DB on demand
+            @param state as tuple, see Album.get_state()
+            @return Album
+        """
+        (album_id, genre_ids, artist_ids, skipped,
+         disc_number, storage_type, track_ids) = state
+        album = Album(album_id, genre_ids, artist_ids, skipped)
+        album.__disc_number = disc_number
+        album.__tracks_storage_type = storage_type
+        album.__tracks = [Track(track_id, album) for track_id in track_ids]
+        return album
+
+    def get_state(self):
+        """
+            Get compact state with only ids, loaded tracks only
+            @return tuple
+        """
+        # Do not query DB for artist ids, only keep ones set by caller
+        artist_ids = self.__dict__.get("artist_ids", [])
+        return (self.id, list(self.genre_ids), list(artist_ids),
+                self.__skipped, self.__disc_number,
+                self.__tracks_storage_type,
+                [track.id for track in self.__tracks])
+
     def set_disc_number(self, disc_number):
         """
             Set album disc
@@ -268,6 +354,16 @@ class Album(Base):
         if self.id >= 0:
             self.db.set_loved(self.id, loved)
             self.loved = loved
+            App().snapshot.update_album(self.id)
+
+    def set_popularity(self, new_rate):
+        """
+            Set popularity
+            @param new_rate as int between 0 and 5
+        """
+        Base.set_popularity(self, new_rate)
+        if self.id is not None and self.id >= 0:
+            App().snapshot.update_album(self.id)
 
     def set_uri(self, uri):
         """
@@ -113,6 +113,25 @@ class Track(Base):
         if self.id >= 0:
             App().tracks.set_loved(self.id, loved)
             self.loved = loved
+            App().playlists.update_smart([self.id])
+
+    def set_popularity(self, new_rate):
+        """
+            Set popularity
+            @param new_rate as int between 0 and 5
+        """
+        Base.set_popularity(self, new_rate)
+        if self.id is not None and self.id >= 0:
+            App().playlists.update_smart([self.id])
+
+    def set_rate(self, rate):
+        """
+            Set rate
+            @param rate as int between -1 and 5
+        """
+        Base.set_rate(self, rate)
+        if self.id >= 0:
+            App().playlists.update_smart([self.id])
 
     def get_featuring_artist_ids(self, album_artist_ids):
         """
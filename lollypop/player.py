@@ -10,9 +10,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-from gi.repository import GLib, GObject
+from gi.repository import GLib, GObject, Gio
 
-from pickle import load
+from pickle import load, dump
 from time import time
 
 from lollypop.player_albums import AlbumsPlayer
@@ -25,7 +25,8 @@ from lollypop.player_shuffle import ShufflePlayer
 from lollypop.player_transitions import TransitionsPlayer
 from lollypop.logger import Logger
 from lollypop.objects_track import Track
-from lollypop.define import App, Type, LOLLYPOP_DATA_PATH
+from lollypop.objects_album import Album
+from lollypop.define import App, Type, StorageType, LOLLYPOP_DATA_PATH
 from lollypop.utils import emit_signal
 
 
@@ -36,6 +37,14 @@ class Player(GObject.GObject, AlbumsPlayer, BinPlayer, AutoRandomPlayer,
         Player object used to manage playback and playlists
     """
 
+    __STATE_PATH = LOLLYPOP_DATA_PATH + "/player_state.bin"
+    # Bump when state format changes, old states are then ignored
+    __STATE_VERSION = 1
+    # State files written by previous versions
+    __OLD_STATE_NAMES = ["track_id", "player", "position", "queue", "Albums"]
+    # Upcoming web tracks with a prefetched stream URI
+    __PREFETCH_COUNT = 3
+
     __gsignals__ = {
         "current-changed": (GObject.SignalFlags.RUN_FIRST, None, ()),
         "duration-changed": (GObject.SignalFlags.RUN_FIRST, None, (int,)),
@@ -73,6 +82,7 @@ class Player(GObject.GObject, AlbumsPlayer, BinPlayer, AutoRandomPlayer,
         TransitionsPlayer.__init__(self)
         self.__stop_after_track_id = None
         App().settings.connect("changed::repeat", self.update_next_prev)
+        self.connect("next-changed", self.__on_next_changed)
 
     def load(self, track):
         """
@@ -128,43 +138,53 @@ class Player(GObject.GObject, AlbumsPlayer, BinPlayer, AutoRandomPlayer,
             artists = ", ".join(self._current_track.album_artists)
         return artists
 
+    def save_state(self):
+        """
+            Save player state, only ids are saved
+        """
+        track_id = None
+        albums = []
+        position = 0
+        shuffle = None
+        if App().settings.get_value("shuffle") or self.is_party:
+            shuffle = self.get_shuffle_state()
+        if self._current_track.id is not None:
+            position = self.position
+            if not self._current_track.storage_type & StorageType.EPHEMERAL:
+                track_id = self._current_track.id
+                albums = [album.get_state() for album in self._albums]
+        state = {"version": self.__STATE_VERSION,
+                 "track_id": track_id,
+                 "is_playing": self.is_playing,
+                 "is_party": self.is_party,
+                 "position": position,
+                 "queue": list(self.queue),
+                 "albums": albums,
+                 "shuffle": shuffle}
+        try:
+            with open(self.__STATE_PATH, "wb") as f:
+                dump(state, f)
+        except Exception as e:
+            Logger.error("Player::save_state(): %s" % e)
+
     def restore_state(self):
         """
-            Restore player state
+            Restore player state after first frame
         """
+        self.__import_state()
         try:
             if App().settings.get_value("save-state"):
-                self._current_track = Track(
-                    load(open(LOLLYPOP_DATA_PATH + "/track_id.bin", "rb")))
-                self.set_queue(load(open(LOLLYPOP_DATA_PATH +
-                                         "/queue.bin", "rb")))
-                albums = load(open(LOLLYPOP_DATA_PATH + "/Albums.bin", "rb"))
-                (is_playing, was_party) = load(open(LOLLYPOP_DATA_PATH +
-                                                    "/player.bin", "rb"))
-                if self._current_track.uri:
-                    if albums:
-                        if was_party:
-                            # Tips: prevents player from loading albums
-                            self._is_party = True
-                            App().lookup_action("party").change_state(
-                                GLib.Variant("b", True))
-                        self.set_albums(albums)
-                        # Load track from player albums
-                        index = self.album_ids.index(
-                            self._current_track.album.id)
-                        for track in self._albums[index].tracks:
-                            if track.id == self._current_track.id:
-                                self._load_track(track)
-                                break
-                    if is_playing:
-                        self.play()
-                    else:
-                        self.pause()
-                    position = load(open(LOLLYPOP_DATA_PATH + "/position.bin",
-                                    "rb"))
-                    self.seek(position)
-                else:
-                    Logger.debug("Player::restore_state(): track missing")
+                with open(self.__STATE_PATH, "rb") as f:
+                    state = load(f)
+                if state.get("version", None) != self.__STATE_VERSION:
+                    Logger.debug("Player::restore_state(): unknown version")
+                    return
+                self.set_queue(state["queue"])
+                if state["track_id"] is not None:
+                    GLib.idle_add(self.__restore_state, state,
+                                  priority=GLib.PRIORITY_LOW)
+        except FileNotFoundError:
+            pass
         except Exception as e:
             Logger.error("Player::restore_state(): %s" % e)
 
@@ -268,12 +288,18 @@ class Player(GObject.GObject, AlbumsPlayer, BinPlayer, AutoRandomPlayer,
         # Track has been played
         # for at least half its duration, or for 4 minutes
         played = time() - self._start_time
-        if played >= track.duration / 2000 or played >= 240:
+        listened = played >= track.duration / 2000 or played >= 240
+        if track.id >= 0:
+            App().listens.add(track.id, track.album_id,
+                              int(self._start_time), int(played * 1000),
+                              not listened)
+        if listened:
             self.__scrobble(track, self._start_time)
             if track.id >= 0:
                 App().tracks.set_listened_at(track.id, int(time()))
                 # Increment popularity
                 App().tracks.set_more_popular(track.id)
+                App().playlists.update_smart([track.id])
                 # In party mode, linear popularity
                 if self.is_party:
                     pop_to_add = 1
@@ -282,6 +308,7 @@ class Player(GObject.GObject, AlbumsPlayer, BinPlayer, AutoRandomPlayer,
                     count = track.album.tracks_count
                     pop_to_add = int(App().albums.max_count / count)
                 App().albums.set_more_popular(track.album_id, pop_to_add)
+                App().snapshot.update_album(track.album_id)
 
     def _on_stream_start(self, bus, message):
         """
@@ -291,6 +318,7 @@ class Player(GObject.GObject, AlbumsPlayer, BinPlayer, AutoRandomPlayer,
             self.remove_from_queue(self._current_track.id)
         ShufflePlayer._on_stream_start(self, bus, message)
         BinPlayer._on_stream_start(self, bus, message)
+        TransitionsPlayer._on_stream_start(self, bus, message)
         AutoSimilarPlayer._on_stream_start(self, bus, message)
         self.set_next()
         self.set_prev()
@@ -298,6 +326,168 @@ class Player(GObject.GObject, AlbumsPlayer, BinPlayer, AutoRandomPlayer,
 #######################
 # PRIVATE             #
 #######################
+    def __get_upcoming_web_tracks(self):
+        """
+            Get web tracks to be played soon: next track, queue and
+            following album tracks in linear mode
+            @return [Track]
+        """
+        tracks = [self._next_track]
+        for track_id in self.queue[:self.__PREFETCH_COUNT]:
+            tracks.append(Track(track_id))
+        if not App().settings.get_value("shuffle") and not self.is_party and\
+                self._next_track.id is not None:
+            album_tracks = self._next_track.album.tracks
+            if self._next_track in album_tracks:
+                index = album_tracks.index(self._next_track)
+                tracks += album_tracks[index + 1:
+                                       index + 1 + self.__PREFETCH_COUNT]
+        upcoming = []
+        for track in tracks:
+            if track.id is not None and track.is_web and\
+                    not track.uri_loaded and track not in upcoming:
+                upcoming.append(track)
+        return upcoming[:self.__PREFETCH_COUNT]
+
+    def __import_state(self):
+        """
+            Move state saved by previous versions to current format
+        """
+        files = {}
+        for name in self.__OLD_STATE_NAMES:
+            f = Gio.File.new_for_path(LOLLYPOP_DATA_PATH + "/%s.bin" % name)
+            if f.query_exists():
+                files[name] = f
+        if not files:
+            return
+        try:
+            if not Gio.File.new_for_path(self.__STATE_PATH).query_exists():
+                values = {}
+                for (name, f) in files.items():
+                    with open(f.get_path(), "rb") as old:
+                        values[name] = load(old)
+                (is_playing, is_party) = values.get("player", (False, False))
+                albums = [album.get_state()
+                          for album in values.get("Albums", None) or []]
+                state = {"version": self.__STATE_VERSION,
+                         "track_id": values.get("track_id", None),
+                         "is_playing": is_playing,
+                         "is_party": is_party,
+                         "position": values.get("position", 0),
+                         "queue": list(values.get("queue", None) or []),
+                         "albums": albums,
+                         "shuffle": None}
+                with open(self.__STATE_PATH, "wb") as f:
+                    dump(state, f)
+        except Exception as e:
+            Logger.warning("Player::__import_state(): %s", e)
+        for f in files.values():
+            try:
+                f.delete(None)
+            except Exception as e:
+                Logger.warning("Player::__import_state(): %s", e)
+
+    def __restore_state(self, state):
+        """
+            Restore current track then rehydrate albums in background
+            @param state as {}
+        """
+        track = Track(state["track_id"])
+        if not track.uri:
+            Logger.debug("Player::restore_state(): track missing")
+            return
+        self._current_track = track
+        emit_signal(self, "current-changed")
+        if state["is_party"]:
+            # Tips: prevents player from loading albums
+            self._is_party = True
+            App().lookup_action("party").change_state(
+                GLib.Variant("b", True))
+            App().task_helper.run(self.__get_party_albums_from_state,
+                                  state["albums"],
+                                  callback=(self.__on_albums_restored,
+                                            state))
+        elif state["albums"]:
+            App().task_helper.run(self.__get_albums_from_state,
+                                  state["albums"],
+                                  callback=(self.__on_albums_restored,
+                                            state))
+        else:
+            self.__restore_playback(state, track)
+
+    def __get_albums_from_state(self, albums_state):
+        """
+            Get albums from state, removed albums are ignored
+            @param albums_state as [tuple]
+            @return [Album]
+            @thread safe
+        """
+        albums = []
+        for album_state in albums_state:
+            album = Album.new_from_state(album_state)
+            if album.storage_type:
+                albums.append(album)
+        return albums
+
+    def __get_party_albums_from_state(self, albums_state):
+        """
+            Set party mode ids and get played albums from state
+            @param albums_state as [tuple]
+            @return [Album]
+            @thread safe
+        """
+        self.set_party_ids()
+        return self.__get_albums_from_state(albums_state)
+
+    def __restore_playback(self, state, track):
+        """
+            Load track and restore playback status and position
+            @param state as {}
+            @param track as Track
+        """
+        self._load_track(track)
+        if state["is_playing"]:
+            self.play()
+        else:
+            self.pause()
+        self.seek(state["position"])
+
+    def __on_next_changed(self, player):
+        """
+            Prefetch stream URIs for upcoming web tracks
+            @param player as Player
+        """
+        try:
+            self._web_prefetch.update(self.__get_upcoming_web_tracks())
+        except Exception as e:
+            Logger.error("Player::__on_next_changed(): %s", e)
+
+    def __on_albums_restored(self, albums, state):
+        """
+            Set player albums and load current track from them
+            @param albums as [Album]
+            @param state as {}
+        """
+        track = self._current_track
+        if albums:
+            self.set_albums(albums)
+            # Load track from player albums
+            for album in albums:
+                if album.id != track.album.id:
+                    continue
+                for album_track in album.tracks:
+                    if album_track.id == track.id:
+                        track = album_track
+                        break
+                break
+        shuffle = state.get("shuffle", None)
+        if shuffle is not None and\
+                (App().settings.get_value("shuffle") or self.is_party):
+            self.set_shuffle_state(shuffle)
+        if state["is_party"]:
+            emit_signal(self, "loading-changed", False, Track())
+        self.__restore_playback(state, track)
+
     def __scrobble(self, track, finished_start_time):
         """
             Scrobble on lastfm
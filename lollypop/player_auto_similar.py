@@ -17,7 +17,7 @@ from random import shuffle
 from lollypop.objects_album import Album
 from lollypop.objects_track import Track
 from lollypop.logger import Logger
-from lollypop.define import App, Repeat, StorageType
+from lollypop.define import App, Repeat, StorageType, TaskPriority
 from lollypop.utils import sql_escape, get_network_available
 from lollypop.utils import get_default_storage_type, emit_signal
 from lollypop.utils_album import tracks_to_albums
@@ -224,7 +224,9 @@ class AutoSimilarPlayer:
                 similars.get_similar_artists,
                 App().player.current_track.artist_ids,
                 self.__next_cancellable,
-                callback=(self.__on_get_local_similar_artists,))
+                callback=(self.__on_get_local_similar_artists,),
+                priority=TaskPriority.PREFETCH,
+                cancellable=self.__next_cancellable)
 
     def __on_get_local_similar_artists(self, artists):
         """
@@ -267,7 +269,9 @@ class AutoSimilarPlayer:
                 similars.get_similar_artists,
                 player.current_track.artist_ids,
                 self.__next_cancellable,
-                callback=(self.__on_get_similar_artists,))
+                callback=(self.__on_get_similar_artists,),
+                priority=TaskPriority.PREFETCH,
+                cancellable=self.__next_cancellable)
 
     def __on_match_track(self, similars, track_id, storage_type):
         """
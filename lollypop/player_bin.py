@@ -17,6 +17,7 @@ from gettext import gettext as _
 
 from lollypop.tagreader import TagReader, Discoverer
 from lollypop.player_plugins import PluginsPlayer
+from lollypop.helper_web_prefetch import WebPrefetchHelper
 from lollypop.define import GstPlayFlags, App, StorageType, Repeat
 from lollypop.codecs import Codecs
 from lollypop.logger import Logger
@@ -38,6 +39,7 @@ class BinPlayer:
         self.__track_in_pipe = False
         self.__cancellable = Gio.Cancellable()
         self.__codecs = Codecs()
+        self._web_prefetch = WebPrefetchHelper()
         self._current_track = Track()
         self._next_track = Track()
         self._prev_track = Track()
@@ -69,7 +71,8 @@ class BinPlayer:
             Load track and play it
             @param track as Track
         """
-        self._playbin.set_state(Gst.State.NULL)
+        # READY keeps audio sink opened
+        self._playbin.set_state(Gst.State.READY)
         if self._load_track(track):
             self.play()
 
@@ -247,11 +250,17 @@ class BinPlayer:
         try:
             emit_signal(self, "loading-changed", False, self._current_track)
             self._current_track = track
+            if track.is_web and not track.uri_loaded:
+                uri = self._web_prefetch.get_uri(track)
+                if uri is not None:
+                    track.set_uri(uri)
+                    track.set_preloaded()
             if track.is_web and not track.uri_loaded:
                 emit_signal(self, "loading-changed", True, track)
                 self.__load_from_web(track)
                 return False
             else:
+                self._plugins.set_replay_gain(track)
                 self._playbin.set_property("uri", track.uri)
         except Exception as e:  # Gstreamer error
             Logger.error("BinPlayer::_load_track(): %s" % e)
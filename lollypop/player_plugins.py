@@ -13,6 +13,8 @@
 
 from gi.repository import Gst
 
+from sys import byteorder
+
 from lollypop.define import App, ReplayGain
 from lollypop.logger import Logger
 
@@ -20,11 +22,17 @@ from lollypop.logger import Logger
 class PluginsPlayer:
     """
         Replay gain player
+        Audio filter is built once, replay gain and equalizer stages are
+        inserted or bypassed live from idle pad probes so audio sink is
+        never reopened on settings changes
     """
 
     __EQUALIZER = [55, 77, 110, 156, 220, 311, 440, 622,
                    880, 1200, 1800, 2500, 3500, 5000, 7000,
                    10000, 14000, 20000]
+    # Stages are linked while playing, keep one float format in chain
+    __CAPS = "audio/x-raw,format=F32%s" % ("LE" if byteorder == "little"
+                                           else "BE")
 
     def __init__(self, playbin):
         """
@@ -32,92 +40,60 @@ class PluginsPlayer:
             @param playbin as Gst.bin
         """
         self.__equalizer = None
+        self.__rgvolume = None
+        self.__rglimiter = None
         self.__playbin = playbin
-        self.build_audiofilter()
+        self.__build_audiofilter()
+        for key in ["replay-gain", "replay-gain-db", "replay-gain-limiter",
+                    "equalizer-enabled"]:
+            App().settings.connect("changed::%s" % key,
+                                   self.__on_settings_changed)
 
-    def build_audiofilter(self):
+    def update_audiofilter(self):
         """
-            Build audio filter
-            audioconvert ! (rgvolume ! rglimiter ! audioconvert) !
-            (equalizer) ! volume ! audioconvert ! audiosink
+            Apply settings to audio filter
         """
         try:
-            audiobin = Gst.ElementFactory.make("bin", None)
-            audioconvert_in = Gst.ElementFactory.make("audioconvert", None)
-            audiobin.add(audioconvert_in)
-            # Replay gain
-            replay_gain = App().settings.get_enum(
-                "replay-gain") != ReplayGain.NONE
-            if replay_gain:
-                rgvolume = Gst.ElementFactory.make("rgvolume", None)
-                rglimiter = Gst.ElementFactory.make("rglimiter", None)
-                audioconvert_rg = Gst.ElementFactory.make("audioconvert", None)
-                audiobin.add(rgvolume)
-                audiobin.add(rglimiter)
-                audiobin.add(audioconvert_rg)
-                audioconvert_in.link(rgvolume)
-                rgvolume.link(rglimiter)
-                rglimiter.link(audioconvert_rg)
-                if replay_gain == ReplayGain.ALBUM:
-                    rgvolume.props.album_mode = 1
-                else:
-                    rgvolume.props.album_mode = 0
-                rgvolume.props.pre_amp = App().settings.get_value(
+            replay_gain = App().settings.get_enum("replay-gain")
+            if replay_gain != ReplayGain.NONE:
+                self.__rgvolume.props.album_mode = \
+                    replay_gain == ReplayGain.ALBUM
+                self.__rgvolume.props.pre_amp = App().settings.get_value(
                     "replay-gain-db").get_double()
-                rglimiter.props.enabled = App().settings.get_value(
+                self.__rglimiter.props.enabled = App().settings.get_value(
                     "replay-gain-limiter")
+            self.__set_stage(self.__capsfilter,
+                             (self.__rgvolume, self.__rglimiter),
+                             self.volume,
+                             replay_gain != ReplayGain.NONE)
+            self.__set_stage(self.volume,
+                             (self.__equalizer, self.__equalizer),
+                             self.__audioconvert_out,
+                             App().settings.get_value("equalizer-enabled"))
+        except Exception as e:
+            Logger.error("PluginsPlayer::update_audiofilter(): %s", e)
 
-            # Internal volume manager
-            self.volume = Gst.ElementFactory.make("volume", None)
-            self.volume.props.volume = 1.0
-            audiobin.add(self.volume)
-            if replay_gain:
-                audioconvert_rg.link(self.volume)
-            else:
-                audioconvert_in.link(self.volume)
-
-            audiosink = Gst.ElementFactory.make("autoaudiosink", None)
-            audiobin.add(audiosink)
-
-            # Equalizer
-            self.__equalizer = None
-            if App().settings.get_value("equalizer-enabled"):
-                self.__equalizer = Gst.ElementFactory.make("equalizer-nbands",
-                                                           None)
-# GStreamer's GstIirEqualizerNBands sets up shelve filters for the first and
-# last bands as corner cases. That was causing the "inverted slider" bug.
-# As a workaround, we create two dummy bands at both ends of the spectrum.
-# This causes the actual first and last adjustable bands to be
-# implemented using band-pass filters.
-# Comment from Clementine source code, thanks Clementine devs!
-                self.__equalizer.set_property("num-bands", 18 + 2)
-                for idx in [0, 19]:
-                    band = self.__equalizer.get_child_by_index(idx)
-                    band.set_property("freq", 0)
-                    band.set_property("bandwidth", 0)
-                    band.set_property("gain", 0)
-                # Setup bandwidth, thanks again to Clementine project
-                last_band_freq = 0
-                for idx in range(1, 19):
-                    band = self.__equalizer.get_child_by_index(idx)
-                    freq = self.__EQUALIZER[idx - 1]
-                    bandwidth = freq - last_band_freq
-                    last_band_freq = freq
-                    band.set_property("bandwidth", bandwidth)
-                audiobin.add(self.__equalizer)
-                self.volume.link(self.__equalizer)
-                self.__equalizer.link(audiosink)
-            else:
-                self.volume.link(audiosink)
-
-            audiobin.add_pad(Gst.GhostPad.new(
-                "sink",
-                audioconvert_in.get_static_pad("sink")))
-            self.__playbin.set_property("audio-sink", audiobin)
-            if self.__equalizer is not None:
-                self.update_equalizer()
+    def set_replay_gain(self, track):
+        """
+            Use computed ReplayGain for track without gain tags
+            @param track as Track
+        """
+        try:
+            if self.__rgvolume is None:
+                return
+            fallback_gain = 0.0
+            if track.id is not None and track.id >= 0:
+                gains = App().tracks.get_replay_gain(track.id)
+                if gains is not None:
+                    (track_gain, track_peak, album_gain, album_peak) = gains
+                    if self.__rgvolume.props.album_mode and\
+                            album_gain is not None:
+                        fallback_gain = album_gain
+                    else:
+                        fallback_gain = track_gain
+            self.__rgvolume.props.fallback_gain = fallback_gain
         except Exception as e:
-            Logger.error("PluginsPlayer::init():", e)
+            Logger.error("PluginsPlayer::set_replay_gain(): %s", e)
 
     def update_equalizer(self):
         """
@@ -145,3 +121,117 @@ class PluginsPlayer:
 #######################
 # PRIVATE             #
 #######################
+    def __build_audiofilter(self):
+        """
+            Build audio filter
+            audioconvert ! capsfilter ! (rgvolume ! rglimiter) !
+            volume ! (equalizer) ! audioconvert ! audiosink
+        """
+        try:
+            audiobin = Gst.ElementFactory.make("bin", None)
+            audioconvert_in = Gst.ElementFactory.make("audioconvert", None)
+            self.__capsfilter = Gst.ElementFactory.make("capsfilter", None)
+            self.__capsfilter.props.caps = Gst.Caps.from_string(self.__CAPS)
+            # Replay gain
+            self.__rgvolume = Gst.ElementFactory.make("rgvolume", None)
+            self.__rglimiter = Gst.ElementFactory.make("rglimiter", None)
+            # Internal volume manager
+            self.volume = Gst.ElementFactory.make("volume", None)
+            self.volume.props.volume = 1.0
+            # Equalizer
+            self.__equalizer = Gst.ElementFactory.make("equalizer-nbands",
+                                                       None)
+# GStreamer's GstIirEqualizerNBands sets up shelve filters for the first and
+# last bands as corner cases. That was causing the "inverted slider" bug.
+# As a workaround, we create two dummy bands at both ends of the spectrum.
+# This causes the actual first and last adjustable bands to be
+# implemented using band-pass filters.
+# Comment from Clementine source code, thanks Clementine devs!
+            self.__equalizer.set_property("num-bands", 18 + 2)
+            for idx in [0, 19]:
+                band = self.__equalizer.get_child_by_index(idx)
+                band.set_property("freq", 0)
+                band.set_property("bandwidth", 0)
+                band.set_property("gain", 0)
+            # Setup bandwidth, thanks again to Clementine project
+            last_band_freq = 0
+            for idx in range(1, 19):
+                band = self.__equalizer.get_child_by_index(idx)
+                freq = self.__EQUALIZER[idx - 1]
+                bandwidth = freq - last_band_freq
+                last_band_freq = freq
+                band.set_property("bandwidth", bandwidth)
+            self.__audioconvert_out = Gst.ElementFactory.make("audioconvert",
+                                                              None)
+            audiosink = Gst.ElementFactory.make("autoaudiosink", None)
+            for element in [audioconvert_in, self.__capsfilter,
+                            self.__rgvolume, self.__rglimiter, self.volume,
+                            self.__equalizer, self.__audioconvert_out,
+                            audiosink]:
+                audiobin.add(element)
+            audioconvert_in.link(self.__capsfilter)
+            self.__rgvolume.link(self.__rglimiter)
+            self.__audioconvert_out.link(audiosink)
+            audiobin.add_pad(Gst.GhostPad.new(
+                "sink",
+                audioconvert_in.get_static_pad("sink")))
+            self.__playbin.set_property("audio-sink", audiobin)
+            self.update_equalizer()
+            self.update_audiofilter()
+        except Exception as e:
+            Logger.error("PluginsPlayer::__build_audiofilter(): %s", e)
+
+    def __set_stage(self, src, stage, sink, enabled):
+        """
+            Insert stage between src and sink or bypass it
+            Relinking is done when no buffer is flowing out of src
+            @param src as Gst.Element
+            @param stage as (Gst.Element, Gst.Element) => first, last
+            @param sink as Gst.Element
+            @param enabled as bool
+        """
+        (first, last) = stage
+        pad = src.get_static_pad("src")
+        peer = pad.get_peer()
+        expected = first if enabled else sink
+        if peer is not None and peer.get_parent_element() == expected:
+            return
+        pad.add_probe(Gst.PadProbeType.IDLE, self.__on_pad_idle,
+                      stage, sink, enabled)
+
+    def __on_pad_idle(self, pad, info, stage, sink, enabled):
+        """
+            Relink stage, may be called from a streaming thread
+            @param pad as Gst.Pad
+            @param info as Gst.PadProbeInfo
+            @param stage as (Gst.Element, Gst.Element) => first, last
+            @param sink as Gst.Element
+            @param enabled as bool
+            @return Gst.PadProbeReturn
+        """
+        try:
+            (first, last) = stage
+            src = pad.get_parent_element()
+            peer = pad.get_peer()
+            if peer is not None:
+                pad.unlink(peer)
+            last_pad = last.get_static_pad("src")
+            last_peer = last_pad.get_peer()
+            if last_peer is not None:
+                last_pad.unlink(last_peer)
+            if enabled:
+                src.link(first)
+                last.link(sink)
+            else:
+                src.link(sink)
+        except Exception as e:
+            Logger.error("PluginsPlayer::__on_pad_idle(): %s", e)
+        return Gst.PadProbeReturn.REMOVE
+
+    def __on_settings_changed(self, settings, value):
+        """
+            Update audio filter
+            @param settings as Gio.Settings
+            @param value as GLib.Variant
+        """
+        self.update_audiofilter()
@@ -10,9 +10,10 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-from random import shuffle, random
+from array import array
+from random import randint, choice
 
-from lollypop.define import Repeat, App
+from lollypop.define import Repeat, App, Type
 from lollypop.objects_track import Track
 from lollypop.objects_album import Album
 from lollypop.list import LinkedList
@@ -24,20 +25,30 @@ class ShufflePlayer:
     """
         Shuffle player
         Manage shuffle tracks and party mode
+        Albums are slots in id arrays, visited in a Fisher-Yates permutation
+        advanced one album at a time. Albums in order[0:active] still have
+        tracks to play, order[0:cursor] have been visited in current round.
+        In party mode, albums are only created when a track is needed
     """
 
     def __init__(self):
         """
             Init shuffle player
         """
-        # Albums to play, different from _albums for a better shuffle
-        self.__to_play_albums = []
-        # Albums who never have been played
-        self.__not_played_albums = []
+        # Album id for slot, Type.NONE if removed
+        self.__album_ids = array("l")
+        # Album for slot, None if not created yet
+        self.__albums = []
+        # Slots for album id
+        self.__slots = {}
+        # Slots permutation
+        self.__order = array("l")
+        self.__active = 0
+        self.__cursor = 0
+        # Played tracks for slot as a bitset of album track positions
+        self.__played = {}
         # Tracks already played
         self.__history = []
-        # Tracks already played by albums
-        self.__already_played_tracks = {}
         # Party mode
         self._is_party = False
         App().settings.connect("changed::shuffle", self.__set_shuffle)
@@ -52,7 +63,7 @@ class ShufflePlayer:
         """
         if self.shuffle_has_next:
             track = self.__history.next.value
-        elif self._albums:
+        elif self.__active:
             track = self.__get_next()
         else:
             track = Track()
@@ -69,6 +80,46 @@ class ShufflePlayer:
             track = self._current_track
         return track
 
+    def get_shuffle_state(self):
+        """
+            Get compact shuffle state: played tracks of partially played
+            albums and ids of albums without tracks to play
+            @return ([(int, int)], array)
+        """
+        exhausted_slots = set(self.__order[self.__active:])
+        played = [(self.__album_ids[slot], bits)
+                  for (slot, bits) in self.__played.items()
+                  if slot not in exhausted_slots and
+                  self.__album_ids[slot] != Type.NONE]
+        exhausted = array("l", [self.__album_ids[slot]
+                                for slot in exhausted_slots
+                                if self.__album_ids[slot] != Type.NONE])
+        return (played, exhausted)
+
+    def set_shuffle_state(self, state):
+        """
+            Restore shuffle state for current albums, a new round starts
+            @param state as ([(int, int)], array), see get_shuffle_state()
+        """
+        (played, exhausted) = state
+        exhausted = set(exhausted)
+        self.__played = {}
+        for (album_id, bits) in played:
+            for slot in self.__slots.get(album_id, []):
+                self.__played[slot] = bits
+        # Move albums without tracks to play out of active albums
+        order = self.__order
+        active = len(order)
+        i = 0
+        while i < active:
+            if self.__album_ids[order[i]] in exhausted:
+                active -= 1
+                (order[i], order[active]) = (order[active], order[i])
+            else:
+                i += 1
+        self.__active = active
+        self.__cursor = 0
+
     def set_party(self, party):
         """
             Set party mode on if party is True
@@ -76,7 +127,7 @@ class ShufflePlayer:
             @param party as bool
         """
         def start_party(*ignore):
-            if self._albums:
+            if self.__album_ids:
                 # Start a new song if not playing
                 if self._current_track.id is None:
                     track = self.__get_tracks_random()
@@ -116,10 +167,8 @@ class ShufflePlayer:
         self._albums = []
         if album_ids:
             emit_signal(self, "loading-changed", True, Track())
-        for album_id in album_ids:
-            album = Album(album_id, [], [], False)
-            self._albums.append(album)
-        emit_signal(self, "playback-setted", list(self._albums))
+        # Albums are created on demand, played ones are added to playback
+        self.__set_shuffle_albums(album_ids, [None] * len(album_ids))
 
     @property
     def is_party(self):
@@ -158,6 +207,10 @@ class ShufflePlayer:
         # Add track to shuffle history if needed
         if App().settings.get_value("shuffle") or self._is_party:
             self.__add_to_shuffle_history(self._current_track)
+            album = self._current_track.album
+            if self._is_party and album not in self._albums:
+                self._albums.append(album)
+                emit_signal(self, "playback-added", album)
             if self.__history:
                 next = self.__history.next
                 prev = self.__history.prev
@@ -204,22 +257,20 @@ class ShufflePlayer:
         """
         try:
             if App().settings.get_value("shuffle") or self._is_party:
-                if self._albums:
+                if self.__album_ids:
                     track = self.__get_tracks_random()
                     # All tracks done
                     # Try to get another one track after reseting history
                     if track.id is None:
-                        self.__to_play_albums = list(self._albums)
-                        shuffle(self.__to_play_albums)
                         repeat = App().settings.get_enum("repeat")
                         # Do not reset history if a new album is going to
                         # be added
                         if repeat not in [Repeat.AUTO_SIMILAR,
                                           Repeat.AUTO_RANDOM]:
                             self.__history = []
-                            self.__already_played_tracks = {}
+                            self.__reset_played()
                         if repeat == Repeat.ALL:
-                            return self.__get_next()
+                            track = self.__get_tracks_random()
                     return track
         except Exception as e:
             Logger.error("ShufflePLayer::__get_next(): %s", e)
@@ -228,43 +279,91 @@ class ShufflePlayer:
     def __get_tracks_random(self):
         """
             Return a random track and make sure it has never been played
+            Each call visits at most one album with tracks to play, albums
+            without tracks to play are moved out of active albums
             @return Track
         """
-        # True if all albums have been played on time
-        if not self.__not_played_albums:
-            self.__not_played_albums = list(self.__to_play_albums)
-        while self.__not_played_albums:
-            album = self.__not_played_albums.pop(0)
-            if not album.tracks:
-                continue
-            for track in sorted(album.tracks,
-                                key=lambda *args: random()):
-                if not self.__in_shuffle_history(track):
-                    return track
-            self.__to_play_albums.remove(album)
-        if self.__to_play_albums:
-            return self.__get_tracks_random()
-        else:
-            return Track()
+        order = self.__order
+        while self.__active:
+            if self.__cursor >= self.__active:
+                # All albums visited, start a new round
+                self.__cursor = 0
+            i = self.__cursor
+            j = randint(i, self.__active - 1)
+            (order[i], order[j]) = (order[j], order[i])
+            slot = order[i]
+            track = self.__get_not_played_track(slot)
+            if track is None:
+                self.__active -= 1
+                (order[i], order[self.__active]) =\
+                    (order[self.__active], order[i])
+            else:
+                self.__cursor += 1
+                return track
+        return Track()
+
+    def __get_not_played_track(self, slot):
+        """
+            Get a random track not played for slot
+            @param slot as int
+            @return Track/None
+        """
+        album = self.__get_album(slot)
+        if album is None:
+            return None
+        played = self.__played.get(slot, 0)
+        positions = [i for i in range(len(album.tracks))
+                     if not played >> i & 1]
+        if positions:
+            return album.tracks[choice(positions)]
+        return None
 
-    def __in_shuffle_history(self, track):
+    def __get_album(self, slot):
         """
-            True if track in shuffle history
-            @param track as Track
-            @return bool
+            Get album for slot, create it if needed
+            @param slot as int
+            @return Album/None
         """
-        return track.album.id in self.__already_played_tracks.keys() and\
-            track.id in self.__already_played_tracks[track.album.id]
+        album = self.__albums[slot]
+        if album is None and self.__album_ids[slot] != Type.NONE:
+            album = Album(self.__album_ids[slot], [], [], False)
+            self.__albums[slot] = album
+        return album
+
+    def __set_shuffle_albums(self, album_ids, albums):
+        """
+            Reset shuffle for albums
+            @param album_ids as [int]
+            @param albums as [Album/None] => None for albums created later
+        """
+        self.__album_ids = array("l", album_ids)
+        self.__albums = albums
+        self.__slots = {}
+        for (slot, album_id) in enumerate(album_ids):
+            self.__slots.setdefault(album_id, []).append(slot)
+        self.__order = array("l", range(len(album_ids)))
+        self.__reset_played()
+
+    def __reset_played(self):
+        """
+            Mark all tracks as not played
+        """
+        self.__played = {}
+        self.__active = len(self.__order)
+        self.__cursor = 0
 
     def __add_to_shuffle_history(self, track):
         """
             Add a track to shuffle history
             @param track as Track
         """
-        if track.album.id not in self.__already_played_tracks.keys():
-            self.__already_played_tracks[track.album.id] = []
-        if track not in self.__already_played_tracks[track.album.id]:
-            self.__already_played_tracks[track.album.id].append(track.id)
+        for slot in self.__slots.get(track.album.id, []):
+            album = self.__get_album(slot)
+            if album is None:
+                continue
+            for (i, track_id) in enumerate(album.track_ids):
+                if track_id == track.id:
+                    self.__played[slot] = self.__played.get(slot, 0) | 1 << i
 
     def __on_playback_added(self, player, album):
         """
@@ -272,16 +371,24 @@ class ShufflePlayer:
             @param player as Player
             @param album as Album
         """
-        if App().settings.get_value("shuffle") or self._is_party:
-            if album not in self.__to_play_albums:
-                self.__to_play_albums.append(album)
-                shuffle(self.__to_play_albums)
-            if album not in self.__not_played_albums:
-                self.__not_played_albums.append(album)
+        if self._is_party:
+            return
+        if App().settings.get_value("shuffle"):
+            if album not in self.__albums:
+                slot = len(self.__album_ids)
+                self.__album_ids.append(album.id)
+                self.__albums.append(album)
+                self.__slots.setdefault(album.id, []).append(slot)
+                # Add slot to active albums
+                self.__order.append(slot)
+                order = self.__order
+                (order[self.__active], order[-1]) =\
+                    (order[-1], order[self.__active])
+                self.__active += 1
             # If album already playing or
             # if current track was last one
             if App().player.current_track.album == album or\
-                    not self.__already_played_tracks:
+                    not self.__played:
                 self.__add_to_shuffle_history(App().player.current_track)
 
     def __on_playback_setted(self, player, albums):
@@ -290,12 +397,12 @@ class ShufflePlayer:
             @param player as Player
             @param albums as [Album]
         """
-        if App().settings.get_value("shuffle") or self._is_party:
-            self.__to_play_albums = albums
-            if albums:
-                shuffle(self.__to_play_albums)
-            self.__not_played_albums = []
-            self.__already_played_tracks = {}
+        # Party mode albums are handled by set_party_ids()
+        if self._is_party:
+            return
+        if App().settings.get_value("shuffle"):
+            self.__set_shuffle_albums([album.id for album in albums],
+                                      list(albums))
             if App().player.current_track.album in albums:
                 self.__add_to_shuffle_history(App().player.current_track)
 
@@ -306,7 +413,14 @@ class ShufflePlayer:
             @param album as Album
         """
         if App().settings.get_value("shuffle") or self._is_party:
-            if album in self.__to_play_albums:
-                self.__to_play_albums.remove(album)
-            if album in self.__not_played_albums:
-                self.__not_played_albums.remove(album)
+            # Removed slots are dropped when visited
+            slots = []
+            for slot in self.__slots.pop(album.id, []):
+                if self.__albums[slot] is None or\
+                        self.__albums[slot] == album:
+                    self.__albums[slot] = None
+                    self.__album_ids[slot] = Type.NONE
+                else:
+                    slots.append(slot)
+            if slots:
+                self.__slots[album.id] = slots
@@ -10,26 +10,38 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-from gi.repository import Gst, GLib, GstAudio
+from gi.repository import Gst, GLib, GstAudio, GstController
 
-from time import sleep
+from math import sin, cos, pi
 
-from lollypop.define import App
+from lollypop.define import App, TransitionsCurve
+from lollypop.logger import Logger
 
 
 class TransitionsPlayer:
     """
         Handle track transitions
+        Volume fades are interpolated by GStreamer from control points set
+        at stream time, main loop only starts and ends them. Fade ends are
+        rescheduled from stream position when playback state changes
     """
     __PADDING = 250
+    # Control points used to sample equal power curve
+    __EQUAL_POWER_POINTS = 16
 
     def __init__(self):
         """
             Init playbin
         """
-        self.__crossfading_id = None
-        self.__crossfade_up = False
-        self.__crossfade_down = False
+        self.__crossfading = False
+        self.__crossfade_timeout_id = None
+        # Running fades: playbin => [binding, timeout id, end position,
+        #                             plugins, end volume, callback]
+        self.__fades = {}
+        self.connect("status-changed", self.__schedule_crossfade)
+        self.connect("status-changed", self.__schedule_fades)
+        self.connect("seeked", self.__schedule_crossfade)
+        self.connect("duration-changed", self.__schedule_crossfade)
         self.update_crossfading()
 
     def load(self, track):
@@ -52,15 +64,8 @@ class TransitionsPlayer:
             Set crossfading on/off
             @param status as bool
         """
-        if status and self.__crossfading_id is None:
-            transition_duration = App().settings.get_value(
-                "transitions-duration").get_int32()
-            timemout = min(transition_duration, 500)
-            self.__crossfading_id = GLib.timeout_add(
-                timemout, self.__check_for_crossfading)
-        elif not status and self.__crossfading_id is not None:
-            GLib.source_remove(self.__crossfading_id)
-            self.__crossfading_id = None
+        self.__crossfading = status
+        self.__schedule_crossfade()
 
     def update_crossfading(self):
         """
@@ -77,58 +82,135 @@ class TransitionsPlayer:
             True if crossfading is on
             @return bool
         """
-        return self.__crossfading_id is not None
+        return self.__crossfading
+
+#######################
+# PROTECTED           #
+#######################
+    def _on_stream_start(self, bus, message):
+        """
+            Schedule crossfading for new track
+            @param bus as Gst.Bus
+            @param message as Gst.Message
+        """
+        self.__schedule_crossfade()
 
 #######################
 # PRIVATE             #
 #######################
-    def __check_for_crossfading(self):
+    def __schedule_crossfade(self, *ignore):
         """
-            Check if we need to do crossfading
+            Start crossfading when current track reaches transition
         """
-        if self._current_track.duration > 0:
-            remaining = self.remaining
-            transition_duration = App().settings.get_value(
-                    "transitions-duration").get_int32()
-            if remaining < transition_duration + self.__PADDING:
-                self.__do_crossfade(transition_duration,
-                                    self._next_track)
-        return True
+        if self.__crossfade_timeout_id is not None:
+            GLib.source_remove(self.__crossfade_timeout_id)
+            self.__crossfade_timeout_id = None
+        if not self.__crossfading or\
+                self._current_track.id is None or\
+                self._current_track.duration <= 0 or\
+                not self.is_playing:
+            return
+        transition_duration = App().settings.get_value(
+                "transitions-duration").get_int32()
+        delay = self.remaining - transition_duration - self.__PADDING
+        self.__crossfade_timeout_id = GLib.timeout_add(
+            max(delay, 0), self.__on_crossfade_timeout)
+
+    def __get_curve(self, start, end, duration):
+        """
+            Get control points for a fade
+            @param start as float
+            @param end as float
+            @param duration as int (ms)
+            @return ([(int, float)], GstController.InterpolationMode)
+        """
+        curve = App().settings.get_enum("transitions-curve")
+        if curve == TransitionsCurve.EQUAL_POWER:
+            points = []
+            count = self.__EQUAL_POWER_POINTS
+            for i in range(count + 1):
+                x = i / count
+                if end > start:
+                    value = start + (end - start) * sin(x * pi / 2)
+                else:
+                    value = end + (start - end) * cos(x * pi / 2)
+                points.append((int(x * duration), value))
+            return (points, GstController.InterpolationMode.LINEAR)
+        elif curve == TransitionsCurve.SMOOTH:
+            mode = GstController.InterpolationMode.CUBIC_MONOTONIC
+        else:
+            mode = GstController.InterpolationMode.LINEAR
+        return ([(0, start), (duration, end)], mode)
 
-    def __volume_up(self, playbin, plugins, duration):
+    def __fade(self, playbin, plugins, start, end, duration, callback):
         """
-            Make volume going up smoothly
+            Fade volume from start to end
             @param playbin as Gst.Bin
             @param plugins as PluginsPlayer
-            @param duration as int
+            @param start as float
+            @param end as float
+            @param duration as int (ms)
+            @param callback as function, called on main loop with playbin
+                   and plugins when fade is done
         """
-        plugins.volume.props.volume = 0.0
-        self.__crossfade_up = True
-        # We add padding because user will not hear track around 0.2
-        sleep_ms = (duration + self.__PADDING) / 10
-        while plugins.volume.props.volume < 1.0:
-            vol = round(plugins.volume.props.volume + 0.1, 1)
-            plugins.volume.props.volume = vol
-            sleep(sleep_ms / 1000)
-        self.__crossfade_up = False
+        self.__stop_fade(playbin, plugins)
+        plugins.volume.props.volume = start
+        (ok, position) = playbin.query_position(Gst.Format.TIME)
+        if not ok:
+            position = 0
+        (points, mode) = self.__get_curve(start, end, duration)
+        source = GstController.InterpolationControlSource.new()
+        source.props.mode = mode
+        for (timestamp, value) in points:
+            source.set(position + timestamp * Gst.MSECOND, value)
+        binding = GstController.DirectControlBinding.new_absolute(
+            plugins.volume, "volume", source)
+        plugins.volume.add_control_binding(binding)
+        timeout_id = GLib.timeout_add(duration, self.__on_fade_timeout,
+                                      playbin)
+        self.__fades[playbin] = [binding, timeout_id,
+                                 position + duration * Gst.MSECOND,
+                                 plugins, end, callback]
+
+    def __schedule_fades(self, *ignore):
+        """
+            End fades from stream position, paused fades do not end
+        """
+        for (playbin, fade) in self.__fades.items():
+            if fade[1] is not None:
+                GLib.source_remove(fade[1])
+                fade[1] = None
+            (ret, state, pending) = playbin.get_state(0)
+            if pending != Gst.State.VOID_PENDING:
+                state = pending
+            if state != Gst.State.PLAYING:
+                continue
+            (ok, position) = playbin.query_position(Gst.Format.TIME)
+            remaining = fade[2] - position if ok else 0
+            fade[1] = GLib.timeout_add(max(remaining // Gst.MSECOND, 0),
+                                       self.__on_fade_timeout, playbin)
 
-    def __volume_down(self, playbin, plugins, duration):
+    def __stop_fade(self, playbin, plugins):
         """
-            Make volume going down smoothly
+            Stop running fade for playbin
             @param playbin as Gst.Bin
             @param plugins as PluginsPlayer
-            @param duration as int
         """
-        plugins.volume.props.volume = 1.0
-        self.__crossfade_down = True
-        # We add padding because user will not hear track around 0.2
-        sleep_ms = (duration + self.__PADDING) / 10
-        while plugins.volume.props.volume > 0:
-            vol = round(plugins.volume.props.volume - 0.1, 1)
-            plugins.volume.props.volume = vol
-            sleep(sleep_ms / 1000)
-        playbin.set_state(Gst.State.NULL)
-        self.__crossfade_down = False
+        if playbin not in self.__fades.keys():
+            return
+        (binding, timeout_id, end_position,
+         plugins, end, callback) = self.__fades.pop(playbin)
+        if timeout_id is not None:
+            GLib.source_remove(timeout_id)
+        plugins.volume.remove_control_binding(binding)
+
+    def __stop_playbin(self, playbin, plugins):
+        """
+            Stop faded out playbin
+            @param playbin as Gst.Bin
+            @param plugins as PluginsPlayer
+        """
+        playbin.set_state(Gst.State.READY)
 
     def __do_crossfade(self, duration, track):
         """
@@ -142,14 +224,20 @@ class TransitionsPlayer:
             return
 
         # If some crossfade already running, just switch to track
-        if self.__crossfade_up or self.__crossfade_down:
-            self._playbin.set_state(Gst.State.NULL)
+        if self.__fades:
+            self._playbin.set_state(Gst.State.READY)
             if self._load_track(track):
                 self.play()
             return
 
-        App().task_helper.run(self.__volume_down, self._playbin,
-                              self._plugins, duration)
+        # We add padding because user will not hear track around 0.2
+        duration += self.__PADDING
+        try:
+            self.__fade(self._playbin, self._plugins, 1.0, 0.0, duration,
+                        self.__stop_playbin)
+        except Exception as e:
+            Logger.error("TransitionsPlayer::__do_crossfade(): %s", e)
+            self._playbin.set_state(Gst.State.READY)
         if self._playbin == self._playbin2:
             self._playbin = self._playbin1
             self._plugins = self._plugins1
@@ -158,9 +246,40 @@ class TransitionsPlayer:
             self._plugins = self._plugins2
         rate = App().settings.get_value("volume-rate").get_double()
         self._playbin.set_volume(GstAudio.StreamVolumeFormat.CUBIC, rate)
-        if track.id is not None:
-            self._playbin.set_state(Gst.State.NULL)
-            if self._load_track(track):
-                self._playbin.set_state(Gst.State.PLAYING)
-            App().task_helper.run(self.__volume_up, self._playbin,
-                                  self._plugins, duration)
+        self._playbin.set_state(Gst.State.READY)
+        try:
+            self.__fade(self._playbin, self._plugins, 0.0, 1.0, duration,
+                        None)
+        except Exception as e:
+            Logger.error("TransitionsPlayer::__do_crossfade(): %s", e)
+            self._plugins.volume.props.volume = 1.0
+        if self._load_track(track):
+            self._playbin.set_state(Gst.State.PLAYING)
+
+    def __on_crossfade_timeout(self):
+        """
+            Crossfade if current track reached transition, else reschedule
+        """
+        self.__crossfade_timeout_id = None
+        transition_duration = App().settings.get_value(
+                "transitions-duration").get_int32()
+        # Position moved since scheduling, wait again
+        if self.remaining > transition_duration + self.__PADDING * 2:
+            self.__schedule_crossfade()
+        else:
+            self.__do_crossfade(transition_duration, self._next_track)
+
+    def __on_fade_timeout(self, playbin):
+        """
+            Remove fade and set final volume
+            @param playbin as Gst.Bin
+        """
+        if playbin not in self.__fades.keys():
+            return
+        fade = self.__fades[playbin]
+        (binding, timeout_id, end_position, plugins, end, callback) = fade
+        fade[1] = None
+        self.__stop_fade(playbin, plugins)
+        plugins.volume.props.volume = end
+        if callback is not None:
+            callback(playbin, plugins)
@@ -17,15 +17,17 @@ import itertools
 import sqlite3
 from datetime import datetime
 from threading import Lock
+from time import time
 import json
 
 from lollypop.database import Database
-from lollypop.define import App, Type
+from lollypop.define import App, Type, TaskPriority
 from lollypop.objects_track import Track
 from lollypop.sqlcursor import SqlCursor
 from lollypop.localized import LocalizedCollation
 from lollypop.shown import ShownPlaylists
 from lollypop.utils import emit_signal, get_default_storage_type
+from lollypop.utils import make_storage_type_subrequest
 from lollypop.utils_file import get_mtime
 from lollypop.logger import Logger
 from lollypop.database_upgrade import DatabasePlaylistsUpgrade
@@ -60,11 +62,35 @@ class Playlists(GObject.GObject):
                         playlist_id INT NOT NULL,
                         uri TEXT NOT NULL)"""
 
+    __create_smart_tracks = """CREATE TABLE smart_tracks (
+                              playlist_id INT NOT NULL,
+                              position INT NOT NULL,
+                              track_id INT NOT NULL,
+                              uri TEXT NOT NULL)"""
+    __create_smart_tracks_idx = """CREATE INDEX idx_stp ON
+                                  smart_tracks(playlist_id, position)"""
+    __create_smart_tracks_track_idx = """CREATE INDEX idx_stt ON
+                                        smart_tracks(track_id)"""
+
+    # Delay before refreshing smart playlists for changed tracks (ms)
+    __SMART_DELAY = 1000
+    # Above this count, all smart playlists are refreshed
+    __SMART_MAX_CHANGES = 1000
+    # SQLite variables limit
+    __CHUNK_SIZE = 500
+
     def __init__(self):
         """
             Init playlists manager
         """
         self.thread_lock = Lock()
+        self.__smart_lock = Lock()
+        self.__refresh_lock = Lock()
+        self.__smart_track_ids = set()
+        self.__smart_all = False
+        self.__smart_timeout_id = None
+        # Storage type filtering materialized smart playlists
+        self.__smart_storage_type = None
         GObject.GObject.__init__(self)
         upgrade = DatabasePlaylistsUpgrade()
         # Create db schema
@@ -74,11 +100,22 @@ class Playlists(GObject.GObject):
                 with SqlCursor(self, True) as sql:
                     sql.execute(self.__create_playlists)
                     sql.execute(self.__create_tracks)
+                    sql.execute(self.__create_smart_tracks)
+                    sql.execute(self.__create_smart_tracks_idx)
+                    sql.execute(self.__create_smart_tracks_track_idx)
                     sql.execute("PRAGMA user_version=%s" % upgrade.version)
             except:
                 pass
         else:
             upgrade.upgrade(self)
+        App().settings.connect("changed::network-access",
+                               self.__on_network_changed)
+        App().settings.connect("changed::network-access-acl",
+                               self.__on_network_changed)
+        Gio.NetworkMonitor.get_default().connect("network-changed",
+                                                 self.__on_network_changed)
+        # Tracks may have been materialized with another network state
+        self.__on_network_changed()
 
     def get_new_name(self):
         """
@@ -158,6 +195,9 @@ class Playlists(GObject.GObject):
             sql.execute("DELETE FROM tracks\
                         WHERE playlist_id=?",
                         (playlist_id,))
+            sql.execute("DELETE FROM smart_tracks\
+                        WHERE playlist_id=?",
+                        (playlist_id,))
         emit_signal(self, "playlists-removed", playlist_id)
         App().art.remove_from_cache("playlist_" + name, "ROUNDED")
 
@@ -282,18 +322,68 @@ class Playlists(GObject.GObject):
 
     def get_smart_track_uris(self, playlist_id):
         """
-            Return available track uris for playlist
+            Return available track uris for smart playlist
             @param playlist_id as int
             @return [str]
         """
+        with SqlCursor(self) as sql:
+            result = sql.execute("SELECT uri\
+                                  FROM smart_tracks\
+                                  WHERE playlist_id=?\
+                                  ORDER BY position", (playlist_id,))
+            return list(itertools.chain(*result))
+
+    def get_smart_track_ids(self, playlist_id):
+        """
+            Return available track ids for smart playlist
+            @param playlist_id as int
+            @return [int]
+        """
+        with SqlCursor(self) as sql:
+            result = sql.execute("SELECT track_id\
+                                  FROM smart_tracks\
+                                  WHERE playlist_id=?\
+                                  ORDER BY position", (playlist_id,))
+            return list(itertools.chain(*result))
+
+    def refresh_smart(self, playlist_id):
+        """
+            Run smart playlist request and store its tracks
+            @param playlist_id as int
+            @return True if tracks changed
+        """
         request = self.get_smart_sql(playlist_id)
-        # We need to inject skipped/storage_type
-        storage_type = get_default_storage_type()
-        split = request.split("ORDER BY")
-        split[0] += " AND tracks.loved != %s" % Type.NONE
-        split[0] += " AND tracks.storage_type&%s " % storage_type
-        track_ids = App().db.execute("ORDER BY".join(split))
-        return [Track(track_id).uri for track_id in track_ids]
+        track_ids = []
+        if request and self.get_smart(playlist_id):
+            track_ids = App().db.execute(self.__get_smart_request(request))
+        if track_ids == self.get_smart_track_ids(playlist_id):
+            return False
+        uris = self.__get_uris(track_ids)
+        rows = [(playlist_id, position, track_id, uris[track_id])
+                for (position, track_id) in enumerate(track_ids)
+                if track_id in uris]
+        with SqlCursor(self, True) as sql:
+            sql.execute("DELETE FROM smart_tracks\
+                         WHERE playlist_id=?", (playlist_id,))
+            sql.executemany("INSERT INTO smart_tracks\
+                             (playlist_id, position, track_id, uri)\
+                             VALUES (?, ?, ?, ?)", rows)
+        return True
+
+    def update_smart(self, track_ids=None):
+        """
+            Refresh smart playlists for changed tracks, delayed
+            @param track_ids as [int] => None for all tracks
+            @thread safe
+        """
+        with self.__smart_lock:
+            if track_ids is None:
+                self.__smart_all = True
+            else:
+                self.__smart_track_ids.update(track_ids)
+            if self.__smart_timeout_id is None:
+                self.__smart_timeout_id = GLib.timeout_add(
+                    self.__SMART_DELAY, self.__on_smart_timeout)
 
     def get_track_ids(self, playlist_id):
         """
@@ -305,8 +395,17 @@ class Playlists(GObject.GObject):
         limit = App().settings.get_value("view-limit").get_int32()
         storage_type = get_default_storage_type()
         if playlist_id == Type.POPULARS:
-            track_ids = App().tracks.get_populars([], storage_type,
-                                                  False, limit)
+            # Most listened tracks at the moment first
+            start = int(time()) - App().listens.MOMENT_WINDOW
+            track_ids = [track_id for (track_id, count) in
+                         App().listens.get_track_ids(storage_type, False,
+                                                     limit, start)]
+            for track_id in App().tracks.get_populars([], storage_type,
+                                                      False, limit):
+                if len(track_ids) >= limit:
+                    break
+                if track_id not in track_ids:
+                    track_ids.append(track_id)
         elif playlist_id == Type.RECENTS:
             track_ids = App().tracks.get_recently_listened_to(storage_type,
                                                               False,
@@ -521,7 +620,8 @@ class Playlists(GObject.GObject):
                         SET smart_enabled=?\
                         WHERE rowid=?",
                         (smart, playlist_id))
-            emit_signal(self, "playlists-updated", playlist_id)
+        self.refresh_smart(playlist_id)
+        emit_signal(self, "playlists-updated", playlist_id)
 
     def set_smart_sql(self, playlist_id, request):
         """
@@ -537,7 +637,8 @@ class Playlists(GObject.GObject):
                         SET smart_sql=?\
                         WHERE rowid=?",
                         (request, playlist_id))
-            emit_signal(self, "playlists-updated", playlist_id)
+        self.refresh_smart(playlist_id)
+        emit_signal(self, "playlists-updated", playlist_id)
 
     def get_position(self, playlist_id, track_id):
         """
@@ -709,6 +810,143 @@ class Playlists(GObject.GObject):
 #######################
 # PRIVATE             #
 #######################
+    def __get_smart_request(self, request, track_ids=None):
+        """
+            Inject skipped/storage_type filters in smart request
+            @param request as str
+            @param track_ids as [int] => restrict request to track ids
+            @return str
+        """
+        storage_type = get_default_storage_type()
+        filters = " AND tracks.loved != %s AND %s" % (
+            Type.NONE,
+            make_storage_type_subrequest(storage_type, "tracks.storage_type"))
+        if track_ids is not None:
+            filters += " AND tracks.rowid IN (%s)" % ", ".join(
+                [str(int(track_id)) for track_id in track_ids])
+        split = request.split(" ORDER BY ")
+        # Filter each UNION member
+        split[0] = " UNION ".join(
+            [subrequest + filters for subrequest in split[0].split(" UNION ")])
+        return " ORDER BY ".join(split)
+
+    def __get_uris(self, track_ids):
+        """
+            Get uris for track ids
+            @param track_ids as [int]
+            @return {int: str}
+        """
+        uris = {}
+        with SqlCursor(App().db) as sql:
+            for i in range(0, len(track_ids), self.__CHUNK_SIZE):
+                chunk = track_ids[i:i + self.__CHUNK_SIZE]
+                result = sql.execute("SELECT rowid, uri FROM tracks\
+                                      WHERE rowid IN (%s)" %
+                                     ", ".join(["?"] * len(chunk)), chunk)
+                uris.update(result)
+        return uris
+
+    def __get_matching_ids(self, playlist_id, track_ids):
+        """
+            Get track ids matching smart playlist predicate
+            @param playlist_id as int
+            @param track_ids as [int]
+            @return set of int
+        """
+        request = self.get_smart_sql(playlist_id).split(" ORDER BY ")[0]
+        request = self.__get_smart_request(request, track_ids)
+        with SqlCursor(App().db) as sql:
+            result = sql.execute(request)
+            return set([row[0] for row in result])
+
+    def __update_smart(self, playlist_id, track_ids):
+        """
+            Update smart playlist for changed tracks
+            @param playlist_id as int
+            @param track_ids as [int]
+            @return True if tracks changed
+        """
+        request = self.get_smart_sql(playlist_id)
+        materialized = self.get_smart_track_ids(playlist_id)
+        changed = set(track_ids)
+        matching = self.__get_matching_ids(playlist_id, track_ids)
+        if not matching and not changed.intersection(materialized):
+            return False
+        if request.find("ORDER BY random()") == -1:
+            return self.refresh_smart(playlist_id)
+        # Do not shuffle random playlists again, only drop tracks not
+        # matching anymore and fill with new matching tracks
+        removed = changed.difference(matching).intersection(materialized)
+        kept = [track_id for track_id in materialized
+                if track_id not in removed]
+        limit = int(request.split(" LIMIT ")[-1])
+        added = list(matching.difference(kept))[:max(0, limit - len(kept))]
+        if not removed and not added:
+            return False
+        uris = self.__get_uris(added)
+        position = len(materialized)
+        with SqlCursor(self, True) as sql:
+            sql.executemany("DELETE FROM smart_tracks\
+                             WHERE playlist_id=? AND track_id=?",
+                            [(playlist_id, track_id) for track_id in removed])
+            sql.executemany("INSERT INTO smart_tracks\
+                             (playlist_id, position, track_id, uri)\
+                             VALUES (?, ?, ?, ?)",
+                            [(playlist_id, position + i, track_id,
+                              uris[track_id])
+                             for (i, track_id) in enumerate(added)
+                             if track_id in uris])
+        return True
+
+    def __refresh_smarts(self, track_ids):
+        """
+            Refresh smart playlists for changed tracks
+            @param track_ids as [int] => None for all tracks
+        """
+        with self.__refresh_lock:
+            with SqlCursor(self) as sql:
+                result = sql.execute("SELECT rowid\
+                                      FROM playlists\
+                                      WHERE smart_enabled=1\
+                                      AND smart_sql != ''")
+                playlist_ids = list(itertools.chain(*result))
+            for playlist_id in playlist_ids:
+                try:
+                    if track_ids is None:
+                        changed = self.refresh_smart(playlist_id)
+                    else:
+                        changed = self.__update_smart(playlist_id,
+                                                      track_ids)
+                    if changed:
+                        self.sync_to_disk(playlist_id)
+                        emit_signal(self, "playlists-updated", playlist_id)
+                except Exception as e:
+                    Logger.error("Playlists::__refresh_smarts(): %s", e)
+
+    def __on_network_changed(self, *ignore):
+        """
+            Refresh smart playlists if saved tracks are shown/hidden
+        """
+        storage_type = get_default_storage_type()
+        if storage_type != self.__smart_storage_type:
+            self.__smart_storage_type = storage_type
+            self.update_smart()
+
+    def __on_smart_timeout(self):
+        """
+            Refresh smart playlists in background
+        """
+        with self.__smart_lock:
+            self.__smart_timeout_id = None
+            track_ids = list(self.__smart_track_ids)
+            if self.__smart_all or\
+                    len(track_ids) > self.__SMART_MAX_CHANGES:
+                track_ids = None
+            self.__smart_track_ids = set()
+            self.__smart_all = False
+        App().task_helper.run(self.__refresh_smarts, track_ids,
+                              priority=TaskPriority.BACKGROUND)
+
     def __on_parse_finished(self, parser, result, playlist_id, uris):
         """
             Add tracks to playlists
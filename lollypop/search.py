@@ -12,7 +12,7 @@
 
 from gi.repository import GObject
 
-from lollypop.define import StorageType, App
+from lollypop.define import StorageType, App, TaskPriority
 from lollypop.utils import emit_signal, get_network_available
 from lollypop.search_local import LocalSearch
 
@@ -34,6 +34,7 @@ class Search(GObject.Object):
         """
         GObject.Object.__init__(self)
         self.__search_count = 0
+        self.__cancellable = None
         self.__local_search = LocalSearch()
         self.__connect_search_signals(self.__local_search)
         self.__web_search = None
@@ -97,27 +98,39 @@ class Search(GObject.Object):
             @param search as str
             @param cancellable as Gio.Cancellable
         """
+        # Tasks for a cancelled search may never run, count current one only
+        self.__cancellable = cancellable
+        self.__search_count = 1
         # Only local items
         storage_type = StorageType.COLLECTION |\
             StorageType.SAVED |\
             StorageType.SEARCH
         App().task_helper.run(self.__local_search.get,
-                              search, storage_type, cancellable)
-        self.__search_count += 1
+                              search, storage_type, cancellable,
+                              callback=(self.__on_finished, cancellable),
+                              priority=TaskPriority.UI,
+                              cancellable=cancellable)
         if self.__web_search is not None:
+            self.__search_count += 1
             storage_type = StorageType.SEARCH | StorageType.EPHEMERAL
             App().task_helper.run(self.__web_search.get,
-                                  search, storage_type, cancellable)
-            self.__search_count += 1
+                                  search, storage_type, cancellable,
+                                  callback=(self.__on_finished, cancellable),
+                                  priority=TaskPriority.PREFETCH,
+                                  cancellable=cancellable)
 
 #######################
 # PRIVATE             #
 #######################
-    def __on_finished(self, search):
+    def __on_finished(self, result, cancellable):
         """
             Emit finished signals if all search are finished
-            @param search as Search provider
+            @param result as None
+            @param cancellable as Gio.Cancellable
         """
+        if cancellable is not self.__cancellable or\
+                cancellable.is_cancelled():
+            return
         self.__search_count -= 1
         emit_signal(self, "finished", self.__search_count == 0)
 
@@ -132,4 +145,3 @@ class Search(GObject.Object):
                        lambda x, y, z: self.emit("match-album", y, z))
         search.connect("match-track",
                        lambda x, y, z: self.emit("match-track", y, z))
-        search.connect("finished", self.__on_finished)
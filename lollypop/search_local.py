@@ -12,8 +12,6 @@
 
 from gi.repository import GObject, GLib
 
-from collections import Counter
-
 from lollypop.define import App
 from lollypop.utils import noaccents
 
@@ -29,6 +27,11 @@ class LocalSearch(GObject.Object):
         "finished": (GObject.SignalFlags.RUN_FIRST, None, ()),
     }
 
+    # Candidates fetched from DB for each entity type before ranking
+    __LIMIT = 100
+    # Results emitted for each entity type
+    __MAX_RESULTS = 25
+
     def __init__(self):
         """
             Init search
@@ -37,15 +40,23 @@ class LocalSearch(GObject.Object):
 
     def get(self, search, storage_type, cancellable):
         """
-            Get match for search
+            Get match for search, results are emitted in rank order
             @param search as str
             @param storage_type as StorageType
             @param cancellable as Gio.Cancellable
         """
-        search = noaccents(search)
-        self.__get_artists(search, storage_type, cancellable)
-        self.__get_albums(search, storage_type, cancellable)
-        self.__get_tracks(search, storage_type, cancellable)
+        search = noaccents(search).strip()
+        words = self.__split_string(search)
+        for (signal, db) in [("match-artist", App().artists),
+                             ("match-album", App().albums),
+                             ("match-track", App().tracks)]:
+            if cancellable.is_cancelled():
+                break
+            rows = db.search(search, storage_type, words, self.__LIMIT)
+            ranked = self.__rank(search, words, rows)
+            for item_id in ranked[:self.__MAX_RESULTS]:
+                GLib.idle_add(self.__emit_match, signal,
+                              item_id, storage_type, cancellable)
         GLib.idle_add(self.emit, "finished")
 
 #######################
@@ -55,154 +66,62 @@ class LocalSearch(GObject.Object):
         """
             Split string for search
             @param string as str
-            @return str
+            @return [str]
         """
         split = []
         for word in string.split():
-            if len(word) > 2:
+            if len(word) > 2 and word not in split:
                 split.append(word)
         return split
 
-    def __search_tracks(self, search, storage_type, cancellable):
-        """
-            Get tracks for search items
-            @param search as str
-            @param storage_type as StorageType
-            @param cancellable as Gio.Cancellable
-            @return [int]
-        """
-        tracks = []
-        track_ids = []
-        split = self.__split_string(search)
-        for search_str in [search] + split:
-            tracks += App().tracks.search_performed(search_str, storage_type)
-            tracks += App().tracks.search(search_str, storage_type)
-            if cancellable.is_cancelled():
-                break
-        for (track_id, track_name) in tracks:
-            valid = True
-            no_accents = noaccents(track_name)
-            if not no_accents.startswith(search):
-                for word in split:
-                    if word not in no_accents:
-                        valid = False
-                        break
-            # Start with same word, adding to result
-            else:
-                track_ids.append(track_id)
-            # All words are valid, adding to result
-            if valid:
-                track_ids.append(track_id)
-            # Detect an artist match, adding to result
-            for artist in App().tracks.get_artists(track_id):
-                no_accents = noaccents(artist)
-                for word in split:
-                    if word in no_accents:
-                        track_ids.append(track_id)
-        return track_ids
-
-    def __search_artists(self, search, storage_type, cancellable):
+    def __get_score(self, search, words, name, extra):
         """
-            Get artists for search items
+            Score a match: prefix over substring, all words over any word
             @param search as str
-            @param storage_type as StorageType
-            @param cancellable as Gio.Cancellable
-            @return [int]
-        """
-        artists = []
-        artist_ids = []
-        split = self.__split_string(search)
-        for search_str in [search] + split:
-            artists += App().artists.search(search_str, storage_type)
-            if cancellable.is_cancelled():
-                break
-        for (artist_id, artist_name) in artists:
-            valid = True
-            no_accents = noaccents(artist_name)
-            if not no_accents.startswith(search):
-                for word in split:
-                    if word not in no_accents:
-                        valid = False
-                        break
-            else:
-                artist_ids.append(artist_id)
-            if valid:
-                artist_ids.append(artist_id)
-        return artist_ids
+            @param words as [str]
+            @param name as str without accents
+            @param extra as str without accents => other matching fields
+            @return float
+        """
+        score = 0
+        if name.startswith(search):
+            score += 4
+        elif search in name:
+            score += 2
+        elif search in extra:
+            score += 1
+        if words:
+            haystack = "%s %s" % (name, extra)
+            count = len([word for word in words if word in haystack])
+            if count == len(words):
+                score += 2
+            score += count / len(words)
+        return score
 
-    def __search_albums(self, search, storage_type, cancellable):
+    def __rank(self, search, words, rows):
         """
-            Get albums for search items
+            Rank and deduplicate rows
             @param search as str
-            @param storage_type as StorageType
-            @param cancellable as Gio.Cancellable
+            @param words as [str]
+            @param rows as [(int, str)] or [(int, str, str)]
             @return [int]
         """
-        albums = []
-        album_ids = []
-        split = self.__split_string(search)
-        for search_str in [search] + split:
-            albums += App().albums.search(search_str, storage_type)
-            if cancellable.is_cancelled():
-                break
-        for (album_id, album_name) in albums:
-            valid = True
-            no_accents = noaccents(album_name)
-            if not no_accents.startswith(search):
-                for word in split:
-                    if word not in no_accents:
-                        valid = False
-                        break
-            else:
-                album_ids.append(album_id)
-            if valid:
-                album_ids.append(album_id)
-        return album_ids
-
-    def __get_artists(self, search, storage_type, cancellable):
-        """
-            Get artists for search
-            @param search as str
-            @param storage_type as StorageType
-            @param cancellable as Gio.Cancellable
-        """
-        artist_ids = self.__search_artists(search, storage_type, cancellable)
-        counter = Counter(artist_ids)
-        artist_ids = sorted(artist_ids,
-                            key=lambda x: (counter[x], x),
-                            reverse=True)
-        artist_ids = list(dict.fromkeys(artist_ids))
-        for artist_id in artist_ids:
-            GLib.idle_add(self.emit, "match-artist", artist_id, storage_type)
+        scores = {}
+        for row in rows:
+            name = noaccents(row[1])
+            extra = noaccents(row[2]) if len(row) > 2 and row[2] else ""
+            score = self.__get_score(search, words, name, extra)
+            if score > 0 and score > scores.get(row[0], (0,))[0]:
+                scores[row[0]] = (score, -len(name))
+        return sorted(scores.keys(), key=lambda x: scores[x], reverse=True)
 
-    def __get_albums(self, search, storage_type, cancellable):
+    def __emit_match(self, signal, item_id, storage_type, cancellable):
         """
-            Get albums for search
-            @param search as str
-            @param storage_type as StorageType
-            @param cancellable as Gio.Cancellable
-        """
-        album_ids = self.__search_albums(search, storage_type, cancellable)
-        counter = Counter(album_ids)
-        album_ids = sorted(album_ids,
-                           key=lambda x: (counter[x], x),
-                           reverse=True)
-        album_ids = list(dict.fromkeys(album_ids))
-        for album_id in album_ids:
-            GLib.idle_add(self.emit, "match-album", album_id, storage_type)
-
-    def __get_tracks(self, search, storage_type, cancellable):
-        """
-            Get tracks for search
-            @param search as str
+            Emit match signal if search has not been cancelled
+            @param signal as str
+            @param item_id as int
             @param storage_type as StorageType
             @param cancellable as Gio.Cancellable
         """
-        track_ids = self.__search_tracks(search, storage_type, cancellable)
-        counter = Counter(track_ids)
-        track_ids = sorted(track_ids,
-                           key=lambda x: (counter[x], x),
-                           reverse=True)
-        track_ids = list(dict.fromkeys(track_ids))
-        for track_id in track_ids:
-            GLib.idle_add(self.emit, "match-track", track_id, storage_type)
+        if not cancellable.is_cancelled():
+            self.emit(signal, item_id, storage_type)
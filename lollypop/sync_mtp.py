@@ -255,8 +255,8 @@ class MtpSync(GObject.Object):
             playlist_ids += App().playlists.get_synced_ids(index)
             for playlist_id in playlist_ids:
                 if App().playlists.get_smart(playlist_id):
-                    request = App().playlists.get_smart_sql(playlist_id)
-                    for track_id in App().db.execute(request):
+                    for track_id in App().playlists.get_smart_track_ids(
+                            playlist_id):
                         tracks.append(Track(track_id))
                 else:
                     for track_id in App().playlists.get_track_ids(playlist_id):
@@ -381,8 +381,8 @@ class MtpSync(GObject.Object):
             try:
                 # Get tracks
                 if App().playlists.get_smart(playlist_id):
-                    request = App().playlists.get_smart_sql(playlist_id)
-                    track_ids = App().db.execute(request)
+                    track_ids = App().playlists.get_smart_track_ids(
+                        playlist_id)
                 else:
                     track_ids = App().playlists.get_track_ids(playlist_id)
 
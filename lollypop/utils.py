@@ -45,6 +45,20 @@ def make_subrequest(value, operand, count):
     return subrequest + ")"
 
 
+def make_storage_type_subrequest(storage_type, column="storage_type"):
+    """
+        Make an index friendly subrequest for a storage type mask
+        "storage_type & mask" can't use an index, "storage_type IN (...)" can
+        @param storage_type as StorageType
+        @param column as str => SQL
+        @return str
+    """
+    mask = int(storage_type)
+    storage_types = [str(1 << i) for i in range(mask.bit_length())
+                     if mask & (1 << i)]
+    return "%s IN (%s)" % (column, ", ".join(storage_types))
+
+
 def ms_to_string(duration):
     """
         Convert milliseconds to a pretty string
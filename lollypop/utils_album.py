@@ -10,6 +10,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+from time import time
 
 from lollypop.define import App, Type
 
@@ -46,6 +47,14 @@ def get_album_ids_for(genre_ids, artist_ids, storage_type, skipped):
     limit = App().settings.get_value("view-limit").get_int32()
     if genre_ids and genre_ids[0] == Type.POPULARS:
         items = App().albums.get_rated(storage_type, skipped, limit)
+        # Then most listened albums at the moment
+        start = int(time()) - App().listens.MOMENT_WINDOW
+        count = limit - len(items)
+        if count > 0:
+            for (album_id, listens) in App().listens.get_album_ids(
+                    storage_type, skipped, count, start):
+                if album_id not in items:
+                    items.append(album_id)
         count = limit - len(items)
         for album in App().albums.get_populars(storage_type, skipped, count):
             if album not in items:
@@ -65,8 +74,16 @@ def get_album_ids_for(genre_ids, artist_ids, storage_type, skipped):
                 App().settings.get_value("show-compilations-in-album-view"):
             items = App().albums.get_compilation_ids(genre_ids, storage_type,
                                                      skipped)
-        items += App().albums.get_ids(genre_ids, [], storage_type, skipped)
+        album_ids = App().snapshot.get_album_ids(genre_ids, [],
+                                                 storage_type, skipped)
+        if album_ids is None:
+            album_ids = App().albums.get_ids(genre_ids, [],
+                                             storage_type, skipped)
+        items += album_ids
     else:
-        items = App().albums.get_ids(genre_ids, artist_ids,
-                                     storage_type, skipped)
+        items = App().snapshot.get_album_ids(genre_ids, artist_ids,
+                                             storage_type, skipped)
+        if items is None:
+            items = App().albums.get_ids(genre_ids, artist_ids,
+                                         storage_type, skipped)
     return items
@@ -13,6 +13,8 @@
 from gi.repository import GLib, Gtk, Gio, Pango
 
 from gettext import gettext as _
+from random import choice
+from time import time
 
 from lollypop.define import App, Type, MARGIN, ViewType, StorageType
 from lollypop.objects_album import Album
@@ -231,6 +233,39 @@ class AlbumsPopularsLineView(AlbumsLineView):
         App().task_helper.run(load, callback=(on_load,))
 
 
+class AlbumsRecentsLineView(AlbumsLineView):
+    """
+        Recently played albums line
+    """
+
+    def __init__(self, storage_type, view_type):
+        """
+            Init view
+            @param storage_type as StorageType
+            @param view_type as ViewType
+        """
+        AlbumsLineView.__init__(self, storage_type, view_type)
+
+    def populate(self):
+        """
+            Populate view
+        """
+        def on_load(items):
+            AlbumsLineView.populate(self, items)
+
+        def load():
+            storage_type = get_default_storage_type()
+            start = int(time()) - App().listens.MOMENT_WINDOW
+            album_ids = App().listens.get_recent_album_ids(storage_type,
+                                                           False,
+                                                           self.ITEMS,
+                                                           start)
+            return [Album(album_id) for album_id in album_ids]
+
+        self._label.set_text(_("Recently played albums"))
+        App().task_helper.run(load, callback=(on_load,))
+
+
 class AlbumsRandomGenresLineView(AlbumsLineView):
     """
         Populars albums line
@@ -252,9 +287,17 @@ class AlbumsRandomGenresLineView(AlbumsLineView):
             AlbumsLineView.populate(self, items)
 
         def load():
-            (genre_id, genre) = App().genres.get_random()
-            GLib.idle_add(self._label.set_text, genre)
             storage_type = get_default_storage_type()
+            # Prefer a genre listened at the moment
+            start = int(time()) - App().listens.MOMENT_WINDOW
+            genre_ids = App().listens.get_genre_ids(storage_type,
+                                                    False, 5, start)
+            if genre_ids:
+                genre_id = choice(genre_ids)[0]
+                genre = App().genres.get_name(genre_id)
+            else:
+                (genre_id, genre) = App().genres.get_random()
+            GLib.idle_add(self._label.set_text, genre)
             album_ids = App().albums.get_randoms(storage_type,
                                                  genre_id,
                                                  False,
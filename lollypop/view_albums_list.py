@@ -14,6 +14,7 @@ from gi.repository import Gtk
 
 from lollypop.utils import popup_widget
 from lollypop.view_lazyloading import LazyLoadingView
+from lollypop.objects_album import Album
 from lollypop.define import App, ViewType, MARGIN, StorageType
 from lollypop.widgets_row_album import AlbumRow
 from lollypop.widgets_listbox import ListBox
@@ -98,6 +99,7 @@ class AlbumsListView(LazyLoadingView, SignalsHelper, GesturesHelper):
         """
         for child in self._box.get_children():
             self._box.remove(child)
+        Album.preload_tracks(albums)
         LazyLoadingView.populate(self, albums)
 
     def clear(self):
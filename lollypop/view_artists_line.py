@@ -13,6 +13,7 @@
 from gi.repository import Gtk, Pango, GLib
 
 from gettext import gettext as _
+from time import time
 
 from lollypop.utils import get_default_storage_type
 from lollypop.define import App, MARGIN, ViewType
@@ -150,6 +151,39 @@ class ArtistsRandomLineView(ArtistsLineView):
         App().task_helper.run(load, callback=(on_load,))
 
 
+class ArtistsPopularsLineView(ArtistsLineView):
+    """
+        Line view showing most listened artists at the moment
+    """
+    def __init__(self, storage_type, view_type):
+        """
+            Init artist view
+            @param storage_type as StorageType
+            @param view_type as ViewType
+        """
+        ArtistsLineView.__init__(self, storage_type, view_type)
+        self._label.set_text(_("Popular artists at the moment"))
+
+    def populate(self):
+        """
+            Populate view
+        """
+        def on_load(items):
+            self._box.set_min_children_per_line(len(items))
+            ArtistsLineView.populate(self, items)
+            if items:
+                self.show()
+
+        def load():
+            storage_type = get_default_storage_type()
+            start = int(time()) - App().listens.MOMENT_WINDOW
+            return [artist_id for (artist_id, count) in
+                    App().listens.get_artist_ids(storage_type, False,
+                                                 15, start)]
+
+        App().task_helper.run(load, callback=(on_load,))
+
+
 class ArtistsSearchLineView(ArtistsLineView):
     """
         Line view for search
@@ -109,6 +109,7 @@ class GenresBoxView(FlowBoxView):
         album_ids = App().albums.get_ids([child.data], [],
                                          self.storage_type, False)
         albums = [Album(album_id) for album_id in album_ids]
+        Album.preload_tracks(albums)
         if albums:
             App().player.play_album_for_albums(albums[0], albums)
 
@@ -125,6 +126,7 @@ class GenresBoxView(FlowBoxView):
         if not album_ids:
             return
         albums = [Album(album_id) for album_id in album_ids]
+        Album.preload_tracks(albums)
         if random:
             shuffle(albums)
             App().player.play_album_for_albums(albums[0], albums)
@@ -11,7 +11,6 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 from lollypop.utils_album import tracks_to_albums
-from lollypop.utils import get_default_storage_type
 from lollypop.define import App, ViewType, MARGIN, Type, Size
 from lollypop.objects_album import Album
 from lollypop.objects_track import Track
@@ -231,13 +230,8 @@ class PlaylistsView(AlbumsListView, SignalsHelper, SizeAllocationHelper):
             AlbumsListView.populate(self, albums)
 
         def load():
-            request = App().playlists.get_smart_sql(self.__playlist_id)
-            # We need to inject skipped/storage_type
-            storage_type = get_default_storage_type()
-            split = request.split("ORDER BY")
-            split[0] += " AND tracks.loved != %s" % Type.NONE
-            split[0] += " AND tracks.storage_type&%s " % storage_type
-            track_ids = App().db.execute("ORDER BY".join(split))
+            track_ids = App().playlists.get_smart_track_ids(
+                self.__playlist_id)
             return tracks_to_albums(
                 [Track(track_id) for track_id in track_ids])
 
@@ -13,13 +13,16 @@
 from gi.repository import Gtk, GLib, Pango
 
 from gettext import gettext as _
+from time import time
 
 from lollypop.view import View
 from lollypop.utils import get_network_available
 from lollypop.define import ViewType, StorageType, Size, App
 from lollypop.view_albums_line import AlbumsPopularsLineView
 from lollypop.view_albums_line import AlbumsRandomGenresLineView
+from lollypop.view_albums_line import AlbumsRecentsLineView
 from lollypop.view_artists_line import ArtistsRandomLineView
+from lollypop.view_artists_line import ArtistsPopularsLineView
 from lollypop.widgets_banner_today import TodayBannerWidget
 from lollypop.helper_signals import signals_map
 
@@ -61,9 +64,15 @@ class SuggestionsView(View):
         """
             Populate view
         """
-        for cls in [AlbumsPopularsLineView,
-                    ArtistsRandomLineView,
-                    AlbumsRandomGenresLineView]:
+        classes = [AlbumsPopularsLineView,
+                   ArtistsRandomLineView,
+                   AlbumsRandomGenresLineView]
+        # Add lines based on listens if user listened to something lately
+        start = int(time()) - App().listens.MOMENT_WINDOW
+        if App().listens.count(start) > 0:
+            classes.insert(1, AlbumsRecentsLineView)
+            classes.insert(2, ArtistsPopularsLineView)
+        for cls in classes:
             view = cls(self.storage_type, self.view_type)
             view.populate()
             self.__grid.add(view)
@@ -17,7 +17,7 @@ from gettext import gettext as _
 from lollypop.logger import Logger
 from lollypop.utils import emit_signal
 from lollypop.widgets_artwork import ArtworkSearchWidget, ArtworkSearchChild
-from lollypop.define import App, Type
+from lollypop.define import App, Type, TaskPriority
 from lollypop.helper_signals import SignalsHelper, signals_map
 
 
@@ -126,21 +126,29 @@ class AlbumArtworkSearchWidget(ArtworkSearchWidget, SignalsHelper):
                     App().album_art.search,
                     artist,
                     self.__album.name,
-                    self._cancellable)
+                    self._cancellable,
+                    priority=TaskPriority.PREFETCH,
+                    cancellable=self._cancellable)
         else:
             App().task_helper.run(
                     App().album_art.search_artwork_from_google,
                     search,
-                    self._cancellable)
+                    self._cancellable,
+                    priority=TaskPriority.PREFETCH,
+                    cancellable=self._cancellable)
             App().task_helper.run(
                     App().album_art.search_artwork_from_startpage,
                     search,
-                    self._cancellable)
+                    self._cancellable,
+                    priority=TaskPriority.PREFETCH,
+                    cancellable=self._cancellable)
             App().task_helper.run(
                     App().album_art.search,
                     "",
                     search,
-                    self._cancellable)
+                    self._cancellable,
+                    priority=TaskPriority.PREFETCH,
+                    cancellable=self._cancellable)
 
     def _on_activate(self, flowbox, child):
         """
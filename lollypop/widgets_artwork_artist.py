@@ -15,7 +15,7 @@ from gi.repository import Gio, GObject, Gtk
 from lollypop.logger import Logger
 from lollypop.utils import emit_signal
 from lollypop.widgets_artwork import ArtworkSearchWidget, ArtworkSearchChild
-from lollypop.define import App, ArtSize, StorageType
+from lollypop.define import App, ArtSize, StorageType, TaskPriority
 from lollypop.helper_signals import SignalsHelper, signals_map
 
 
@@ -86,14 +86,20 @@ class ArtistArtworkSearchWidget(ArtworkSearchWidget, SignalsHelper):
         search = self._get_current_search()
         App().task_helper.run(App().artist_art.search_artwork_from_google,
                               search,
-                              self._cancellable)
+                              self._cancellable,
+                              priority=TaskPriority.PREFETCH,
+                              cancellable=self._cancellable)
         App().task_helper.run(App().artist_art.search_artwork_from_startpage,
                               search,
-                              self._cancellable)
+                              self._cancellable,
+                              priority=TaskPriority.PREFETCH,
+                              cancellable=self._cancellable)
         App().task_helper.run(
                 App().artist_art.search,
                 search,
-                self._cancellable)
+                self._cancellable,
+                priority=TaskPriority.PREFETCH,
+                cancellable=self._cancellable)
 
     def _on_activate(self, flowbox, child):
         """
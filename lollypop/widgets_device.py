@@ -139,7 +139,7 @@ class DeviceWidget(Gtk.ListBoxRow):
             uri = self.__get_music_uri()
             index = self.__get_device_index()
             if index is not None:
-                App().task_helper.run(self.__mtp_sync.sync, uri, index)
+                App().task_helper.run_thread(self.__mtp_sync.sync, uri, index)
                 emit_signal(self, "syncing", True)
                 button.set_label(_("Cancel"))
         else:
@@ -132,9 +132,6 @@ class EqualizerWidget(Gtk.Bin):
         active = button.get_active()
         App().settings.set_value("equalizer-enabled",
                                  GLib.Variant("b", active))
-        for plugin in App().player.plugins:
-            plugin.build_audiofilter()
-        App().player.reload_track()
         self.__combobox.set_sensitive(active)
         for i in range(0, 18):
             attr = getattr(self, "__scale%s" % i)
@@ -55,7 +55,7 @@ class CollectionWebService(SaveWebHelper,
         """
         if self.__is_running:
             return
-        App().task_helper.run(self.__populate_db)
+        App().task_helper.run_thread(self.__populate_db)
         return True
 
     def stop(self):
@@ -149,6 +149,7 @@ class DirectorWebService:
             self.__lastfm_ws.start()
             Logger.info("Last.fm web service started")
         elif not start and self.__lastfm_ws is not None:
+            self.__lastfm_ws.stop()
             self.__lastfm_ws = None
             Logger.info("Last.fm web service stopping")
         start = acl & NetworkAccessACL["LIBREFM"]
@@ -158,6 +159,7 @@ class DirectorWebService:
             self.__librefm_ws.start()
             Logger.info("Libre.fm web service started")
         elif not start and self.__librefm_ws is not None:
+            self.__librefm_ws.stop()
             self.__librefm_ws = None
             Logger.info("Libre.fm web service stopping")
 
@@ -178,6 +180,7 @@ class DirectorWebService:
         elif not start and self.__listenbrainz_ws is not None:
             App().settings.unbind(self.__listenbrainz_ws,
                                   "listenbrainz-user-token")
+            self.__listenbrainz_ws.stop()
             self.__listenbrainz_ws = None
             Logger.info("ListenBrainz web service stopping")
 
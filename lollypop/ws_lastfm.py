@@ -10,31 +10,42 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-from gi.repository import Soup, Gio
+from gi.repository import Soup, Gio, GLib
 
 import json
 from hashlib import md5
-from pickle import load, dump
+from pickle import load
 
 from lollypop.helper_passwords import PasswordsHelper
 from lollypop.logger import Logger
 from lollypop.utils import get_network_available
-from lollypop.define import LOLLYPOP_DATA_PATH, App, Type
+from lollypop.define import LOLLYPOP_DATA_PATH, App, Type, TaskPriority
 from lollypop.define import LASTFM_API_KEY, LASTFM_API_SECRET
 
 
 class LastFMWebService:
     """
         Handle scrobbling to Last.fm and all authenticated API calls
+        Scrobbles are queued on disk and submitted by batch
     """
 
+    # Max scrobbles for a track.scrobble call
+    __BATCH_SIZE = 50
+    # Delays in seconds before submitting again after a failure
+    __MIN_BACKOFF = 60
+    __MAX_BACKOFF = 3600
+
     def __init__(self, name):
         """
             Init service
             @param name as str
         """
         self.__name = name
-        self.__queue = []
+        self.__cancellable = Gio.Cancellable()
+        self.__submitting = False
+        self.__backoff = 0
+        self.__backoff_id = None
+        self.__network_changed_id = None
         if name == "LIBREFM":
             self.__uri = "https://libre.fm/2.0/"
         else:
@@ -43,28 +54,28 @@ class LastFMWebService:
 
     def start(self):
         """
-            Start web service (load save queue)
+            Start web service (submit queue)
         """
-        try:
-            self.__cancellable = Gio.Cancellable()
-            self.__queue = load(
-                open(LOLLYPOP_DATA_PATH + "/%s_queue.bin" % self.__name, "rb"))
-        except Exception as e:
-            Logger.info("LastFMWebService::start(): %s", e)
-            self.__queue = []
+        self.__cancellable = Gio.Cancellable()
+        if self.__network_changed_id is None:
+            self.__network_changed_id = Gio.NetworkMonitor.get_default(
+                ).connect("network-changed", self.__on_network_changed)
+        self.__import_queue()
+        self.__submit()
 
     def stop(self):
         """
-            Stop current tasks and save queue to disk
+            Stop current tasks, queue is already on disk
             @return bool
         """
         self.__cancellable.cancel()
-        try:
-            with open(LOLLYPOP_DATA_PATH + "/%s_queue.bin" % self.__name,
-                      "wb") as f:
-                dump(list(self.__queue), f)
-        except Exception as e:
-            Logger.info("LastFMWebService::stop: %s", e)
+        if self.__backoff_id is not None:
+            GLib.source_remove(self.__backoff_id)
+            self.__backoff_id = None
+        if self.__network_changed_id is not None:
+            Gio.NetworkMonitor.get_default().disconnect(
+                self.__network_changed_id)
+            self.__network_changed_id = None
         return True
 
     def listen(self, track, timestamp):
@@ -73,13 +84,10 @@ class LastFMWebService:
             @param track as Track
             @param timestamp as int
         """
-        monitor = Gio.NetworkMonitor.get_default()
-        if App().settings.get_value("disable-scrobbling") or\
-                not get_network_available() or\
-                monitor.get_network_metered():
-            self.__queue.append((track, timestamp))
-        elif track.id is not None and track.id >= 0:
-            App().task_helper.run(self.__listen, track, timestamp)
+        if track.id is None or track.id < 0:
+            return
+        App().task_helper.run(self.__queue, track, timestamp,
+                              priority=TaskPriority.BACKGROUND)
 
     def playing_now(self, track):
         """
@@ -92,7 +100,8 @@ class LastFMWebService:
                 monitor.get_network_metered():
             return
         if track.id is not None and track.id >= 0:
-            App().task_helper.run(self.__playing_now, track)
+            App().task_helper.run(self.__playing_now, track,
+                                  priority=TaskPriority.BACKGROUND)
 
     def love(self, artist, title):
         """
@@ -190,50 +199,141 @@ class LastFMWebService:
         api_sig += LASTFM_API_SECRET
         return md5(api_sig.encode("utf-8")).hexdigest()
 
-    def __listen(self, track, timestamp):
+    def __get_payload(self, track):
+        """
+            Get scrobble payload for track
+            @param track as Track
+            @return {}
+        """
+        payload = {"artist": track.artists[0],
+                   "track": track.name,
+                   "album": track.album.name}
+        if track.album.artist_ids[0] == Type.COMPILATIONS:
+            payload["albumArtist"] = track.artists[0]
+        else:
+            payload["albumArtist"] = track.album.artists[0]
+        if track.mbid and track.mbid.find(":") == -1:
+            payload["mbid"] = track.mbid
+        return payload
+
+    def __queue(self, track, timestamp):
         """
-            Scrobble track
+            Queue scrobble if user has a session
             @param track as Track
             @param timestamp as int
         """
-        tracks = self.__queue + [(track, timestamp)]
-        self.__queue = []
+        if not App().ws_director.token_ws.has_token(self.__name):
+            return
+        App().scrobbles.add(self.__name,
+                            [(timestamp, self.__get_payload(track))])
+        GLib.idle_add(self.__submit)
+
+    def __import_queue(self):
+        """
+            Move queue saved by previous versions to DB
+        """
+        path = LOLLYPOP_DATA_PATH + "/%s_queue.bin" % self.__name
+        f = Gio.File.new_for_path(path)
+        if not f.query_exists():
+            return
+        try:
+            with open(path, "rb") as queue:
+                tracks = load(queue)
+            App().scrobbles.add(self.__name,
+                                [(timestamp, self.__get_payload(track))
+                                 for (track, timestamp) in tracks])
+        except Exception as e:
+            Logger.warning("LastFMWebService::__import_queue(): %s", e)
+        f.delete(None)
+
+    def __submit(self):
+        """
+            Submit queued scrobbles in background if possible
+        """
+        if self.__submitting or self.__backoff_id is not None:
+            return
+        monitor = Gio.NetworkMonitor.get_default()
+        if App().settings.get_value("disable-scrobbling") or\
+                not get_network_available(self.__name) or\
+                monitor.get_network_metered():
+            return
+        self.__submitting = True
+        App().task_helper.run(self.__submit_queue,
+                              callback=(self.__on_queue_submitted,),
+                              priority=TaskPriority.BACKGROUND)
+
+    def __submit_queue(self):
+        """
+            Submit queued scrobbles by batch
+            Queue is skipped if another instance is submitting it
+            @return bool => False if a batch failed
+        """
+        if not App().ws_director.token_ws.has_token(self.__name):
+            return True
+        lock = App().scrobbles.get_submit_lock(self.__name)
+        if not lock.acquire(False):
+            return True
+        try:
+            while not self.__cancellable.is_cancelled():
+                scrobbles = App().scrobbles.get(self.__name,
+                                                self.__BATCH_SIZE)
+                if not scrobbles:
+                    return True
+                if not self.__scrobble(scrobbles):
+                    return False
+        except Exception as e:
+            Logger.error("LastFMWebService::__submit_queue(): %s" % e)
+        finally:
+            lock.release()
+        return False
+
+    def __scrobble(self, scrobbles):
+        """
+            Submit scrobbles with one request
+            @param scrobbles as [(int, int, {})]
+            @return bool
+        """
+        token = App().ws_director.token_ws.get_token(
+            self.__name, self.__cancellable)
+        if token is None:
+            return False
+        args = self.__get_args_for_method("track.scrobble")
+        for (index, (scrobble_id, timestamp, payload)) in enumerate(
+                scrobbles):
+            for (key, value) in payload.items():
+                args.append(("%s[%s]" % (key, index), value))
+            args.append(("timestamp[%s]" % index, str(timestamp)))
+        args.append(("sk", token))
+        api_sig = self.__get_sig_for_args(args)
+        args.append(("api_sig", api_sig))
+        # Not part of API sig
+        args.append(("format", "json"))
+        hash = {}
+        for (name, value) in args:
+            hash[name] = value
+        form = Soup.form_encode_hash(hash)
+        msg = Soup.Message.new_from_encoded_form("POST", self.__uri, form)
+        request_headers = msg.get_property("request-headers")
+        request_headers.append("Accept-Charset", "utf-8")
+        data = App().task_helper.send_message_sync(msg, self.__cancellable)
+        status = int(msg.get_status())
+        if data is None or status != 200:
+            Logger.warning("LastFMWebService::__scrobble(): status %s",
+                           status)
+            return False
+        Logger.debug("%s: %s", self.__uri, data)
         try:
-            for (track, timestamp) in tracks:
-                token = App().ws_director.token_ws.get_token(
-                    self.__name, self.__cancellable)
-                if token is None:
-                    return
-                args = self.__get_args_for_method("track.scrobble")
-                args.append(("artist", track.artists[0]))
-                if track.album.artist_ids[0] == Type.COMPILATIONS:
-                    args.append(("albumArtist", track.artists[0]))
-                else:
-                    args.append(("albumArtist", track.album.artists[0]))
-                args.append(("track", track.name))
-                args.append(("album", track.album.name))
-                if track.mbid and track.mbid.find(":") == -1:
-                    args.append(("mbid", track.mbid))
-                args.append(("timestamp", str(timestamp)))
-                args.append(("sk", token))
-                api_sig = self.__get_sig_for_args(args)
-                args.append(("api_sig", api_sig))
-                hash = {}
-                for (name, value) in args:
-                    hash[name] = value
-                form = Soup.form_encode_hash(hash)
-                msg = Soup.Message.new_from_encoded_form(
-                    "POST", self.__uri, form)
-                request_headers = msg.get_property("request-headers")
-                request_headers.append("Accept-Charset", "utf-8")
-                data = App().task_helper.send_message_sync(msg,
-                                                           self.__cancellable)
-                if data is not None:
-                    Logger.debug("%s: %s", self.__uri, data)
-                else:
-                    self.__queue.append((track, timestamp))
+            content = json.loads(data.decode("utf-8"))
         except Exception as e:
-            Logger.error("LastFMWebService::__listen(): %s" % e)
+            # Server accepted request, do not send scrobbles twice
+            Logger.warning("LastFMWebService::__scrobble(): %s", e)
+            content = {}
+        if isinstance(content, dict) and "error" in content.keys():
+            Logger.warning("LastFMWebService::__scrobble(): %s",
+                           content.get("message", data))
+            return False
+        App().scrobbles.remove([scrobble[0] for scrobble in scrobbles])
+        return True
 
     def __playing_now(self, track):
         """
@@ -307,4 +407,37 @@ class LastFMWebService:
         """
         if attributes is not None:
             App().task_helper.run(
-                self.__populate_loved_tracks, attributes["login"])
+                self.__populate_loved_tracks, attributes["login"],
+                priority=TaskPriority.BACKGROUND)
+
+    def __on_queue_submitted(self, submitted):
+        """
+            Submit again later on failure
+            @param submitted as bool
+        """
+        self.__submitting = False
+        if self.__cancellable.is_cancelled():
+            return
+        if submitted:
+            self.__backoff = 0
+        else:
+            self.__backoff = min(max(self.__backoff * 2, self.__MIN_BACKOFF),
+                                 self.__MAX_BACKOFF)
+            self.__backoff_id = GLib.timeout_add_seconds(
+                self.__backoff, self.__on_backoff_timeout)
+
+    def __on_backoff_timeout(self):
+        """
+            Submit queue again
+        """
+        self.__backoff_id = None
+        self.__submit()
+
+    def __on_network_changed(self, monitor, available):
+        """
+            Submit scrobbles queued while offline
+            @param monitor as Gio.NetworkMonitor
+            @param available as bool
+        """
+        if available:
+            self.__submit()
@@ -14,20 +14,27 @@
 from gi.repository import Soup, GLib, GObject, Gio
 
 import json
-from pickle import load, dump
+from pickle import load
 
 from lollypop.logger import Logger
-from lollypop.define import App, LOLLYPOP_DATA_PATH, Type
+from lollypop.define import App, LOLLYPOP_DATA_PATH, Type, TaskPriority
 from lollypop.utils import get_network_available
 
 
 class ListenBrainzWebService(GObject.GObject):
     """
         Submit listens to ListenBrainz.org.
+        Listens are queued on disk and imported by batch
 
         See https://listenbrainz.readthedocs.io/en/latest/dev/api.html
     """
 
+    # Max listens for an import request
+    __BATCH_SIZE = 100
+    # Delays in seconds before submitting again after a failure
+    __MIN_BACKOFF = 60
+    __MAX_BACKOFF = 3600
+
     user_token = GObject.Property(type=str, default="plop")
 
     def __init__(self):
@@ -38,35 +45,40 @@ class ListenBrainzWebService(GObject.GObject):
         try:
             self.__uri = "https://api.listenbrainz.org/1/submit-listens"
             self.__name = "listenbrainz"
-            self.__queue = []
+            self.__cancellable = Gio.Cancellable()
+            self.__submitting = False
+            self.__backoff = 0
+            self.__backoff_id = None
+            self.__network_changed_id = None
             self.start()
         except Exception as e:
             Logger.info("LastFM::__init__(): %s", e)
 
     def start(self):
         """
-            Start web service (load save queue)
+            Start web service (submit queue)
         """
-        try:
-            self.__cancellable = Gio.Cancellable()
-            self.__queue = load(
-                open(LOLLYPOP_DATA_PATH + "/%s_queue.bin" % self.__name, "rb"))
-        except Exception as e:
-            Logger.info("ListenBrainzWebService::start(): %s", e)
-            self.__queue = []
+        self.__cancellable = Gio.Cancellable()
+        if self.__network_changed_id is None:
+            self.__network_changed_id = Gio.NetworkMonitor.get_default(
+                ).connect("network-changed", self.__on_network_changed)
+        self.__import_queue()
+        # Wait for user token to be bound
+        GLib.idle_add(self.__submit)
 
     def stop(self):
         """
-            Stop current tasks and save queue to disk
+            Stop current tasks, queue is already on disk
             @return bool
         """
         self.__cancellable.cancel()
-        try:
-            with open(LOLLYPOP_DATA_PATH + "/%s_queue.bin" % self.__name,
-                      "wb") as f:
-                dump(list(self.__queue), f)
-        except Exception as e:
-            Logger.info("ListenBrainzWebService::stop: %s", e)
+        if self.__backoff_id is not None:
+            GLib.source_remove(self.__backoff_id)
+            self.__backoff_id = None
+        if self.__network_changed_id is not None:
+            Gio.NetworkMonitor.get_default().disconnect(
+                self.__network_changed_id)
+            self.__network_changed_id = None
         return True
 
     def listen(self, track, timestamp):
@@ -75,16 +87,12 @@ class ListenBrainzWebService(GObject.GObject):
             @param track as Track
             @param timestamp as int
         """
-        monitor = Gio.NetworkMonitor.get_default()
         if not App().settings.get_value(
                 "listenbrainz-user-token").get_string():
             return
-        elif App().settings.get_value("disable-scrobbling") or\
-                not get_network_available() or\
-                monitor.get_network_metered():
-            self.__queue.append((track, timestamp))
         elif track.id is not None and track.id >= 0:
-            App().task_helper.run(self.__listen, track, timestamp)
+            App().task_helper.run(self.__queue, track, timestamp,
+                                  priority=TaskPriority.BACKGROUND)
 
     def playing_now(self, track):
         """
@@ -98,7 +106,8 @@ class ListenBrainzWebService(GObject.GObject):
                 not get_network_available():
             return
         if track.id is not None and track.id >= 0:
-            App().task_helper.run(self.__playing_now, track)
+            App().task_helper.run(self.__playing_now, track,
+                                  priority=TaskPriority.BACKGROUND)
 
     def love(self, artist, title):
         pass
@@ -112,29 +121,106 @@ class ListenBrainzWebService(GObject.GObject):
 #######################
 # PRIVATE             #
 #######################
-    def __listen(self, track, timestamp):
+    def __import_queue(self):
+        """
+            Move queue saved by previous versions to DB
         """
-            Scrobble track
+        path = LOLLYPOP_DATA_PATH + "/%s_queue.bin" % self.__name
+        f = Gio.File.new_for_path(path)
+        if not f.query_exists():
+            return
+        try:
+            with open(path, "rb") as queue:
+                tracks = load(queue)
+            App().scrobbles.add(self.__name,
+                                [(timestamp, self.__get_payload(track)[0])
+                                 for (track, timestamp) in tracks])
+        except Exception as e:
+            Logger.warning("ListenBrainzWebService::__import_queue(): %s", e)
+        f.delete(None)
+
+    def __queue(self, track, timestamp):
+        """
+            Queue listen
             @param track as Track
             @param timestamp as int
         """
-        tracks = self.__queue + [(track, timestamp)]
-        self.__queue = []
+        App().scrobbles.add(self.__name,
+                            [(timestamp, self.__get_payload(track)[0])])
+        GLib.idle_add(self.__submit)
+
+    def __submit(self):
+        """
+            Submit queued listens in background if possible
+        """
+        if self.__submitting or self.__backoff_id is not None:
+            return
+        monitor = Gio.NetworkMonitor.get_default()
+        if not App().settings.get_value(
+                "listenbrainz-user-token").get_string() or\
+                App().settings.get_value("disable-scrobbling") or\
+                not get_network_available("MUSICBRAINZ") or\
+                monitor.get_network_metered():
+            return
+        self.__submitting = True
+        App().task_helper.run(self.__submit_queue,
+                              callback=(self.__on_queue_submitted,),
+                              priority=TaskPriority.BACKGROUND)
+
+    def __submit_queue(self):
+        """
+            Submit queued listens by batch
+            Queue is skipped if another instance is submitting it
+            @return bool => False if a batch failed
+        """
+        lock = App().scrobbles.get_submit_lock(self.__name)
+        if not lock.acquire(False):
+            return True
         try:
-            for (track, timestamp) in tracks:
-                payload = self.__get_payload(track)
-                payload[0]["listened_at"] = timestamp
-                post_data = {
-                    "listen_type": "single",
-                    "payload": payload
-                }
-                data = self.__post_request(post_data)
-                if data is not None:
-                    Logger.debug("%s: %s", self.__uri, data)
-                else:
-                    self.__queue.append((track, timestamp))
+            while not self.__cancellable.is_cancelled():
+                listens = App().scrobbles.get(self.__name,
+                                              self.__BATCH_SIZE)
+                if not listens:
+                    return True
+                if not self.__import(listens):
+                    return False
         except Exception as e:
-            Logger.error("ListenBrainzWebService::__listen(): %s" % e)
+            Logger.error("ListenBrainzWebService::__submit_queue(): %s" % e)
+        finally:
+            lock.release()
+        return False
+
+    def __import(self, listens):
+        """
+            Submit listens with one request
+            A rejected batch is submitted again listen by listen, rejected
+            listens are dropped
+            @param listens as [(int, int, {})]
+            @return bool
+        """
+        payload = []
+        for (listen_id, timestamp, track_metadata) in listens:
+            track_metadata["listened_at"] = timestamp
+            payload.append(track_metadata)
+        post_data = {
+            "listen_type": "single" if len(payload) == 1 else "import",
+            "payload": payload
+        }
+        (status, data) = self.__post_request(post_data)
+        Logger.debug("%s: %s", self.__uri, data)
+        if status == Soup.Status.OK:
+            App().scrobbles.remove([listen[0] for listen in listens])
+            return True
+        elif status == Soup.Status.BAD_REQUEST:
+            if len(listens) == 1:
+                Logger.warning("ListenBrainz: listen rejected: %s", data)
+                App().scrobbles.remove([listens[0][0]])
+                return True
+            for listen in listens:
+                if not self.__import([listen]):
+                    return False
+            return True
+        return False
 
     def __playing_now(self, track):
         """
@@ -147,20 +233,26 @@ class ListenBrainzWebService(GObject.GObject):
                 "listen_type": "playing_now",
                 "payload": payload
             }
-            data = self.__post_request(post_data)
+            (status, data) = self.__post_request(post_data)
             if data is not None:
                 Logger.debug("%s: %s", self.__uri, data)
         except Exception as e:
             Logger.error("ListenBrainzWebService::__playing_now(): %s" % e)
 
     def __post_request(self, data):
+        """
+            Post data to ListenBrainz
+            @param data as {}
+            @return (status as int, data as bytes/None)
+        """
         msg = Soup.Message.new("POST", self.__uri)
         body = GLib.Bytes.new(json.dumps(data).encode("utf-8"))
         msg.set_request_body_from_bytes("application/json", body)
         request_headers = msg.get_property("request-headers")
         request_headers.append("Accept-Charset", "utf-8")
         request_headers.append("Authorization", "Token %s" % self.user_token)
-        return App().task_helper.send_message_sync(msg, self.__cancellable)
+        data = App().task_helper.send_message_sync(msg, self.__cancellable)
+        return (int(msg.get_status()), data)
 
     def __get_payload(self, track):
         """
@@ -191,3 +283,35 @@ class ListenBrainzWebService(GObject.GObject):
             }
         }
         return [payload]
+
+    def __on_queue_submitted(self, submitted):
+        """
+            Submit again later on failure
+            @param submitted as bool
+        """
+        self.__submitting = False
+        if self.__cancellable.is_cancelled():
+            return
+        if submitted:
+            self.__backoff = 0
+        else:
+            self.__backoff = min(max(self.__backoff * 2, self.__MIN_BACKOFF),
+                                 self.__MAX_BACKOFF)
+            self.__backoff_id = GLib.timeout_add_seconds(
+                self.__backoff, self.__on_backoff_timeout)
+
+    def __on_backoff_timeout(self):
+        """
+            Submit queue again
+        """
+        self.__backoff_id = None
+        self.__submit()
+
+    def __on_network_changed(self, monitor, available):
+        """
+            Submit listens queued while offline
+            @param monitor as Gio.NetworkMonitor
+            @param available as bool
+        """
+        if available:
+            self.__submit()
@@ -62,6 +62,20 @@ class TokenWebService:
             self.__loading_token[service] = False
         return self.__tokens[service]
 
+    def has_token(self, service):
+        """
+            True if user has a session for service, network not needed
+            @param service as str
+            @return bool
+            @thread safe
+        """
+        if self.__tokens[service] is None:
+            if self.__passwords_helper.get_token(service) is None:
+                self.__tokens[service] = ""
+                return False
+            return True
+        return self.__tokens[service] != ""
+
     def get_lastfm_auth_token(self, service, cancellable, callback):
         """
             Get a new initial auth token
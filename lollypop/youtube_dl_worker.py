@@ -0,0 +1,102 @@
+# Copyright (c) 2014-2021 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Standalone youtube-dl/yt-dlp resolver, see YouTubeDlHelper
+# Imports extractors once then answers JSON line requests on stdin:
+# {"id": int, "uri": str, "proxy": str/None}
+# with JSON line responses on stdout:
+# {"id": int, "uri": str} => empty uri on failure
+# First line written is {"ready": bool, "error": str}
+# Do not import lollypop or gi here
+
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+WORKERS = 4
+
+
+def get_youtube_dl_class():
+    """
+        Get YoutubeDL class from yt-dlp or youtube-dl
+        @return class
+    """
+    try:
+        from yt_dlp import YoutubeDL
+    except ImportError:
+        from youtube_dl import YoutubeDL
+    return YoutubeDL
+
+
+def resolve(youtube_dl_class, uri, proxy):
+    """
+        Get best audio stream uri
+        @param youtube_dl_class as class
+        @param uri as str
+        @param proxy as str/None
+        @return str
+    """
+    options = {"format": "bestaudio",
+               "quiet": True,
+               "no_warnings": True,
+               "noplaylist": True,
+               "cachedir": False}
+    if proxy is not None:
+        options["proxy"] = proxy
+    with youtube_dl_class(options) as youtube_dl:
+        info = youtube_dl.extract_info(uri, download=False)
+    if info.get("url", None) is not None:
+        return info["url"]
+    for requested_format in info.get("requested_formats", []):
+        if requested_format.get("url", None) is not None:
+            return requested_format["url"]
+    return ""
+
+
+def main():
+    """
+        Answer requests until stdin is closed
+    """
+    lock = Lock()
+
+    def write(message):
+        with lock:
+            sys.stdout.write(json.dumps(message) + "\n")
+            sys.stdout.flush()
+
+    def run(request):
+        try:
+            uri = resolve(youtube_dl_class,
+                          request["uri"],
+                          request.get("proxy", None))
+        except Exception as e:
+            sys.stderr.write("youtube_dl_worker: %s\n" % e)
+            uri = ""
+        write({"id": request["id"], "uri": uri})
+
+    try:
+        youtube_dl_class = get_youtube_dl_class()
+    except Exception as e:
+        write({"ready": False, "error": str(e)})
+        return
+    write({"ready": True, "error": ""})
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        for line in sys.stdin:
+            try:
+                executor.submit(run, json.loads(line))
+            except Exception as e:
+                sys.stderr.write("youtube_dl_worker: %s\n" % e)
+
+
+if __name__ == "__main__":
+    main()